@@ -3,6 +3,7 @@ Django settings for similarity_search project.
 """
 
 from pathlib import Path
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,6 +73,101 @@ VECTOR_DATABASES = {
     'FINANCE': BASE_DIR / 'vector_dbs' / 'finance.db',
     'HR': BASE_DIR / 'vector_dbs' / 'hr.db',
 }
+# An entry may also be partitioned into shard files scanned in parallel, e.g.
+#   'IT': {'path': BASE_DIR / 'vector_dbs' / 'it.db', 'shards': 4, 'partition': 'hash'},
+# where partition is 'hash' (by text) or 'date' (by created_date month).
+
+# Shard scans run on a thread pool of this many workers (default: the CPU count);
+# NumPy and SQLite release the GIL while they scan
+VECTOR_SHARD_WORKERS = None
+
+# Search backend: 'auto', 'sqlite_vec' (exact, SQL), 'fallback' (exact, Python),
+# 'memory' (exact, NumPy over an in-memory index), 'two_stage' (PCA coarse pass
+# plus rerank) or a name from VECTOR_SEARCH_BACKENDS. A VECTOR_DATABASES dict
+# entry may override it with its own 'backend'.
+VECTOR_SEARCH_BACKEND = 'auto'
+# Extra backends: name -> dotted path of a backends.SearchBackend subclass
+VECTOR_SEARCH_BACKENDS = {}
+# 'auto' keeps databases in memory while their matrices fit the budget, beyond
+# that uses two_stage from this many rows when a projection has been trained,
+# and otherwise scans with sqlite-vec (or Python without the extension)
+VECTOR_SEARCH_AUTO_TWO_STAGE_ROWS = 200000
+VECTOR_SEARCH_MEMORY_BUDGET_MB = 1024
+
+# Two-stage search: coarse pass over PCA-reduced vectors, then full-dimension rerank
+VECTOR_SEARCH_PCA_DIM = 64
+VECTOR_SEARCH_RERANK_DEPTH = 200
+
+# In-memory indexes are refreshed in the background: new rows are appended
+# and deleted ones dropped every few seconds
+VECTOR_SEARCH_MEMORY_REFRESH_SECONDS = 5.0
+
+# Number of query embeddings kept in each worker's LRU cache (0 disables)
+VECTOR_SEARCH_EMBEDDING_CACHE_SIZE = 1024
+
+# Largest number of queries accepted by /search/batch/
+BATCH_SEARCH_MAX_QUERIES = 1000
+
+# Largest k accepted by the streaming /search/stream/ endpoint
+SEARCH_STREAM_MAX_LIMIT = 10000
+
+# Time budget for /search/ requests in milliseconds, overridable per request
+# with deadline_ms (None disables). Searches expected to overrun it switch to
+# a cheaper mode and are flagged approximate or partial in the response.
+SEARCH_DEADLINE_MS = 1000
+# Grace period a shard, search node or admission queue still gets when the
+# budget runs out mid-search, so near-finished work is not thrown away
+SEARCH_DEADLINE_FLOOR_MS = 50
+
+# Normalised /search/ queries are counted per worker and appended to this
+# rolling JSONL log (None disables); it rotates to <path>.1 at QUERY_LOG_MAX_BYTES
+QUERY_LOG_PATH = BASE_DIR / 'vector_dbs' / 'query_log.jsonl'
+QUERY_LOG_FLUSH_SECONDS = 10.0
+QUERY_LOG_MAX_BYTES = 16 * 1024 * 1024
+
+# Warm up each WSGI worker before it serves traffic: load the model, read the
+# databases into the page cache and run the top logged queries per source
+SEARCH_WARMUP_ON_START = False
+SEARCH_WARMUP_QUERIES = 50
+
+# Admission control: at most this many threads per worker encode queries or
+# scan databases at once (None disables the limit). Up to ADMISSION_QUEUE_SIZE
+# more wait for ADMISSION_MAX_WAIT_SECONDS; the rest get a 503 with Retry-After.
+ADMISSION_ENCODE_CONCURRENCY = 2
+ADMISSION_SCAN_CONCURRENCY = os.cpu_count() or 4
+ADMISSION_QUEUE_SIZE = 32
+ADMISSION_MAX_WAIT_SECONDS = 2.0
+ADMISSION_RETRY_AFTER_SECONDS = 1
+
+# Threads torch uses per model forward pass (None keeps torch's default of one
+# per core, which oversubscribes the CPU when several requests encode at once)
+EMBEDDING_TORCH_THREADS = None
+
+# Shared embedding service (run `manage.py embedding_service`); None encodes in-process
+EMBEDDING_SERVICE_SOCKET = os.environ.get('EMBEDDING_SERVICE_SOCKET')
+EMBEDDING_SERVICE_TIMEOUT = 2.0
+EMBEDDING_SERVICE_RETRY_SECONDS = 30
+
+# Ingestion queue drained by `manage.py ingest_worker`
+INGEST_QUEUE_DB = BASE_DIR / 'vector_dbs' / 'ingest_queue.db'
+INGEST_BATCH_SIZE = 64
+INGEST_MAX_DOCUMENTS = 1000
+
+# On-demand profiling (staff only, via X-Profile header or ?profile=1)
+PROFILE_RING_SIZE = 50
+PROFILE_TOP_N = 30
+
+# Scatter-gather: sources listed here are searched on remote nodes instead of
+# local files. Each entry is a replica group; every group listing a source
+# returns the top-k of its local files (e.g. one group per shard set) and the
+# coordinator merges them. Nodes must share SEARCH_NODE_TOKEN, e.g.
+#   SEARCH_NODES='[{"sources": ["IT"], "urls": ["http://127.0.0.1:8001", "http://127.0.0.1:8002"]}]'
+SEARCH_NODES = json.loads(os.environ.get('SEARCH_NODES', '[]'))
+# Also the bearer token a Prometheus scraper sends to /metrics
+SEARCH_NODE_TOKEN = os.environ.get('SEARCH_NODE_TOKEN', '')
+SEARCH_NODE_TIMEOUT = 1.0
+# Send the query to the next replica if the first has not answered by then
+SEARCH_NODE_HEDGE_DELAY = 0.1
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -8,4 +8,11 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'similarity_search.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Warm the model, page cache and embedding cache before this worker takes traffic
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'SEARCH_WARMUP_ON_START', False):
+    from similarity_search_app.warmup import warm_up  # noqa: E402
+    warm_up()
@@ -0,0 +1,118 @@
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from .metrics import registry as metrics
+from .timing import NO_DEADLINE, NULL_TIMER
+
+
+# Gate name -> setting holding its concurrency limit (None disables the gate)
+GATE_SETTINGS = {
+    'encode': 'ADMISSION_ENCODE_CONCURRENCY',
+    'scan': 'ADMISSION_SCAN_CONCURRENCY',
+}
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+class Overloaded(Exception):
+    """Raised when a gate's wait queue is full or a caller waited too long for a slot"""
+
+    def __init__(self, gate, reason, retry_after):
+        super().__init__(f'Server busy ({gate}: {reason})')
+        self.gate = gate
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Caps how many threads run one kind of work at once
+
+    Callers beyond the limit wait in a queue of at most queue_size for up to
+    max_wait seconds; anyone who cannot queue or times out gets Overloaded
+    straight away, so overload turns into fast rejections instead of every
+    request slowing down together.
+    """
+
+    def __init__(self, name, limit, queue_size, max_wait, retry_after):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        """Hold one slot for the duration of the block; waiting is timed as the 'queue' stage
+
+        A caller does not wait past its deadline, but always gets at least
+        SEARCH_DEADLINE_FLOOR_MS, so an expired budget degrades the search
+        rather than turning straight into a 503.
+        """
+        if self.limit is None:
+            yield
+            return
+        floor = getattr(settings, 'SEARCH_DEADLINE_FLOOR_MS', 50) / 1000
+        with timer.stage('queue'):
+            self._acquire(max(min(self.max_wait, deadline.timeout(floor)), 0.0))
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, max_wait):
+        started = time.monotonic()
+        with self._condition:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue_size:
+                    self._reject('queue_full')
+                self.waiting += 1
+                self._update_gauges()
+                deadline = started + max_wait
+                try:
+                    while self.active >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject('timeout')
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    self._update_gauges()
+            self.active += 1
+            self._update_gauges()
+        metrics.observe('admission_wait_seconds', time.monotonic() - started, gate=self.name)
+
+    def _release(self):
+        with self._condition:
+            self.active -= 1
+            self._update_gauges()
+            self._condition.notify()
+
+    def _reject(self, reason):
+        metrics.inc('admission_rejected_total', gate=self.name, reason=reason)
+        raise Overloaded(self.name, reason, self.retry_after)
+
+    def _update_gauges(self):
+        metrics.set_gauge('admission_active', self.active, gate=self.name)
+        metrics.set_gauge('admission_queued', self.waiting, gate=self.name)
+
+
+def gate(name):
+    """Process-wide gate for name ('encode' or 'scan'), configured from settings on first use"""
+    instance = _gates.get(name)
+    if instance is None:
+        with _gates_lock:
+            instance = _gates.get(name)
+            if instance is None:
+                instance = _gates[name] = AdmissionGate(
+                    name,
+                    getattr(settings, GATE_SETTINGS[name], None),
+                    queue_size=getattr(settings, 'ADMISSION_QUEUE_SIZE', 32),
+                    max_wait=getattr(settings, 'ADMISSION_MAX_WAIT_SECONDS', 2.0),
+                    retry_after=getattr(settings, 'ADMISSION_RETRY_AFTER_SECONDS', 1),
+                )
+    return instance
@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+from . import corpus
+from .memory_index import file_state
+from .timing import NO_DEADLINE, NULL_TIMER
+
+
+class SearchBackend:
+    """One way of ranking a database file against a query embedding
+
+    Subclasses set `name`, implement search() to return result dicts (as
+    VectorSearchManager._materialize builds them) and override available()
+    when they need something this process may not have. search() may stop
+    early at `deadline` and return SearchResults flagged partial. Extra
+    backends are registered by dotted path in VECTOR_SEARCH_BACKENDS.
+    """
+
+    name = None
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def available(self, db_path):
+        return True
+
+    def search(self, db_path, query_embedding, limit, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        raise NotImplementedError
+
+
+class SqliteVecBackend(SearchBackend):
+    """Exact scan in SQL with the sqlite-vec extension"""
+
+    name = 'sqlite_vec'
+
+    def available(self, db_path):
+        return self.manager.sqlite_vec_available
+
+    def search(self, db_path, query_embedding, limit, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        return self.manager._sqlite_vec_search(db_path, query_embedding, limit, timer=timer)
+
+
+class FallbackBackend(SearchBackend):
+    """Exact scan in pure Python; always available, and stops at the deadline"""
+
+    name = 'fallback'
+
+    def search(self, db_path, query_embedding, limit, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        return self.manager._fallback_similarity_search(
+            db_path, query_embedding, limit, timer=timer, deadline=deadline
+        )
+
+
+class MemoryBackend(SearchBackend):
+    """Exact NumPy scan over the in-memory index"""
+
+    name = 'memory'
+
+    def search(self, db_path, query_embedding, limit, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        return self.manager._memory_search(db_path, query_embedding, limit, timer=timer)
+
+
+class TwoStageBackend(SearchBackend):
+    """PCA-reduced coarse pass with full-vector rerank (approximate)"""
+
+    name = 'two_stage'
+
+    def available(self, db_path):
+        return database_profile(db_path)['has_projection']
+
+    def search(self, db_path, query_embedding, limit, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        return self.manager.two_stage_search(db_path, query_embedding, limit, timer=timer)
+
+
+BUILTIN_BACKENDS = {
+    backend.name: backend for backend in (SqliteVecBackend, FallbackBackend, MemoryBackend, TwoStageBackend)
+}
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def backend_classes():
+    """Built-in backends plus those registered in VECTOR_SEARCH_BACKENDS"""
+    classes = dict(BUILTIN_BACKENDS)
+    for name, path in getattr(settings, 'VECTOR_SEARCH_BACKENDS', {}).items():
+        classes[name] = import_string(path)
+    return classes
+
+
+def database_profile(db_path):
+    """Approximate row count and whether a PCA projection exists, cached until the file changes
+
+    The row count is MAX(id) of embedding_tbl, an upper bound that costs one
+    index lookup instead of a full count.
+    """
+    state = file_state(db_path)
+    with _profiles_lock:
+        cached = _profiles.get(db_path)
+        if cached and cached[0] == state:
+            return cached[1]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT COALESCE(MAX(id), 0) FROM embedding_tbl").fetchone()[0]
+        has_projection = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pca_tbl'"
+        ).fetchone() is not None and conn.execute("SELECT 1 FROM pca_tbl").fetchone() is not None
+    finally:
+        conn.close()
+
+    profile = {'rows': rows, 'has_projection': has_projection}
+    with _profiles_lock:
+        _profiles[db_path] = (state, profile)
+    return profile
+
+
+def choose_backend(manager, db_path):
+    """Backend the 'auto' policy picks for db_path
+
+    A database is kept in memory, exact and fastest, while every loaded
+    matrix still fits VECTOR_SEARCH_MEMORY_BUDGET_MB. Beyond that, large
+    databases with a trained projection use two_stage, and the rest are
+    scanned by sqlite-vec or, without the extension, in Python.
+    """
+    profile = database_profile(db_path)
+    budget = getattr(settings, 'VECTOR_SEARCH_MEMORY_BUDGET_MB', 1024) * 1024 * 1024
+    needed = profile['rows'] * corpus.EMBEDDING_DIM * 4
+    if needed + manager.memory_indexes.total_bytes(exclude=db_path) <= budget:
+        return 'memory'
+
+    if profile['has_projection'] and profile['rows'] >= getattr(settings, 'VECTOR_SEARCH_AUTO_TWO_STAGE_ROWS', 200000):
+        return 'two_stage'
+
+    return 'sqlite_vec' if manager.sqlite_vec_available else 'fallback'
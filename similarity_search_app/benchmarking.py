@@ -0,0 +1,13 @@
+import subprocess
+from django.conf import settings
+
+
+def git_commit():
+    """Short hash of the checked-out commit, recorded in benchmark reports; None outside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
@@ -0,0 +1,83 @@
+import hashlib
+import json
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from . import coordinator, generations
+
+
+# Bump when the response format changes so clients drop old validators
+RESPONSE_VERSION = '1'
+
+# Endpoints whose results may come from a loaded MemoryIndex
+MEMORY_ENDPOINTS = ('search', 'similar')
+
+
+def search_etag(endpoint, source_type, params):
+    """Deterministic strong ETag for a request against source_type's current data
+
+    Returns None for sources served by remote nodes, whose data this process
+    cannot see change.
+    """
+    if coordinator.is_remote(source_type):
+        return None
+    key = json.dumps({
+        'version': RESPONSE_VERSION,
+        'endpoint': endpoint,
+        'source_type': source_type,
+        'params': params,
+        'data': generations.data_token(source_type, _loaded_version(endpoint)),
+        # Settings that change which results are returned
+        'backend': generations.source_config(source_type)['backend'],
+        'rerank_depth': getattr(settings, 'VECTOR_SEARCH_RERANK_DEPTH', None),
+    }, sort_keys=True, default=str)
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def _loaded_version(endpoint):
+    """Version lookup for endpoints that rank from in-memory indexes, else None
+
+    Those indexes catch up with their files in the background, so their
+    results change when the index does rather than at the commit; using the
+    index's version keeps an ETag from describing rows its body lacks.
+    """
+    if endpoint not in MEMORY_ENDPOINTS:
+        return None
+    from .vector_utils import get_search_manager
+    return get_search_manager().memory_indexes.version
+
+
+def still_current(etag, endpoint, source_type, params):
+    """etag if the data it names did not change while the response was built, else None
+
+    A body built across a commit or an index refresh may hold either state,
+    so it is sent without a validator rather than one that could pin it.
+    """
+    if etag is None or etag != search_etag(endpoint, source_type, params):
+        return None
+    return etag
+
+
+def etag_matches(request, etag):
+    """True if the request's If-None-Match header covers etag"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header or etag is None:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def set_validators(response, etag):
+    if response.status_code == 200 and etag is not None:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,193 @@
+import heapq
+import json
+import logging
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from .metrics import registry as metrics
+from .results import SearchResults
+from .timing import NO_DEADLINE
+
+
+logger = logging.getLogger(__name__)
+
+# Endpoints a search node exposes to coordinators (see views.node_search and views.node_source)
+NODE_SEARCH_PATH = '/node/search/'
+NODE_SOURCE_PATH = '/node/source/'
+
+# Group requests wait on node requests, so they run on separate pools
+_group_executor = None
+_request_executor = None
+
+
+class NodeError(Exception):
+    """Raised when no replica of a node group answered in time"""
+
+
+def node_groups(source_type):
+    """Replica groups from SEARCH_NODES that serve source_type"""
+    return [group for group in getattr(settings, 'SEARCH_NODES', []) if source_type in group['sources']]
+
+
+def is_remote(source_type):
+    return bool(node_groups(source_type))
+
+
+def group_name(group):
+    return group.get('name') or ','.join(group['urls'])
+
+
+def _get_executors():
+    global _group_executor, _request_executor
+    if _group_executor is None:
+        _group_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='scatter')
+        _request_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='node-request')
+    return _group_executor, _request_executor
+
+
+def _post(url, payload, timeout, path=NODE_SEARCH_PATH):
+    """POST a request to one node's endpoint; returns its response body"""
+    request = urllib.request.Request(
+        url.rstrip('/') + path,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {getattr(settings, "SEARCH_NODE_TOKEN", "")}',
+        },
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def query_group(urls, payload, deadline, hedge_delay, path=NODE_SEARCH_PATH):
+    """First response body from a replica group
+
+    Replicas are tried in order: the next one is sent the same request as soon
+    as the previous fails (a retry) or has not answered within hedge_delay (a
+    hedge). Whichever answers first wins; slower requests are abandoned.
+    """
+    _, executor = _get_executors()
+    replicas = list(urls)
+    pending = {}
+    errors = []
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if replicas and not pending and not errors:
+                errors.append('deadline passed before any replica was asked')
+            break
+        if replicas:
+            if pending:
+                metrics.inc('search_node_retries_total', reason='hedge')
+            elif errors:
+                metrics.inc('search_node_retries_total', reason='error')
+            url = replicas.pop(0)
+            pending[executor.submit(_post, url, payload, remaining, path)] = url
+        if not pending:
+            break
+
+        done, _ = wait(pending, timeout=min(hedge_delay, remaining) if replicas else remaining,
+                       return_when=FIRST_COMPLETED)
+        for future in done:
+            url = pending.pop(future)
+            try:
+                body = future.result()
+            except Exception as e:
+                metrics.inc('search_node_requests_total', node=url, outcome='error')
+                errors.append(f'{url}: {e}')
+                continue
+            metrics.inc('search_node_requests_total', node=url, outcome='ok')
+            return body
+
+    for url in pending.values():
+        metrics.inc('search_node_requests_total', node=url, outcome='timeout')
+        errors.append(f'{url}: timed out')
+    raise NodeError('; '.join(errors) or 'no replicas configured')
+
+
+def scatter_search(source_type, query_embedding, limit, deadline=NO_DEADLINE):
+    """Search source_type on every node group serving it and merge their top-k
+
+    Groups that do not answer within SEARCH_NODE_TIMEOUT (or by the caller's
+    deadline, if sooner, but never in less than SEARCH_DEADLINE_FLOOR_MS)
+    are left out and the results are flagged partial; if none answers the
+    results are empty and partial. Nodes are sent the remaining budget so
+    they can degrade on their side.
+    """
+    groups = node_groups(source_type)
+    budget = deadline.timeout(getattr(settings, 'SEARCH_DEADLINE_FLOOR_MS', 50) / 1000)
+    expires_at = time.monotonic() + min(getattr(settings, 'SEARCH_NODE_TIMEOUT', 1.0), budget)
+    hedge_delay = getattr(settings, 'SEARCH_NODE_HEDGE_DELAY', 0.1)
+    payload = {
+        'source_type': source_type,
+        'embedding': [float(value) for value in query_embedding],
+        'limit': limit,
+    }
+    if budget != float('inf'):
+        payload['deadline_ms'] = int(budget * 1000)
+
+    executor, _ = _get_executors()
+    futures = [
+        (group, executor.submit(query_group, group['urls'], payload, expires_at, hedge_delay))
+        for group in groups
+    ]
+
+    answered = []
+    served_by = set()
+    failed = []
+    approximate = False
+    for group, future in futures:
+        try:
+            body = future.result()
+            answered.append(body['results'])
+            served_by.add(body.get('backend') or 'unknown')
+            approximate = approximate or body.get('approximate', False)
+            if body.get('partial'):
+                failed.extend(f'{group_name(group)}:{name}' for name in body.get('failed', []))
+        except NodeError as e:
+            logger.warning('Node group %s failed for %s: %s', group_name(group), source_type, e)
+            failed.append(group_name(group))
+
+    if not answered:
+        logger.warning('No search node answered for %s', source_type)
+    if failed:
+        metrics.inc('search_partial_total', source_type=source_type)
+
+    merged = heapq.nsmallest(limit, (result for results in answered for result in results),
+                             key=lambda result: result['distance'])
+    return SearchResults(merged, backend='remote:' + (','.join(sorted(served_by)) or 'none'),
+                         partial=bool(failed), failed=failed, approximate=approximate)
+
+
+def fetch_source(source_type, source_id, with_embedding=False):
+    """Stored document (and optionally its embedding) from whichever node group holds it
+
+    Returns the node's {'source_detail', 'embedding'} body, or None when every
+    group answered without the document. Raises NodeError when it was not
+    found but some group did not answer, since that group may hold it.
+    """
+    groups = node_groups(source_type)
+    expires_at = time.monotonic() + getattr(settings, 'SEARCH_NODE_TIMEOUT', 1.0)
+    hedge_delay = getattr(settings, 'SEARCH_NODE_HEDGE_DELAY', 0.1)
+    payload = {'source_type': source_type, 'source_id': source_id, 'embedding': with_embedding}
+
+    executor, _ = _get_executors()
+    futures = [
+        (group, executor.submit(query_group, group['urls'], payload, expires_at, hedge_delay, NODE_SOURCE_PATH))
+        for group in groups
+    ]
+
+    errors = []
+    for group, future in futures:
+        try:
+            body = future.result()
+        except NodeError as e:
+            errors.append(f'{group_name(group)}: {e}')
+            continue
+        if body.get('source_detail') is not None:
+            return body
+    if errors:
+        raise NodeError('; '.join(errors))
+    return None
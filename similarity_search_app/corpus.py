@@ -0,0 +1,383 @@
+import json
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+import numpy as np
+from . import reduction
+
+
+EMBEDDING_DIM = 384
+
+DOCUMENT_COLUMNS = ('source_text', 'category', 'created_date', 'author', 'department', 'priority', 'status')
+
+# Vocabulary of the sample data built by setup_vector_dbs
+SAMPLE_TEXTS = {
+    'ADMIN': [
+        "Company policy update regarding remote work procedures",
+        "New employee onboarding checklist and requirements",
+        "Office security protocols and access card management",
+        "Meeting room booking system guidelines",
+        "Corporate communication standards and email etiquette",
+        "Expense reporting procedures and approval workflow",
+        "Document management system usage instructions",
+        "Visitor management and registration process",
+        "Emergency evacuation procedures and safety protocols",
+        "Equipment procurement and asset management guidelines"
+    ],
+    'IT': [
+        "Network security best practices and password policies",
+        "Software installation and license management procedures",
+        "Database backup and recovery protocols",
+        "System monitoring and performance optimization",
+        "Cybersecurity incident response procedures",
+        "Cloud infrastructure management guidelines",
+        "API documentation and integration standards",
+        "Code review and deployment procedures",
+        "Server maintenance and update schedules",
+        "Help desk ticketing system workflow"
+    ],
+    'FINANCE': [
+        "Budget planning and allocation procedures",
+        "Invoice processing and payment authorization",
+        "Financial reporting and compliance requirements",
+        "Audit preparation and documentation standards",
+        "Cost center management and tracking",
+        "Revenue recognition and accounting principles",
+        "Tax filing and regulatory compliance procedures",
+        "Cash flow management and forecasting",
+        "Vendor payment terms and contract management",
+        "Financial risk assessment and mitigation strategies"
+    ],
+    'HR': [
+        "Employee performance review and evaluation process",
+        "Recruitment and hiring procedures",
+        "Benefits enrollment and administration",
+        "Training and development program guidelines",
+        "Disciplinary action and grievance procedures",
+        "Leave management and time-off policies",
+        "Compensation and salary review process",
+        "Employee engagement and satisfaction surveys",
+        "Workplace diversity and inclusion initiatives",
+        "Exit interview and offboarding procedures"
+    ]
+}
+
+CATEGORIES = {
+    'ADMIN': ['Policy', 'Procedure', 'Guidelines', 'Standards'],
+    'IT': ['Security', 'Development', 'Infrastructure', 'Support'],
+    'FINANCE': ['Accounting', 'Compliance', 'Planning', 'Reporting'],
+    'HR': ['Recruitment', 'Performance', 'Benefits', 'Training']
+}
+
+AUTHORS = [
+    'John Smith', 'Sarah Johnson', 'Michael Brown', 'Emily Davis',
+    'David Wilson', 'Lisa Anderson', 'Robert Taylor', 'Jennifer Martinez'
+]
+
+PRIORITIES = ['High', 'Medium', 'Low']
+STATUSES = ['Active', 'Draft', 'Under Review', 'Archived']
+
+# Skew of generated metadata, in the order of PRIORITIES and STATUSES
+PRIORITY_WEIGHTS = [0.2, 0.5, 0.3]
+STATUS_WEIGHTS = [0.6, 0.15, 0.1, 0.15]
+TEXT_PREFIXES = ['Updated', 'Revised', 'Enhanced', 'Streamlined', 'Comprehensive guide for',
+                 'Best practices for', 'Step-by-step instructions for', 'Troubleshooting guide for']
+
+# Newest created_date of generated rows; fixed so a seed always gives the same corpus
+SYNTHETIC_END_DATE = date(2025, 1, 1)
+
+
+def create_schema(conn):
+    """Create source_tbl, embedding_tbl and embedding_tombstone_tbl; shared by every writer"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS source_tbl (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_text TEXT NOT NULL,
+            category TEXT,
+            created_date TEXT,
+            author TEXT,
+            department TEXT,
+            priority TEXT,
+            status TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_tbl (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_id INTEGER,
+            embedding_vect TEXT,
+            metadata TEXT,
+            FOREIGN KEY (source_id) REFERENCES source_tbl (id)
+        )
+    ''')
+    # Embedding rows removed since they were written, so in-memory indexes
+    # can drop them without a full reload (see memory_index.MemoryIndex)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_tombstone_tbl (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            embedding_id INTEGER NOT NULL,
+            source_id INTEGER,
+            deleted_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def delete_embeddings(cursor, where, params=()):
+    """Delete embedding_tbl rows matching `where`, leaving a tombstone for each"""
+    cursor.execute(f'''
+        INSERT INTO embedding_tombstone_tbl (embedding_id, source_id, deleted_at)
+        SELECT id, source_id, ? FROM embedding_tbl WHERE {where}
+    ''', (time.time(),) + tuple(params))
+    cursor.execute(f"DELETE FROM embedding_tbl WHERE {where}", tuple(params))
+    return cursor.rowcount
+
+
+def bulk_load_pragmas(conn):
+    """Trade durability for speed while writing a throwaway or rebuildable database"""
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")
+
+
+def build_resampled_corpus(source_path, target_path, size, seed=0, noise=0.02, batch_size=10000):
+    """Write a corpus of `size` rows resampled from an existing vector database
+
+    Rows are drawn with replacement and their embeddings jittered so that the
+    copies are distinct points. Falls back to random unit vectors when the
+    source database does not exist or is empty.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+
+    if source_path and os.path.exists(source_path):
+        source = sqlite3.connect(source_path)
+        try:
+            rows = source.execute("""
+                SELECT s.source_text, s.category, s.created_date, s.author,
+                       s.department, s.priority, s.status, e.metadata, e.embedding_vect
+                FROM source_tbl s
+                JOIN embedding_tbl e ON s.id = e.source_id
+            """).fetchall()
+        finally:
+            source.close()
+        if rows:
+            matrix = np.vstack([reduction.decode_vector(row[8]) for row in rows])
+
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+    conn = sqlite3.connect(target_path)
+    try:
+        bulk_load_pragmas(conn)
+        create_schema(conn)
+
+        for offset in range(0, size, batch_size):
+            count = min(batch_size, size - offset)
+            if rows:
+                picks = rng.integers(0, len(rows), size=count)
+                vectors = matrix[picks] + rng.normal(0, noise, size=(count, matrix.shape[1]))
+                templates = [rows[i] for i in picks]
+            else:
+                vectors = rng.normal(size=(count, EMBEDDING_DIM))
+                templates = [None] * count
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            first_id = offset + 1
+            source_records = []
+            embedding_records = []
+            for i, (template, vector) in enumerate(zip(templates, vectors)):
+                source_id = first_id + i
+                if template is None:
+                    template = (f'Synthetic document {source_id}', None, None, None, None, None, None, None)
+                source_records.append((source_id,) + tuple(template[:7]))
+                embedding_records.append((
+                    source_id,
+                    json.dumps([round(float(x), 6) for x in vector]),
+                    template[7]
+                ))
+
+            conn.executemany('''
+                INSERT INTO source_tbl (id, source_text, category, created_date, author, department, priority, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', source_records)
+            conn.executemany('''
+                INSERT INTO embedding_tbl (source_id, embedding_vect, metadata)
+                VALUES (?, ?, ?)
+            ''', embedding_records)
+            conn.commit()
+    finally:
+        conn.close()
+
+    return target_path
+
+
+def _zipf_weights(count, skew):
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def build_synthetic_corpus(target_path, size, source_type='IT', seed=0, clusters=256, spread=0.5, skew=1.0,
+                           real_source_path=None, real_fraction=0.0, days=1095, batch_size=10000):
+    """Write a corpus of `size` synthetic rows without running the model
+
+    Embeddings are unit vectors scattered around `clusters` random centres
+    (noise norm about `spread` times the centre's) with cluster sizes
+    following a Zipf law of exponent `skew`. With real_source_path,
+    `real_fraction` of the centres are stored embeddings instead, so the
+    corpus keeps some of the real geometry. Each cluster has a topic, a
+    dominant category and a dominant author; newer dates are more common.
+    The same seed always produces the same file.
+    """
+    rng = np.random.default_rng(seed)
+
+    centres = rng.normal(size=(clusters, EMBEDDING_DIM))
+    if real_source_path and real_fraction > 0 and os.path.exists(real_source_path):
+        source = sqlite3.connect(real_source_path)
+        try:
+            _, real = reduction.load_full_matrix(source)
+        finally:
+            source.close()
+        count = min(len(real), int(round(clusters * real_fraction)))
+        if count:
+            centres[:count] = real[rng.choice(len(real), count, replace=False)]
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+
+    # Per-cluster traits: tightness, topic, dominant category and author
+    sigmas = spread * rng.uniform(0.5, 1.5, size=clusters) / np.sqrt(EMBEDDING_DIM)
+    topics = SAMPLE_TEXTS.get(source_type) or [text for texts in SAMPLE_TEXTS.values() for text in texts]
+    categories = CATEGORIES.get(source_type) or sorted({c for values in CATEGORIES.values() for c in values})
+    cluster_topic = rng.integers(0, len(topics), size=clusters)
+    cluster_category = rng.integers(0, len(categories), size=clusters)
+    cluster_author = rng.choice(len(AUTHORS), size=clusters, p=_zipf_weights(len(AUTHORS), skew))
+    cluster_weights = _zipf_weights(clusters, skew)
+    date_strings = [(SYNTHETIC_END_DATE - timedelta(days=age)).isoformat() for age in range(days + 1)]
+
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+    conn = sqlite3.connect(target_path)
+    try:
+        bulk_load_pragmas(conn)
+        create_schema(conn)
+
+        for offset in range(0, size, batch_size):
+            count = min(batch_size, size - offset)
+            members = rng.choice(clusters, size=count, p=cluster_weights)
+            vectors = centres[members] + rng.normal(size=(count, EMBEDDING_DIM)) * sigmas[members, None]
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            # Most rows take their cluster's category and author
+            category = np.where(rng.random(count) < 0.8, cluster_category[members],
+                                rng.integers(0, len(categories), size=count))
+            author = np.where(rng.random(count) < 0.5, cluster_author[members],
+                              rng.integers(0, len(AUTHORS), size=count))
+            priority = rng.choice(len(PRIORITIES), size=count, p=PRIORITY_WEIGHTS)
+            status = rng.choice(len(STATUSES), size=count, p=STATUS_WEIGHTS)
+            prefix = rng.integers(0, len(TEXT_PREFIXES), size=count)
+            # Ages skew young: the density of created_date rises towards the end date
+            ages = (days * (1 - np.sqrt(rng.random(count)))).astype(np.int64)
+
+            source_records = []
+            embedding_records = []
+            for i, vector in enumerate(np.round(vectors, 6).tolist()):
+                source_id = offset + i + 1
+                topic = topics[cluster_topic[members[i]]]
+                category_name = categories[category[i]]
+                priority_name = PRIORITIES[priority[i]]
+                source_records.append((
+                    source_id,
+                    f'{TEXT_PREFIXES[prefix[i]]} {topic.lower()} #{source_id}',
+                    category_name,
+                    date_strings[ages[i]],
+                    AUTHORS[author[i]],
+                    source_type,
+                    priority_name,
+                    STATUSES[status[i]],
+                ))
+                embedding_records.append((
+                    source_id,
+                    json.dumps(vector),
+                    json.dumps({'category': category_name, 'department': source_type, 'priority': priority_name})
+                ))
+
+            conn.executemany('''
+                INSERT INTO source_tbl (id, source_text, category, created_date, author, department, priority, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', source_records)
+            conn.executemany('''
+                INSERT INTO embedding_tbl (source_id, embedding_vect, metadata)
+                VALUES (?, ?, ?)
+            ''', embedding_records)
+            conn.commit()
+    finally:
+        conn.close()
+
+    return target_path
+
+
+def upsert_documents(conn, documents, embeddings, id_allocator=None):
+    """Insert or update documents with their embeddings in one transaction
+
+    A document carrying an `id` that already exists replaces that row and its
+    embedding; anything else is inserted, with its id taken from
+    id_allocator(cursor) when given. Returns the source ids in order.
+    Reduced vectors are kept in step when the database has a PCA projection.
+    """
+    create_schema(conn)
+    projection = reduction.Projection.load(conn)
+    cursor = conn.cursor()
+    source_ids = []
+
+    try:
+        for document, embedding in zip(documents, embeddings):
+            metadata = json.dumps({
+                'category': document.get('category'),
+                'department': document.get('department'),
+                'priority': document.get('priority')
+            })
+            values = tuple(document.get(field) for field in DOCUMENT_COLUMNS)
+
+            source_id = document.get('id')
+            exists = source_id is not None and cursor.execute(
+                "SELECT 1 FROM source_tbl WHERE id = ?", (source_id,)
+            ).fetchone()
+
+            if exists:
+                cursor.execute('''
+                    UPDATE source_tbl
+                    SET source_text = ?, category = ?, created_date = ?, author = ?,
+                        department = ?, priority = ?, status = ?
+                    WHERE id = ?
+                ''', values + (source_id,))
+                delete_embeddings(cursor, "source_id = ?", (source_id,))
+            else:
+                if source_id is None and id_allocator is not None:
+                    source_id = id_allocator(cursor)
+                cursor.execute('''
+                    INSERT INTO source_tbl (id, source_text, category, created_date, author, department, priority, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (source_id,) + values)
+                source_id = cursor.lastrowid
+
+            cursor.execute(
+                "INSERT INTO embedding_tbl (source_id, embedding_vect, metadata) VALUES (?, ?, ?)",
+                (source_id, json.dumps(list(embedding)), metadata)
+            )
+            if projection is not None:
+                cursor.execute(
+                    "INSERT OR REPLACE INTO reduced_embedding_tbl (source_id, reduced_vect) VALUES (?, ?)",
+                    (source_id, reduction.encode_vector(projection.transform(embedding)))
+                )
+            source_ids.append(source_id)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return source_ids
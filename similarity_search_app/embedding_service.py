@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Frames are a 4-byte big-endian length followed by the payload
+_LENGTH = struct.Struct('>I')
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class EmbeddingServiceError(Exception):
+    """Raised by the client when the embedding service cannot answer"""
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EmbeddingServiceError('Connection closed mid-frame')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_frame(sock, payload):
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def recv_frame(sock):
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    if size > MAX_FRAME_BYTES:
+        raise EmbeddingServiceError(f'Frame of {size} bytes exceeds limit')
+    return _recv_exact(sock, size)
+
+
+class EmbeddingClient:
+    """Thin client for the local embedding service
+
+    A request is a JSON frame {"texts": [...]}; the reply is a JSON header
+    frame {"shape": [n, dim]} (or {"error": ...}) followed by a frame of
+    little-endian float32 values.
+    """
+
+    def __init__(self, socket_path, timeout=2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def encode(self, texts):
+        """Encode a list of texts, returning a float32 array of shape (len(texts), dim)"""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(str(self.socket_path))
+                send_frame(sock, json.dumps({'texts': list(texts)}).encode('utf-8'))
+                header = json.loads(recv_frame(sock))
+                if 'error' in header:
+                    raise EmbeddingServiceError(header['error'])
+                payload = recv_frame(sock)
+        except (OSError, ValueError) as ex:
+            raise EmbeddingServiceError(str(ex)) from ex
+
+        return np.frombuffer(payload, dtype='<f4').reshape(header['shape'])
+
+    def ping(self):
+        try:
+            self.encode([])
+            return True
+        except EmbeddingServiceError:
+            return False
+
+
+class _EncodeHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        try:
+            request = json.loads(recv_frame(self.request))
+            texts = request.get('texts') or []
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError('texts must be a list of strings')
+            if len(texts) > server.max_batch:
+                raise ValueError(f'batch of {len(texts)} exceeds limit of {server.max_batch}')
+
+            if texts:
+                # One encode at a time: torch already parallelises inside a call
+                with server.encode_lock:
+                    embeddings = server.model.encode(texts, batch_size=server.batch_size)
+                embeddings = np.asarray(embeddings, dtype='<f4')
+            else:
+                embeddings = np.empty((0, server.dim), dtype='<f4')
+
+            send_frame(self.request, json.dumps({'shape': list(embeddings.shape)}).encode('utf-8'))
+            send_frame(self.request, embeddings.tobytes())
+        except Exception as ex:
+            logger.warning('Embedding request failed: %s', ex)
+            try:
+                send_frame(self.request, json.dumps({'error': str(ex)}).encode('utf-8'))
+            except OSError:
+                pass
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, model, batch_size=64, max_batch=4096):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(str(socket_path), _EncodeHandler)
+        os.chmod(socket_path, 0o660)
+        self.model = model
+        self.batch_size = batch_size
+        self.max_batch = max_batch
+        self.encode_lock = threading.Lock()
+        self.dim = model.get_sentence_embedding_dimension()
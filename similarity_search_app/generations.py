@@ -0,0 +1,205 @@
+import glob
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from . import reduction
+
+
+# Each source type's configured path (and each shard's path) may be accompanied
+# by a pointer file naming the active generation,
+# e.g. vector_dbs/admin.db.current -> admin.gen-20240101T120000000000-123.db.
+# Rebuilds write a fresh generation beside the live one and swap the pointer
+# with os.replace, so readers pick up the new file at their next connect.
+POINTER_SUFFIX = '.current'
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class GenerationError(Exception):
+    """Raised when a newly built generation fails validation"""
+
+
+def source_config(source_type):
+    """Normalised VECTOR_DATABASES entry: {'path', 'shards', 'partition', 'backend'}
+
+    An entry is either a plain path or a dict such as
+    {'path': BASE_DIR / 'vector_dbs' / 'it.db', 'shards': 4, 'partition': 'hash', 'backend': 'auto'}.
+    """
+    entry = settings.VECTOR_DATABASES[source_type]
+    backend = getattr(settings, 'VECTOR_SEARCH_BACKEND', 'auto')
+    if isinstance(entry, dict):
+        return {
+            'path': str(entry['path']),
+            'shards': int(entry.get('shards', 1)),
+            'partition': entry.get('partition', 'hash'),
+            'backend': entry.get('backend', backend),
+        }
+    return {'path': str(entry), 'shards': 1, 'partition': 'hash', 'backend': backend}
+
+
+def configured_path(source_type, shard=None):
+    """Configured path of a source's database, or of one of its shards"""
+    path = source_config(source_type)['path']
+    if shard is None:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.shard-{shard}{ext or ".db"}'
+
+
+def pointer_path(source_type, shard=None):
+    return configured_path(source_type, shard) + POINTER_SUFFIX
+
+
+def current_path(source_type, shard=None):
+    """Path of the active database file for source_type (or one of its shards)
+
+    Falls back to the configured path when no generation has been activated.
+    The pointer is re-read only when its mtime changes.
+    """
+    pointer = pointer_path(source_type, shard)
+    try:
+        stat = os.stat(pointer)
+    except FileNotFoundError:
+        return configured_path(source_type, shard)
+
+    key = (stat.st_mtime_ns, stat.st_ino)
+    with _cache_lock:
+        cached = _cache.get((source_type, shard))
+        if cached and cached[0] == key:
+            return cached[1]
+
+    with open(pointer) as handle:
+        name = handle.read().strip()
+    path = os.path.join(os.path.dirname(pointer), name) if name else configured_path(source_type, shard)
+
+    with _cache_lock:
+        _cache[(source_type, shard)] = (key, path)
+    return path
+
+
+def new_generation_path(source_type, shard=None):
+    """Unused path for the next generation, next to the configured database"""
+    base = configured_path(source_type, shard)
+    stem, ext = os.path.splitext(base)
+    now = time.time()
+    # Microseconds keep back-to-back builds apart and names in build order
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f'{int(now * 1e6) % 1000000:06d}'
+    return f'{stem}.gen-{stamp}-{os.getpid()}{ext or ".db"}'
+
+
+def sidecar_path(db_path, suffix):
+    """Path of a file that belongs to a generation (swapped and pruned with it)"""
+    return f'{db_path}.{suffix}'
+
+
+def connect_readonly(db_path):
+    """Read-only connection to an existing database
+
+    Unlike sqlite3.connect, a missing file raises sqlite3.OperationalError
+    instead of being created empty.
+    """
+    return sqlite3.connect(pathlib.Path(os.path.abspath(db_path)).as_uri() + '?mode=ro', uri=True)
+
+
+def validate_generation(db_path, expected_dim=None):
+    """Check a freshly built database before it is activated; returns row count"""
+    conn = sqlite3.connect(db_path)
+    try:
+        status = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if status != 'ok':
+            raise GenerationError(f'quick_check failed: {status}')
+
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = {'source_tbl', 'embedding_tbl'} - tables
+        if missing:
+            raise GenerationError(f'missing tables: {", ".join(sorted(missing))}')
+
+        source_count = conn.execute("SELECT COUNT(*) FROM source_tbl").fetchone()[0]
+        embedding_count = conn.execute("SELECT COUNT(*) FROM embedding_tbl").fetchone()[0]
+        if source_count == 0:
+            raise GenerationError('source_tbl is empty')
+        if embedding_count != source_count:
+            raise GenerationError(f'{source_count} source rows but {embedding_count} embeddings')
+
+        sample = conn.execute("SELECT embedding_vect FROM embedding_tbl LIMIT 1").fetchone()
+        vector = reduction.decode_vector(sample[0])
+        if expected_dim and len(vector) != expected_dim:
+            raise GenerationError(f'embedding dimension {len(vector)}, expected {expected_dim}')
+    finally:
+        conn.close()
+
+    return source_count
+
+
+def activate_generation(source_type, db_path, shard=None):
+    """Atomically point source_type (or one of its shards) at db_path"""
+    pointer = pointer_path(source_type, shard)
+    temp = f'{pointer}.tmp-{os.getpid()}'
+    with open(temp, 'w') as handle:
+        handle.write(os.path.basename(db_path))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp, pointer)
+
+    with _cache_lock:
+        _cache.pop((source_type, shard), None)
+
+
+def list_generations(source_type, shard=None):
+    stem, ext = os.path.splitext(configured_path(source_type, shard))
+    return sorted(glob.glob(f'{stem}.gen-*{ext or ".db"}'))
+
+
+def remove_generation(db_path):
+    """Delete a generation file that never went live, with its sidecars"""
+    for related in glob.glob(glob.escape(db_path) + '*'):
+        os.remove(related)
+
+
+def prune_generations(source_type, keep=2, shard=None):
+    """Delete old generation files (and their sidecars), keeping the active one and `keep` newest"""
+    active = os.path.abspath(current_path(source_type, shard))
+    generations = list_generations(source_type, shard)
+    retained = set(generations[-keep:]) if keep > 0 else set()
+
+    removed = []
+    for path in generations:
+        if os.path.abspath(path) == active or path in retained:
+            continue
+        # Readers that already opened the file keep their handle until they close it
+        remove_generation(path)
+        removed.append(path)
+    return removed
+
+
+def data_token(source_type, loaded_version=None):
+    """Cheap token that changes whenever the active database's contents may have changed
+
+    Built from each active file's identity plus the size and mtime of the
+    database and its WAL, so any commit (or a generation swap) produces a
+    new token without opening the database. Covers every shard. When
+    loaded_version(path) names the copy of a file that results are actually
+    served from (an in-memory index), that stands in for the file's stat.
+    """
+    config = source_config(source_type)
+    shards = [None] if config['shards'] <= 1 else range(config['shards'])
+    parts = []
+    for shard in shards:
+        path = current_path(source_type, shard)
+        parts.append(os.path.basename(path))
+        version = loaded_version(path) if loaded_version else None
+        if version is not None:
+            parts.append(version)
+            continue
+        for candidate in (path, path + '-wal'):
+            try:
+                stat = os.stat(candidate)
+            except FileNotFoundError:
+                parts.append('-')
+                continue
+            parts.append(f'{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}')
+    return '|'.join(parts)
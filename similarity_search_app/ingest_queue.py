@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from .corpus import DOCUMENT_COLUMNS
+
+
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+
+def queue_path():
+    return str(getattr(settings, 'INGEST_QUEUE_DB', settings.BASE_DIR / 'vector_dbs' / 'ingest_queue.db'))
+
+
+def connect():
+    """Open the job queue in autocommit mode, creating it on first use"""
+    path = queue_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_job (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            source_id INTEGER,
+            claimed_by TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS ingest_job_status_idx ON ingest_job (status, id)")
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit connection"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def validate_document(document):
+    """Return an error message for a malformed document, or None"""
+    if not isinstance(document, dict):
+        return 'document must be an object'
+    text = document.get('source_text')
+    if not isinstance(text, str) or not text.strip():
+        return 'source_text is required'
+    if 'id' in document and not isinstance(document['id'], int):
+        return 'id must be an integer'
+    return None
+
+
+def enqueue(source_type, documents):
+    """Queue documents for indexing; returns their job ids"""
+    now = time.time()
+    conn = connect()
+    try:
+        job_ids = []
+        with transaction(conn):
+            for document in documents:
+                payload = {field: document.get(field) for field in DOCUMENT_COLUMNS}
+                if 'id' in document:
+                    payload['id'] = document['id']
+                cursor = conn.execute(
+                    "INSERT INTO ingest_job (source_type, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (source_type, json.dumps(payload), now, now)
+                )
+                job_ids.append(cursor.lastrowid)
+        return job_ids
+    finally:
+        conn.close()
+
+
+def claim_batch(conn, limit, worker_id):
+    """Atomically move up to `limit` pending jobs to running; returns (id, source_type, payload) rows"""
+    now = time.time()
+    with transaction(conn):
+        rows = conn.execute(
+            "SELECT id, source_type, payload FROM ingest_job WHERE status = 'pending' ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "UPDATE ingest_job SET status = 'running', attempts = attempts + 1, claimed_by = ?, updated_at = ? "
+                "WHERE id = ?",
+                [(worker_id, now, row[0]) for row in rows]
+            )
+    return [(job_id, source_type, json.loads(payload)) for job_id, source_type, payload in rows]
+
+
+def mark_done(conn, results):
+    """Record finished jobs; results is a list of (job_id, source_id)"""
+    now = time.time()
+    with transaction(conn):
+        conn.executemany(
+            "UPDATE ingest_job SET status = 'done', source_id = ?, error = NULL, updated_at = ? WHERE id = ?",
+            [(source_id, now, job_id) for job_id, source_id in results]
+        )
+
+
+def mark_failed(conn, job_ids, error, max_attempts):
+    """Return jobs to the queue, or fail them once they have used up their attempts"""
+    now = time.time()
+    with transaction(conn):
+        conn.executemany('''
+            UPDATE ingest_job
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                error = ?, updated_at = ?
+            WHERE id = ?
+        ''', [(max_attempts, str(error)[:1000], now, job_id) for job_id in job_ids])
+
+
+def requeue_stale(conn, older_than_seconds):
+    """Put jobs claimed by a worker that died back into the queue"""
+    cutoff = time.time() - older_than_seconds
+    cursor = conn.execute(
+        "UPDATE ingest_job SET status = 'pending', claimed_by = NULL WHERE status = 'running' AND updated_at < ?",
+        (cutoff,)
+    )
+    return cursor.rowcount
+
+
+def job_status(job_ids):
+    conn = connect()
+    try:
+        placeholders = ','.join('?' * len(job_ids))
+        rows = conn.execute(
+            f"SELECT id, source_type, status, attempts, error, source_id FROM ingest_job WHERE id IN ({placeholders})",
+            list(job_ids)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {'id': row[0], 'source_type': row[1], 'status': row[2], 'attempts': row[3],
+         'error': row[4], 'source_id': row[5]}
+        for row in rows
+    ]
+
+
+def queue_depth():
+    """Job counts by status"""
+    conn = connect()
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM ingest_job GROUP BY status").fetchall())
+    finally:
+        conn.close()
+    return {status: counts.get(status, 0) for status in STATUSES}
@@ -0,0 +1,199 @@
+import json
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app import backends, corpus, reduction, sharding
+from similarity_search_app.benchmarking import git_commit
+from similarity_search_app.timing import StageTimer
+from similarity_search_app.vector_utils import VectorSearchManager
+
+
+DEFAULT_QUERIES = [
+    'remote work policy',
+    'password reset procedure',
+    'quarterly budget planning',
+    'employee performance review',
+    'security incident response',
+    'invoice approval workflow',
+    'onboarding checklist for new hires',
+    'database backup and recovery',
+    'leave and time-off policy',
+    'expense reporting guidelines',
+]
+
+
+def run_backend(manager, backend, db_path, query_embedding, limit, timer):
+    return manager.backend(backend).search(db_path, query_embedding, limit, timer=timer) or []
+
+
+def prepare_two_stage(manager, db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        if reduction.Projection.load(conn) is None:
+            reduction.build_reduced_index(conn, getattr(settings, 'VECTOR_SEARCH_PCA_DIM', 64))
+    finally:
+        conn.close()
+
+
+def prepare_memory(manager, db_path):
+    # Time queries, not the first load of the index
+    manager.memory_indexes.get(db_path)
+
+
+# Backends that need work on a fresh corpus before they can be timed: name -> prepare(manager, db_path)
+PREPARE = {
+    'two_stage': prepare_two_stage,
+    'memory': prepare_memory,
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark search latency per backend and corpus size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-type', default='IT',
+                            help='Vector database whose rows seed the benchmark corpora')
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma-separated corpus sizes')
+        parser.add_argument('--backends', default=','.join(backends.backend_classes()),
+                            help='Comma-separated backends to benchmark (built-in and VECTOR_SEARCH_BACKENDS)')
+        parser.add_argument('--corpus', choices=['resampled', 'synthetic'], default='resampled',
+                            help='Resample the source database, or generate clustered synthetic rows')
+        parser.add_argument('--queries-file', help='File with one query per line')
+        parser.add_argument('--repeat', type=int, default=3, help='Passes over the query set per backend')
+        parser.add_argument('--limit', type=int, default=25, help='Results per query')
+        parser.add_argument('--work-dir', help='Directory for generated corpora (defaults to a temp dir)')
+        parser.add_argument('--json', dest='json_path', help='Write results as JSON to this path')
+
+    def handle(self, *args, **options):
+        selected = [name.strip() for name in options['backends'].split(',') if name.strip()]
+        unknown = [name for name in selected if name not in backends.backend_classes()]
+        if unknown:
+            raise CommandError(f'Unknown backends: {", ".join(unknown)}')
+
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        queries = self.load_queries(options['queries_file'])
+        manager = VectorSearchManager()
+
+        # Embedding cost does not depend on corpus or backend, so measure it once
+        embeddings = []
+        encode_times = []
+        for query in queries:
+            start = time.perf_counter()
+            embeddings.append(manager.get_embedding(query))
+            encode_times.append(time.perf_counter() - start)
+
+        work_dir = options['work_dir'] or tempfile.mkdtemp(prefix='bench_search_')
+        os.makedirs(work_dir, exist_ok=True)
+        # Sharded sources seed the corpus from their first shard
+        source_path = (sharding.shard_paths(options['source_type'])[0]
+                       if options['source_type'] in settings.VECTOR_DATABASES else None)
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'source_type': options['source_type'],
+            'corpus': options['corpus'],
+            'queries': len(queries),
+            'repeat': options['repeat'],
+            'limit': options['limit'],
+            'encode_ms_mean': float(np.mean(encode_times) * 1000),
+            'results': [],
+        }
+
+        for size in sizes:
+            db_path = os.path.join(work_dir, f'bench_{size}.db')
+            self.stdout.write(f'Building corpus with {size} rows...')
+            if options['corpus'] == 'synthetic':
+                corpus.build_synthetic_corpus(db_path, size, options['source_type'],
+                                              real_source_path=source_path, real_fraction=0.5)
+            else:
+                corpus.build_resampled_corpus(source_path, db_path, size)
+
+            for backend in selected:
+                if backend in PREPARE:
+                    PREPARE[backend](manager, db_path)
+                if not manager.backend(backend).available(db_path):
+                    self.stdout.write(self.style.WARNING(f'{backend} is not available here - skipping'))
+                    continue
+                report['results'].append(
+                    self.bench_backend(manager, backend, db_path, size, embeddings, encode_times, options)
+                )
+
+        self.print_table(report)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["json_path"]}'))
+
+    def load_queries(self, path):
+        if not path:
+            return DEFAULT_QUERIES
+        with open(path) as handle:
+            return [line.strip() for line in handle if line.strip()]
+
+    def bench_backend(self, manager, backend, db_path, size, embeddings, encode_times, options):
+        """Run every query `repeat` times and summarise latency per stage"""
+        latencies = []
+        stage_totals = {}
+        wall_start = time.perf_counter()
+
+        for _ in range(options['repeat']):
+            for query_embedding, encode_time in zip(embeddings, encode_times):
+                timer = StageTimer()
+                timer.stages['encode'] = encode_time
+                results = run_backend(manager, backend, db_path, query_embedding, options['limit'], timer)
+
+                with timer.stage('serialize'):
+                    json.dumps({'results': [{
+                        'id': result['id'],
+                        'source_text': result['snippet'],
+                        'distance': round(result['distance'], 4),
+                        'metadata': result['metadata'],
+                    } for result in results]})
+
+                latencies.append(timer.total())
+                for stage, seconds in timer.stages.items():
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+        wall = time.perf_counter() - wall_start
+        count = len(latencies)
+        latencies_ms = np.asarray(latencies) * 1000
+        stages_ms = {stage: seconds / count * 1000 for stage, seconds in stage_totals.items()}
+
+        return {
+            'backend': backend,
+            'size': size,
+            'p50_ms': float(np.percentile(latencies_ms, 50)),
+            'p95_ms': float(np.percentile(latencies_ms, 95)),
+            'p99_ms': float(np.percentile(latencies_ms, 99)),
+            # Encoding happens once up front, so QPS here is search-only
+            'qps': count / wall if wall > 0 else 0.0,
+            'embedding_ms': stages_ms.get('encode', 0.0),
+            'db_io_ms': stages_ms.get('connect', 0.0) + stages_ms.get('scan', 0.0),
+            'scoring_ms': stages_ms.get('rank', 0.0),
+            'serialization_ms': stages_ms.get('format', 0.0) + stages_ms.get('serialize', 0.0),
+            'stages_ms': stages_ms,
+            # ru_maxrss is in KiB on Linux and is a process-wide high-water mark
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+    def print_table(self, report):
+        header = (f'{"backend":<12}{"size":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                  f'{"qps":>10}{"embed":>9}{"db io":>9}{"score":>9}{"serial":>9}{"rss MB":>9}')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in report['results']:
+            self.stdout.write(
+                f'{row["backend"]:<12}{row["size"]:>10}{row["p50_ms"]:>10.2f}{row["p95_ms"]:>10.2f}'
+                f'{row["p99_ms"]:>10.2f}{row["qps"]:>10.1f}{row["embedding_ms"]:>9.2f}'
+                f'{row["db_io_ms"]:>9.2f}{row["scoring_ms"]:>9.2f}{row["serialization_ms"]:>9.2f}'
+                f'{row["peak_rss_mb"]:>9.0f}'
+            )
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from similarity_search_app import generations, neighbors, sharding
+
+
+class Command(BaseCommand):
+    help = 'Precompute each document\'s nearest neighbors into neighbor_tbl for more-like-this lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type to process (repeatable, defaults to all)')
+        parser.add_argument('--neighbors', type=int, default=25, help='Neighbors stored per document')
+        parser.add_argument('--block-size', type=int, default=1024,
+                            help='Rows per matrix-multiplication block (bounds memory use)')
+
+    def handle(self, *args, **options):
+        source_types = options['source_types'] or list(settings.VECTOR_DATABASES.keys())
+
+        for source_type in source_types:
+            if sharding.is_sharded(source_type):
+                # A shard only sees its own rows, so its neighbor lists would be incomplete
+                self.stdout.write(self.style.WARNING(f'{source_type}: sharded, more-like-this searches instead'))
+                continue
+
+            db_path = generations.current_path(source_type)
+            if not os.path.exists(db_path):
+                self.stdout.write(self.style.WARNING(f'{source_type}: database not found, skipping'))
+                continue
+
+            conn = sqlite3.connect(db_path)
+            try:
+                start = time.perf_counter()
+                count = neighbors.build_neighbor_table(
+                    conn, neighbors=options['neighbors'], block_size=options['block_size']
+                )
+                elapsed = time.perf_counter() - start
+            finally:
+                conn.close()
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{source_type}: stored {options["neighbors"]} neighbors for {count} documents in {elapsed:.2f}s'
+            ))
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from similarity_search_app import reduction, sharding
+
+
+class Command(BaseCommand):
+    help = 'Train a PCA projection per vector database, index reduced vectors and report recall against exact search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type to index (repeatable, defaults to all)')
+        parser.add_argument('--dim', type=int, default=getattr(settings, 'VECTOR_SEARCH_PCA_DIM', 64),
+                            help='Reduced dimension')
+        parser.add_argument('--rerank-depth', type=int,
+                            default=getattr(settings, 'VECTOR_SEARCH_RERANK_DEPTH', 200),
+                            help='Number of coarse candidates reranked with full vectors')
+        parser.add_argument('--sample-size', type=int, default=100000,
+                            help='Maximum number of rows used to train the projection')
+        parser.add_argument('--queries', type=int, default=50,
+                            help='Number of stored embeddings sampled as recall queries (0 to skip)')
+        parser.add_argument('-k', type=int, default=25, help='k used for recall@k')
+
+    def handle(self, *args, **options):
+        source_types = options['source_types'] or list(settings.VECTOR_DATABASES.keys())
+
+        # Every shard gets its own projection and reduced vectors
+        targets = []
+        for source_type in source_types:
+            paths = sharding.shard_paths(source_type)
+            if len(paths) == 1:
+                targets.append((source_type, paths[0]))
+            else:
+                targets.extend((f'{source_type}[{shard}]', path) for shard, path in enumerate(paths))
+
+        for source_type, db_path in targets:
+            if not os.path.exists(db_path):
+                self.stdout.write(self.style.WARNING(f'{source_type}: database not found, skipping'))
+                continue
+
+            conn = sqlite3.connect(db_path)
+            try:
+                start = time.perf_counter()
+                projection, indexed = reduction.build_reduced_index(
+                    conn, options['dim'], sample_size=options['sample_size']
+                )
+                elapsed = time.perf_counter() - start
+
+                if projection is None:
+                    self.stdout.write(self.style.WARNING(f'{source_type}: no embeddings to index'))
+                    continue
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'{source_type}: indexed {indexed} rows at dim {projection.dim} '
+                    f'(explained variance {projection.explained_variance:.3f}) in {elapsed:.2f}s'
+                ))
+
+                if options['queries'] > 0:
+                    self.report_recall(conn, source_type, projection, options)
+            finally:
+                conn.close()
+
+    def report_recall(self, conn, source_type, projection, options):
+        """Compare two-stage results with an exact scan on sampled queries"""
+        ids, matrix = reduction.load_full_matrix(conn)
+        rng = np.random.default_rng(1)
+        sample = rng.choice(len(matrix), min(options['queries'], len(matrix)), replace=False)
+
+        # Perturb sampled embeddings so queries are not exact copies of stored rows
+        queries = matrix[sample] + rng.normal(0, 0.02, size=(len(sample), matrix.shape[1])).astype(np.float32)
+
+        # Searches keep reduced vectors cached between queries, so time only the ranking
+        reduced = reduction.load_reduced_matrix(conn)
+
+        recalls = []
+        exact_time = 0.0
+        two_stage_time = 0.0
+        for query in queries:
+            start = time.perf_counter()
+            exact = reduction.exact_rank(ids, matrix, query, options['k'])
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            approximate = reduction.two_stage_rank(
+                conn, projection, query, options['k'], options['rerank_depth'], reduced=reduced
+            ) or []
+            two_stage_time += time.perf_counter() - start
+
+            recalls.append(reduction.recall_at_k(
+                [source_id for source_id, _ in approximate],
+                [source_id for source_id, _ in exact]
+            ))
+
+        count = len(queries)
+        self.stdout.write(
+            f'{source_type}: recall@{options["k"]} = {np.mean(recalls):.4f} '
+            f'(rerank depth {options["rerank_depth"]}, {count} queries); '
+            f'mean latency exact {exact_time / count * 1000:.2f}ms, '
+            f'two-stage {two_stage_time / count * 1000:.2f}ms'
+        )
@@ -0,0 +1,38 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app.embedding_service import EmbeddingServer
+from similarity_search_app.vector_utils import load_embedding_model
+
+
+class Command(BaseCommand):
+    help = 'Serve sentence embeddings over a Unix domain socket so workers share one model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'EMBEDDING_SERVICE_SOCKET', None),
+                            help='Socket path (defaults to EMBEDDING_SERVICE_SOCKET)')
+        parser.add_argument('--batch-size', type=int, default=64, help='Batch size passed to model.encode')
+        parser.add_argument('--max-batch', type=int, default=4096, help='Largest accepted request')
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            raise CommandError('No socket path given and EMBEDDING_SERVICE_SOCKET is not set')
+
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+        self.stdout.write('Loading embedding model...')
+        model = load_embedding_model()
+
+        server = EmbeddingServer(
+            socket_path, model, batch_size=options['batch_size'], max_batch=options['max_batch']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Embedding service listening on {socket_path}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
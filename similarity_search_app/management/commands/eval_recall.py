@@ -0,0 +1,267 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app import backends, reduction, sharding
+from similarity_search_app.vector_utils import BATCH_SCORE_ELEMENTS, VectorSearchManager
+
+
+def run_exact(manager, db_path, query_embedding, limit, params):
+    if manager.sqlite_vec_available:
+        return manager._sqlite_vec_search(db_path, query_embedding, limit)
+    return manager._fallback_similarity_search(db_path, query_embedding, limit)
+
+
+def run_two_stage(manager, db_path, query_embedding, limit, params):
+    return manager.two_stage_search(db_path, query_embedding, limit, rerank_depth=params['rerank_depth']) or []
+
+
+def prepare_two_stage(db_path, params):
+    conn = sqlite3.connect(db_path)
+    try:
+        reduction.build_reduced_index(conn, params['dim'])
+    finally:
+        conn.close()
+
+
+def backend_runner(name):
+    """Runner searching with a registered backend at its default settings"""
+    def run(manager, db_path, query_embedding, limit, params):
+        return manager.backend(name).search(db_path, query_embedding, limit) or []
+    return run
+
+
+# Modes with knobs: name -> (runner, prepare(db_path, params) or None, knobs
+# that need a rebuild, knobs applied per query). Knob values come from the
+# command line option of the same name.
+TUNED_MODES = {
+    'exact': (run_exact, None, (), ()),
+    'two_stage': (run_two_stage, prepare_two_stage, ('dim',), ('rerank_depth',)),
+}
+
+
+def search_modes():
+    """'exact' plus a mode per search backend, built-in and from VECTOR_SEARCH_BACKENDS"""
+    modes = dict(TUNED_MODES)
+    for name in backends.backend_classes():
+        modes.setdefault(name, (backend_runner(name), None, (), ()))
+    return modes
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Sweep approximate search knobs and report recall@k against cached exact ground truth, with latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type to evaluate (repeatable, defaults to all)')
+        parser.add_argument('--modes', default=','.join(search_modes()), help='Comma-separated search modes to sweep')
+        parser.add_argument('--dim', type=_int_list, default=[32, 64, 128],
+                            help='two_stage: comma-separated PCA dimensions')
+        parser.add_argument('--rerank-depth', type=_int_list, default=[25, 50, 100, 200, 400],
+                            help='two_stage: comma-separated rerank depths')
+        parser.add_argument('-k', type=int, default=25, help='k used for recall@k')
+        parser.add_argument('--queries-file', help='File with one query per line (encoded with the model)')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Stored embeddings sampled as queries when no queries file is given')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cache-dir', default=str(settings.BASE_DIR / 'vector_dbs' / 'ground_truth'),
+                            help='Directory for cached queries and exact top-k')
+        parser.add_argument('--work-dir', help='Directory for database copies (defaults to a temp dir)')
+        parser.add_argument('--csv', dest='csv_path', help='Write one row per operating point to this CSV')
+        parser.add_argument('--json', dest='json_path', help='Write the full report as JSON to this path')
+
+    def handle(self, *args, **options):
+        available_modes = search_modes()
+        modes = [name.strip() for name in options['modes'].split(',') if name.strip()]
+        unknown = [name for name in modes if name not in available_modes]
+        if unknown:
+            raise CommandError(f'Unknown modes: {", ".join(unknown)}')
+
+        source_types = options['source_types'] or list(settings.VECTOR_DATABASES.keys())
+        manager = VectorSearchManager()
+        work_dir = options['work_dir'] or tempfile.mkdtemp(prefix='eval_recall_')
+        os.makedirs(work_dir, exist_ok=True)
+        os.makedirs(options['cache_dir'], exist_ok=True)
+
+        # Every shard is evaluated as its own database
+        targets = []
+        for source_type in source_types:
+            paths = sharding.shard_paths(source_type)
+            if len(paths) == 1:
+                targets.append((source_type, paths[0]))
+            else:
+                targets.extend((f'{source_type}[{shard}]', path) for shard, path in enumerate(paths))
+
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'k': options['k'],
+            'sqlite_vec': manager.sqlite_vec_available,
+            'results': [],
+        }
+
+        for label, db_path in targets:
+            if not os.path.exists(db_path):
+                self.stdout.write(self.style.WARNING(f'{label}: database not found, skipping'))
+                continue
+
+            queries, truth = self.ground_truth(manager, label, db_path, options)
+            if len(queries) == 0:
+                self.stdout.write(self.style.WARNING(f'{label}: no embeddings, skipping'))
+                continue
+            self.stdout.write(f'{label}: {len(queries)} queries with exact top-{options["k"]}')
+
+            # Approximate indexes are built on a copy so the live file is untouched
+            copy_path = os.path.join(work_dir, f'{label}.db')
+            self.copy_database(db_path, copy_path)
+
+            for mode in modes:
+                if mode not in TUNED_MODES and not manager.backend(mode).available(copy_path):
+                    self.stdout.write(self.style.WARNING(f'  {mode} is not available here - skipping'))
+                    continue
+                runner, prepare, build_knobs, query_knobs = available_modes[mode]
+                for build_values in itertools.product(*(options[knob] for knob in build_knobs)):
+                    build_params = dict(zip(build_knobs, build_values))
+                    if prepare:
+                        prepare(copy_path, build_params)
+                    for query_values in itertools.product(*(options[knob] for knob in query_knobs)):
+                        params = dict(build_params, **dict(zip(query_knobs, query_values)))
+                        row = self.evaluate(manager, runner, copy_path, queries, truth, params, options)
+                        row.update(source=label, mode=mode, params=params)
+                        report['results'].append(row)
+                        self.stdout.write(
+                            f'  {mode:<10} {self.format_params(params):<28} recall@{options["k"]} '
+                            f'{row["recall"]:.4f}  p95 {row["p95_ms"]:.2f}ms'
+                        )
+
+        self.mark_pareto(report['results'])
+
+        if options['csv_path']:
+            self.write_csv(options['csv_path'], report['results'])
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["csv_path"]}'))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["json_path"]}'))
+
+    def ground_truth(self, manager, label, db_path, options):
+        """Query embeddings and their exact top-k ids, cached per database state and query set"""
+        if options['queries_file']:
+            with open(options['queries_file'], 'rb') as handle:
+                query_key = hashlib.sha256(handle.read()).hexdigest()
+        else:
+            query_key = f'sample:{options["queries"]}:{options["seed"]}'
+
+        # Any write changes the size or mtime of the database or its WAL
+        state = [os.path.basename(db_path)]
+        for candidate in (db_path, db_path + '-wal'):
+            if os.path.exists(candidate):
+                stat = os.stat(candidate)
+                state.append([stat.st_size, stat.st_mtime_ns])
+        key = json.dumps([state, options['k'], query_key])
+        cache_path = os.path.join(
+            options['cache_dir'], f'{label}-{hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]}.npz'
+        )
+        if os.path.exists(cache_path):
+            cached = np.load(cache_path)
+            return cached['queries'], cached['truth']
+
+        conn = sqlite3.connect(db_path)
+        try:
+            ids, matrix = reduction.load_full_matrix(conn)
+        finally:
+            conn.close()
+        if len(ids) == 0:
+            return np.empty((0, 0), dtype=np.float32), np.empty((0, 0), dtype=np.int64)
+
+        if options['queries_file']:
+            with open(options['queries_file']) as handle:
+                texts = [line.strip() for line in handle if line.strip()]
+            queries = np.asarray(manager.get_embeddings(texts), dtype=np.float32)
+        else:
+            rng = np.random.default_rng(options['seed'])
+            sample = rng.choice(len(matrix), min(options['queries'], len(matrix)), replace=False)
+            # Perturb sampled embeddings so queries are not exact copies of stored rows
+            queries = matrix[sample] + rng.normal(0, 0.02, size=(len(sample), matrix.shape[1])).astype(np.float32)
+
+        start = time.perf_counter()
+        # Short rows (k larger than the corpus) are padded with -1
+        truth = np.full((len(queries), options['k']), -1, dtype=np.int64)
+        chunk = max(1, BATCH_SCORE_ELEMENTS // len(ids))
+        for offset in range(0, len(queries), chunk):
+            similarities = reduction.cosine_scores_many(matrix, queries[offset:offset + chunk])
+            for row, scores in enumerate(similarities, start=offset):
+                top = ids[reduction.top_k(scores, options['k'])]
+                truth[row, :len(top)] = top
+        self.stdout.write(f'{label}: computed ground truth in {time.perf_counter() - start:.2f}s')
+
+        np.savez(cache_path, queries=queries, truth=truth)
+        return queries, truth
+
+    def copy_database(self, source_path, target_path):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def evaluate(self, manager, runner, db_path, queries, truth, params, options):
+        recalls = []
+        latencies = []
+        for query, exact in zip(queries, truth):
+            query_embedding = query.tolist()
+            start = time.perf_counter()
+            results = runner(manager, db_path, query_embedding, options['k'], params)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(reduction.recall_at_k(
+                [result['id'] for result in results], [int(source_id) for source_id in exact if source_id >= 0]
+            ))
+
+        latencies_ms = np.asarray(latencies) * 1000
+        return {
+            'recall': float(np.mean(recalls)),
+            'recall_min': float(np.min(recalls)),
+            'p50_ms': float(np.percentile(latencies_ms, 50)),
+            'p95_ms': float(np.percentile(latencies_ms, 95)),
+            'qps': len(latencies) / float(np.sum(latencies)) if np.sum(latencies) > 0 else 0.0,
+        }
+
+    def mark_pareto(self, rows):
+        """Flag operating points no other point (on the same source) beats on both recall and p95"""
+        for row in rows:
+            row['pareto'] = not any(
+                other is not row and other['source'] == row['source']
+                and other['recall'] >= row['recall'] and other['p95_ms'] <= row['p95_ms']
+                and (other['recall'] > row['recall'] or other['p95_ms'] < row['p95_ms'])
+                for other in rows
+            )
+
+    def format_params(self, params):
+        return ' '.join(f'{name}={value}' for name, value in params.items()) or '-'
+
+    def write_csv(self, path, rows):
+        knobs = sorted({knob for row in rows for knob in row['params']})
+        fields = ['source', 'mode'] + knobs + ['recall', 'recall_min', 'p50_ms', 'p95_ms', 'qps', 'pareto']
+        with open(path, 'w', newline='') as handle:
+            writer = csv.DictWriter(handle, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                record = {field: row.get(field) for field in fields if field not in knobs}
+                record.update({knob: row['params'].get(knob, '') for knob in knobs})
+                writer.writerow(record)
@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+
+DEFAULT_TARGET = 'similarity_search.urls'
+
+# Modules that must not be imported while Django boots
+DEFAULT_FORBIDDEN = ['torch', 'sentence_transformers', 'transformers']
+
+
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into (module, self_us, cumulative_us, depth) tuples"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, timings = line.split(':', 1)
+            self_us, cumulative_us, module = timings.split('|', 2)
+            # Nesting is shown by two extra spaces per level after the bar
+            depth = (len(module) - len(module.lstrip()) - 1) // 2
+            entries.append((module.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return entries
+
+
+class Command(BaseCommand):
+    help = 'Report import times for Django startup (python -X importtime) and flag heavy imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default=DEFAULT_TARGET,
+                            help='Module imported after django.setup() (defaults to the URLconf, '
+                                 'which pulls in every view)')
+        parser.add_argument('--top', type=int, default=25, help='Number of modules to list')
+        parser.add_argument('--forbid', action='append',
+                            help=f'Top-level module that must not be imported (default: {", ".join(DEFAULT_FORBIDDEN)})')
+        parser.add_argument('--max-ms', type=float,
+                            help='Fail if total startup import time exceeds this many milliseconds')
+        parser.add_argument('--json', dest='json_path', help='Write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        code = (
+            'import django; django.setup(); '
+            f'import importlib; importlib.import_module({options["target"]!r})'
+        )
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'similarity_search.settings')
+
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        entries = parse_importtime(completed.stderr)
+        if completed.returncode != 0:
+            errors = [line for line in completed.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError('Startup import failed:\n' + '\n'.join(errors[-20:]))
+
+        # Top-level entries sum to the total import time
+        total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+        imported = {module.split('.')[0] for module, _, _, _ in entries}
+        forbidden = options['forbid'] or DEFAULT_FORBIDDEN
+        violations = sorted(name for name in forbidden if name in imported)
+
+        slowest = sorted(entries, key=lambda entry: entry[2], reverse=True)[:options['top']]
+        self.stdout.write(f'{"cumulative ms":>14}{"self ms":>10}  module')
+        for module, self_us, cumulative_us, _ in slowest:
+            self.stdout.write(f'{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {module}')
+        self.stdout.write(f'\nImported {len(entries)} modules in {total_us / 1000:.1f}ms')
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump({
+                    'target': options['target'],
+                    'total_ms': total_us / 1000,
+                    'modules': len(entries),
+                    'forbidden_imported': violations,
+                    'slowest': [
+                        {'module': module, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+                        for module, self_us, cumulative_us, _ in slowest
+                    ],
+                }, handle, indent=2)
+
+        if violations:
+            raise CommandError(f'Heavy modules imported at startup: {", ".join(violations)}')
+        if options['max_ms'] is not None and total_us / 1000 > options['max_ms']:
+            raise CommandError(f'Startup imports took {total_us / 1000:.1f}ms (limit {options["max_ms"]}ms)')
+
+        self.stdout.write(self.style.SUCCESS('No forbidden modules imported at startup'))
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app import corpus, generations, sharding
+from similarity_search_app.memory_index import MemoryIndex, snapshot_files
+from similarity_search_app.vector_utils import MODEL_NAME
+
+
+BUNDLE_FORMAT = 'similarity-search-index'
+BUNDLE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_atomic(source, target):
+    temp = f'{target}.tmp-{os.getpid()}'
+    shutil.copyfile(source, temp)
+    os.replace(temp, target)
+
+
+class Command(BaseCommand):
+    help = ('Save memory indexes next to their databases, or export/import a snapshot bundle '
+            '(database plus memory-mappable index) for bootstrapping a search node')
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['save', 'export', 'import'],
+                            help='save: write the index next to each live database; '
+                                 'export/import: write or install a bundle directory')
+        parser.add_argument('bundle', nargs='?', help='Bundle directory for export and import')
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type to include (repeatable, defaults to all)')
+        parser.add_argument('--no-database', action='store_true',
+                            help='export: leave the database out; import: ignore a bundled database and '
+                                 'attach the index to the active one')
+        parser.add_argument('--force', action='store_true',
+                            help='import: accept a bundle built for a different embedding model')
+        parser.add_argument('--keep-generations', type=int, default=2,
+                            help='import: old generations kept on disk after activating a bundled database')
+
+    def handle(self, *args, **options):
+        if options['action'] != 'save' and not options['bundle']:
+            raise CommandError(f'{options["action"]} needs a bundle directory')
+
+        source_types = options['source_types'] or list(settings.VECTOR_DATABASES.keys())
+        unknown = [source_type for source_type in source_types if source_type not in settings.VECTOR_DATABASES]
+        if unknown:
+            raise CommandError(f'Unknown source types: {", ".join(unknown)}')
+
+        actions = {'save': self.save, 'export': self.export, 'import': self.import_}
+        actions[options['action']](source_types, options)
+
+    def targets(self, source_types):
+        """(source_type, shard, file stem) for every database file of the given sources"""
+        for source_type in source_types:
+            if sharding.is_sharded(source_type):
+                for shard in range(sharding.shard_count(source_type)):
+                    yield source_type, shard, f'{source_type}-{shard}'
+            else:
+                yield source_type, None, source_type
+
+    def build_index(self, db_path):
+        start = time.perf_counter()
+        index = MemoryIndex(db_path)
+        index.refresh()
+        return index, time.perf_counter() - start
+
+    def save(self, source_types, options):
+        for source_type, shard, stem in self.targets(source_types):
+            db_path = generations.current_path(source_type, shard)
+            if not os.path.exists(db_path):
+                self.stdout.write(self.style.WARNING(f'{stem}: database not found, skipping'))
+                continue
+            index, elapsed = self.build_index(db_path)
+            manifest = index.save()
+            self.stdout.write(self.style.SUCCESS(
+                f'{stem}: saved {manifest["rows"]} rows next to {os.path.basename(db_path)} '
+                f'(built in {elapsed:.2f}s)'
+            ))
+
+    def export(self, source_types, options):
+        bundle = options['bundle']
+        os.makedirs(bundle, exist_ok=True)
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'version': BUNDLE_VERSION,
+            'model': MODEL_NAME,
+            'dim': corpus.EMBEDDING_DIM,
+            'created': datetime.now(timezone.utc).isoformat(),
+            'targets': [],
+        }
+
+        for source_type, shard, stem in self.targets(source_types):
+            db_path = generations.current_path(source_type, shard)
+            if not os.path.exists(db_path):
+                self.stdout.write(self.style.WARNING(f'{stem}: database not found, skipping'))
+                continue
+
+            bundled_db = os.path.join(bundle, f'{stem}.db')
+            if options['no_database']:
+                # Index straight from the live file; the importing node must hold the same data
+                index, elapsed = self.build_index(db_path)
+            else:
+                # Index the consistent copy, so database and index describe the same state
+                source = sqlite3.connect(db_path)
+                target = sqlite3.connect(bundled_db)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+                index, elapsed = self.build_index(bundled_db)
+
+            files = snapshot_files(bundled_db)
+            saved = index.save(files)
+            paths = list(files.values()) if options['no_database'] else [bundled_db] + list(files.values())
+            manifest['targets'].append({
+                'source_type': source_type,
+                'shard': shard,
+                'stem': stem,
+                'database': None if options['no_database'] else os.path.basename(bundled_db),
+                'rows': saved['rows'],
+                'files': {
+                    os.path.basename(path): {'bytes': os.path.getsize(path), 'sha256': file_checksum(path)}
+                    for path in paths
+                },
+            })
+            self.stdout.write(self.style.SUCCESS(
+                f'{stem}: exported {saved["rows"]} rows (index built in {elapsed:.2f}s)'
+            ))
+
+        with open(os.path.join(bundle, MANIFEST_NAME), 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {os.path.join(bundle, MANIFEST_NAME)}'))
+
+    def import_(self, source_types, options):
+        bundle = options['bundle']
+        try:
+            with open(os.path.join(bundle, MANIFEST_NAME)) as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            raise CommandError(f'{bundle} has no {MANIFEST_NAME}')
+
+        if manifest.get('format') != BUNDLE_FORMAT or manifest.get('version') != BUNDLE_VERSION:
+            raise CommandError(f'Unsupported bundle {manifest.get("format")} v{manifest.get("version")}')
+        if manifest['model'] != MODEL_NAME and not options['force']:
+            raise CommandError(f'Bundle was built with {manifest["model"]}, this node uses {MODEL_NAME}')
+        if manifest['dim'] != corpus.EMBEDDING_DIM:
+            raise CommandError(f'Bundle has dimension {manifest["dim"]}, expected {corpus.EMBEDDING_DIM}')
+
+        targets = [target for target in manifest['targets'] if target['source_type'] in source_types]
+        for target in targets:
+            source_type, shard = target['source_type'], target['shard']
+            if sharding.is_sharded(source_type):
+                matches = shard is not None and shard < sharding.shard_count(source_type)
+            else:
+                matches = shard is None
+            if not matches:
+                raise CommandError(f'{source_type} shard {shard} does not match VECTOR_DATABASES')
+
+        # Verify everything before touching the live databases
+        start = time.perf_counter()
+        for target in targets:
+            for name, expected in target['files'].items():
+                path = os.path.join(bundle, name)
+                if not os.path.exists(path) or os.path.getsize(path) != expected['bytes'] \
+                        or file_checksum(path) != expected['sha256']:
+                    raise CommandError(f'{name} is missing or does not match its checksum')
+        self.stdout.write(f'Verified {len(targets)} targets in {time.perf_counter() - start:.2f}s')
+
+        for target in targets:
+            source_type, shard = target['source_type'], target['shard']
+            label = source_type if shard is None else f'{source_type}[{shard}]'
+            start = time.perf_counter()
+            bundled = snapshot_files(os.path.join(bundle, f'{target["stem"]}.db'))
+
+            if target['database'] and not options['no_database']:
+                db_path = generations.new_generation_path(source_type, shard)
+                shutil.copyfile(os.path.join(bundle, target['database']), db_path)
+                try:
+                    generations.validate_generation(db_path, expected_dim=manifest['dim'])
+                except generations.GenerationError as e:
+                    os.remove(db_path)
+                    raise CommandError(f'{label}: bundled database failed validation: {e}')
+            else:
+                db_path = generations.current_path(source_type, shard)
+                if not os.path.exists(db_path):
+                    self.stdout.write(self.style.WARNING(f'{label}: no active database to attach the index to'))
+                    continue
+
+            # Arrays first and the manifest last, as MemoryIndex.save writes them
+            installed = snapshot_files(db_path)
+            for name in ('ids', 'embedding_ids', 'matrix', 'manifest'):
+                copy_atomic(bundled[name], installed[name])
+
+            if db_path != generations.current_path(source_type, shard):
+                generations.activate_generation(source_type, db_path, shard=shard)
+                generations.prune_generations(source_type, keep=options['keep_generations'], shard=shard)
+
+            # Loading the saved index is what a worker does on first use
+            load_start = time.perf_counter()
+            loaded = MemoryIndex(db_path).load_saved()
+            load_elapsed = time.perf_counter() - load_start
+            if not loaded:
+                self.stdout.write(self.style.WARNING(f'{label}: installed index does not match the database'))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: installed {target["rows"]} rows into {os.path.basename(db_path)} in '
+                f'{time.perf_counter() - start:.2f}s (index loads in {load_elapsed * 1000:.1f}ms)'
+            ))
@@ -0,0 +1,112 @@
+import os
+import socket
+import sqlite3
+import time
+from itertools import groupby
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from similarity_search_app import corpus, generations, ingest_queue, neighbors, sharding
+from similarity_search_app.vector_utils import VectorSearchManager
+
+
+class Command(BaseCommand):
+    help = 'Drain the ingestion job queue: batch-encode queued documents and write them to the vector databases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'INGEST_BATCH_SIZE', 64),
+                            help='Jobs claimed, encoded and committed together')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=3, help='Attempts before a job is marked failed')
+        parser.add_argument('--stale-after', type=float, default=600,
+                            help='Requeue running jobs not updated for this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        encoder = VectorSearchManager()
+        conn = ingest_queue.connect()
+
+        requeued = ingest_queue.requeue_stale(conn, options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+
+        self.stdout.write(f'Ingest worker {worker_id} started')
+        try:
+            while True:
+                jobs = ingest_queue.claim_batch(conn, options['batch_size'], worker_id)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                # Jobs are claimed in id order; group them so each source commits once
+                jobs.sort(key=lambda job: job[1])
+                for source_type, group in groupby(jobs, key=lambda job: job[1]):
+                    self.process(conn, encoder, source_type, list(group), options['max_attempts'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            conn.close()
+
+    def process(self, conn, encoder, source_type, jobs, max_attempts):
+        """Encode a source's jobs together, then write and settle them shard by shard
+
+        Each shard's jobs are marked done as soon as its commit lands, so a
+        failure on a later shard only retries the jobs that were not written
+        and never re-inserts documents under fresh ids.
+        """
+        job_ids = [job_id for job_id, _, _ in jobs]
+        documents = [payload for _, _, payload in jobs]
+
+        try:
+            if source_type not in settings.VECTOR_DATABASES:
+                raise ValueError(f'Unknown source type {source_type}')
+
+            start = time.perf_counter()
+            embeddings = encoder.encode_texts([document['source_text'] for document in documents])
+            encoded = time.perf_counter()
+        except Exception as e:
+            ingest_queue.mark_failed(conn, job_ids, e, max_attempts)
+            self.stdout.write(self.style.ERROR(f'{source_type}: batch of {len(jobs)} failed: {e}'))
+            return
+
+        indexed = 0
+        for shard, positions in self.group_by_shard(source_type, documents).items():
+            shard_job_ids = [job_ids[i] for i in positions]
+            try:
+                allocator = sharding.id_allocator(shard, sharding.shard_count(source_type)) \
+                    if shard is not None else None
+                db = sqlite3.connect(generations.current_path(source_type, shard), timeout=30)
+                try:
+                    # Replaced documents lose their neighbor lists before the write, so a
+                    # failure here leaves nothing committed and the jobs retry cleanly
+                    neighbors.invalidate(db, [documents[i]['id'] for i in positions
+                                              if documents[i].get('id') is not None])
+                    shard_ids = corpus.upsert_documents(
+                        db, [documents[i] for i in positions], [embeddings[i] for i in positions],
+                        id_allocator=allocator
+                    )
+                finally:
+                    db.close()
+            except Exception as e:
+                ingest_queue.mark_failed(conn, shard_job_ids, e, max_attempts)
+                label = source_type if shard is None else f'{source_type}[{shard}]'
+                self.stdout.write(self.style.ERROR(f'{label}: {len(positions)} documents failed: {e}'))
+                continue
+            ingest_queue.mark_done(conn, list(zip(shard_job_ids, shard_ids)))
+            indexed += len(positions)
+
+        written = time.perf_counter()
+        self.stdout.write(
+            f'{source_type}: indexed {indexed} of {len(jobs)} documents '
+            f'(encode {(encoded - start) * 1000:.0f}ms, write {(written - encoded) * 1000:.0f}ms)'
+        )
+
+    def group_by_shard(self, source_type, documents):
+        """Positions of documents by the shard they are written to (None when unsharded)"""
+        groups = {}
+        for position, document in enumerate(documents):
+            groups.setdefault(sharding.shard_for_document(source_type, document), []).append(position)
+        return groups
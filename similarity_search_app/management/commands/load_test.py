@@ -0,0 +1,299 @@
+import http.cookiejar
+import json
+import queue
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app.benchmarking import git_commit
+from similarity_search_app.models import CustomUser
+from .bench_search import DEFAULT_QUERIES
+
+
+# A level whose throughput improves on the previous one by less than this is saturated
+SATURATION_GAIN = 1.10
+
+
+class Session:
+    """One logged-in client with its own cookie jar, like one browser tab"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def cookie(self, name):
+        return next((cookie.value for cookie in self.cookies if cookie.name == name), None)
+
+    def login(self, email, password):
+        # Fetch the form first for the CSRF cookie the sign-in view requires
+        self.opener.open(self.base_url + '/signin/', timeout=self.timeout).read()
+        token = self.cookie('csrftoken')
+        data = urllib.parse.urlencode({'email': email, 'password': password, 'csrfmiddlewaretoken': token})
+        request = urllib.request.Request(
+            self.base_url + '/signin/', data=data.encode('utf-8'),
+            headers={'Referer': self.base_url + '/signin/', 'X-CSRFToken': token or ''}
+        )
+        self.opener.open(request, timeout=self.timeout).read()
+        if self.cookie('sessionid') is None:
+            raise CommandError(f'Could not sign in as {email}')
+
+    def post_json(self, path, payload):
+        """POST JSON; returns (status, parsed body or None)"""
+        request = urllib.request.Request(
+            self.base_url + path, data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, None
+
+
+class Command(BaseCommand):
+    help = 'Replay a query log against a running server at increasing concurrency and report throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Server under test')
+        parser.add_argument('--email', default='loadtest@example.com', help='Test user to sign in as')
+        parser.add_argument('--password', default='loadtest-password', help='Test user password')
+        parser.add_argument('--create-user', action='store_true',
+                            help='Create the test user in this project\'s database if it does not exist')
+        parser.add_argument('--query-log', help='Query log: JSON lines with keyword/source_type, or one query per line')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Generate this many synthetic queries instead of reading a log')
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type for queries without one (repeatable, defaults to all)')
+        parser.add_argument('--concurrency', default='1,2,4,8,16',
+                            help='Comma-separated client counts to sweep')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Open-loop arrival rate in requests/s (0 runs closed-loop, as fast as possible)')
+        parser.add_argument('--requests', type=int, default=200, help='Searches issued per concurrency level')
+        parser.add_argument('--detail-ratio', type=float, default=0.3,
+                            help='Fraction of searches followed by a /source-detail/ request')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+        parser.add_argument('--label', default='default',
+                            help='Name of the server\'s backend configuration, recorded in the report')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help='Write results as JSON to this path')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',') if level.strip()]
+        source_types = options['source_types'] or list(settings.VECTOR_DATABASES.keys())
+        queries = self.load_queries(options, source_types)
+        if not queries:
+            raise CommandError('No queries to replay')
+
+        if options['create_user'] and not CustomUser.objects.filter(email=options['email']).exists():
+            CustomUser.objects.create_user(email=options['email'], password=options['password'])
+            self.stdout.write(f'Created test user {options["email"]}')
+
+        report = {
+            'label': options['label'],
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'base_url': options['base_url'],
+            'queries': len(queries),
+            'rate': options['rate'],
+            'levels': [],
+        }
+
+        for concurrency in levels:
+            self.stdout.write(f'Running {options["requests"]} searches at concurrency {concurrency}...')
+            backends_before = self.backend_counts(options)
+            level = self.run_level(concurrency, queries, options)
+            backends_after = self.backend_counts(options)
+            level['backends'] = {
+                backend: count - backends_before.get(backend, 0)
+                for backend, count in backends_after.items()
+                if count > backends_before.get(backend, 0)
+            }
+            report['levels'].append(level)
+
+        report['saturation_concurrency'] = self.saturation_point(report['levels'])
+        self.print_table(report)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["json_path"]}'))
+
+    def load_queries(self, options, source_types):
+        """(source_type, keyword) pairs from the query log, or synthetic ones"""
+        rng = random.Random(options['seed'])
+        if options['query_log']:
+            queries = []
+            counted = False
+            with open(options['query_log']) as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if line.startswith('{'):
+                        record = json.loads(line)
+                        # Aggregated logs (see query_log) carry a count per query
+                        queries.extend(
+                            [(record.get('source_type') or rng.choice(source_types), record['keyword'])]
+                            * int(record.get('count', 1))
+                        )
+                        counted = counted or 'count' in record
+                    else:
+                        queries.append((rng.choice(source_types), line))
+            # Spread repeats of a counted query over the run instead of replaying them back to back
+            if counted:
+                rng.shuffle(queries)
+            return queries
+
+        if options['synthetic']:
+            # Recombine words from the benchmark queries into 2-4 word phrases
+            vocabulary = sorted({word for query in DEFAULT_QUERIES for word in query.split()})
+            return [
+                (rng.choice(source_types), ' '.join(rng.sample(vocabulary, rng.randint(2, 4))))
+                for _ in range(options['synthetic'])
+            ]
+
+        return [(source_type, query) for query in DEFAULT_QUERIES for source_type in source_types]
+
+    def run_level(self, concurrency, queries, options):
+        """Issue options['requests'] searches from `concurrency` signed-in clients"""
+        sessions = []
+        for _ in range(concurrency):
+            session = Session(options['base_url'], options['timeout'])
+            session.login(options['email'], options['password'])
+            sessions.append(session)
+
+        rng = random.Random(options['seed'])
+        work = queue.Queue()
+        samples = {'search': [], 'source_detail': []}
+        statuses = {}
+        lock = threading.Lock()
+
+        def record(endpoint, latency, status):
+            with lock:
+                samples[endpoint].append(latency)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        def worker(session, worker_rng):
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                scheduled, (source_type, keyword) = item
+                # Open-loop latency counts from the scheduled arrival, so
+                # queueing behind a slow server is not hidden
+                start = scheduled if scheduled is not None else time.perf_counter()
+                wait = start - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    status, body = session.post_json('/search/', {'source_type': source_type, 'keyword': keyword})
+                except Exception:
+                    status, body = 'exception', None
+                record('search', time.perf_counter() - start, status)
+
+                results = (body or {}).get('results') or []
+                if results and worker_rng.random() < options['detail_ratio']:
+                    detail_start = time.perf_counter()
+                    try:
+                        status, _ = session.post_json('/source-detail/', {
+                            'source_type': source_type, 'source_id': worker_rng.choice(results)['id']
+                        })
+                    except Exception:
+                        status = 'exception'
+                    record('source_detail', time.perf_counter() - detail_start, status)
+
+        threads = [
+            threading.Thread(target=worker, args=(session, random.Random(options['seed'] + i)), daemon=True)
+            for i, session in enumerate(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+
+        wall_start = time.perf_counter()
+        scheduled = wall_start
+        for i in range(options['requests']):
+            if options['rate'] > 0:
+                # Poisson arrivals at the requested rate
+                scheduled += rng.expovariate(options['rate'])
+                work.put((scheduled, queries[i % len(queries)]))
+            else:
+                work.put((None, queries[i % len(queries)]))
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_start
+
+        total = sum(statuses.values())
+        errors = sum(count for status, count in statuses.items() if status != 200)
+        level = {
+            'concurrency': concurrency,
+            'requests': total,
+            'wall_s': wall,
+            'throughput_rps': total / wall if wall > 0 else 0.0,
+            'error_rate': errors / total if total else 0.0,
+            'statuses': {str(status): count for status, count in statuses.items()},
+        }
+        for endpoint, latencies in samples.items():
+            if latencies:
+                latencies_ms = np.asarray(latencies) * 1000
+                level[endpoint] = {
+                    'count': len(latencies),
+                    'p50_ms': float(np.percentile(latencies_ms, 50)),
+                    'p95_ms': float(np.percentile(latencies_ms, 95)),
+                    'p99_ms': float(np.percentile(latencies_ms, 99)),
+                    'max_ms': float(latencies_ms.max()),
+                }
+        return level
+
+    def backend_counts(self, options):
+        """search_backend_total per backend from the server's /metrics, or {} if unavailable
+
+        Counts come from whichever worker process answers the scrape.
+        """
+        try:
+            with urllib.request.urlopen(options['base_url'].rstrip('/') + '/metrics', timeout=5) as response:
+                text = response.read().decode('utf-8')
+        except Exception:
+            return {}
+        counts = {}
+        for match in re.finditer(r'^search_backend_total\{backend="([^"]+)"\} (\S+)$', text, re.MULTILINE):
+            counts[match.group(1)] = float(match.group(2))
+        return counts
+
+    def saturation_point(self, levels):
+        """Concurrency after which throughput stops growing (or errors appear)"""
+        for previous, level in zip(levels, levels[1:]):
+            if level['error_rate'] > 0.01 or level['throughput_rps'] < previous['throughput_rps'] * SATURATION_GAIN:
+                return previous['concurrency']
+        return None
+
+    def print_table(self, report):
+        header = (f'{"clients":>8}{"rps":>10}{"errors":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                  f'{"detail p95":>12}  backends')
+        self.stdout.write(f'Configuration: {report["label"]}')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for level in report['levels']:
+            search = level.get('search', {})
+            detail = level.get('source_detail', {})
+            backends = ', '.join(f'{name}={count:.0f}' for name, count in sorted(level['backends'].items()))
+            self.stdout.write(
+                f'{level["concurrency"]:>8}{level["throughput_rps"]:>10.1f}{level["error_rate"]:>8.1%} '
+                f'{search.get("p50_ms", 0):>10.1f}{search.get("p95_ms", 0):>10.1f}{search.get("p99_ms", 0):>10.1f}'
+                f'{detail.get("p95_ms", 0):>12.1f}  {backends or "-"}'
+            )
+        if report['saturation_concurrency'] is not None:
+            self.stdout.write(f'Throughput saturates at {report["saturation_concurrency"]} concurrent clients')
+        else:
+            self.stdout.write('No saturation within the tested concurrency levels')
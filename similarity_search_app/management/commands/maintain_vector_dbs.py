@@ -0,0 +1,261 @@
+import os
+import sqlite3
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app import corpus, generations, sharding
+
+
+# Columns that make two source rows the same document
+DUPLICATE_KEY = ', '.join(corpus.DOCUMENT_COLUMNS)
+
+MIN_PAGE_SIZE = 4096
+MAX_PAGE_SIZE = 65536
+
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def tuned_page_size(bytes_per_embedding):
+    """Smallest page size that keeps a typical embedding row off overflow pages
+
+    SQLite spills a row to overflow pages once it exceeds roughly a quarter of
+    the page, so aim for pages at least four times the average row.
+    """
+    page_size = MIN_PAGE_SIZE
+    while page_size < bytes_per_embedding * 4 and page_size < MAX_PAGE_SIZE:
+        page_size *= 2
+    return page_size
+
+
+class Command(BaseCommand):
+    help = 'Report vector database statistics and optionally clean, ANALYZE and compact them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type to maintain (repeatable, defaults to all)')
+        parser.add_argument('--fix', action='store_true',
+                            help='Delete duplicate documents, duplicate embeddings and orphaned embeddings')
+        parser.add_argument('--analyze', action='store_true', help='Run ANALYZE')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='VACUUM INTO a new generation with a tuned page size and activate it')
+        parser.add_argument('--page-size', type=int,
+                            help='Page size for --vacuum (default: tuned to the average embedding size)')
+        parser.add_argument('--keep-generations', type=int, default=2,
+                            help='Old generations kept on disk after --vacuum')
+
+    def handle(self, *args, **options):
+        if options['page_size'] and options['page_size'] not in [2 ** n for n in range(9, 17)]:
+            raise CommandError('--page-size must be a power of two between 512 and 65536')
+
+        source_types = options['source_types'] or list(settings.VECTOR_DATABASES.keys())
+        for source_type in source_types:
+            shards = [None] if not sharding.is_sharded(source_type) else range(sharding.shard_count(source_type))
+            for shard in shards:
+                label = source_type if shard is None else f'{source_type}[{shard}]'
+                db_path = generations.current_path(source_type, shard)
+                if not os.path.exists(db_path):
+                    self.stdout.write(self.style.WARNING(f'{label}: database not found, skipping'))
+                    continue
+                self.maintain(label, source_type, shard, db_path, options)
+
+    def maintain(self, label, source_type, shard, db_path, options):
+        stats = self.collect_stats(db_path)
+        self.stdout.write(self.style.SUCCESS(f'{label}: {os.path.basename(db_path)}'))
+        self.print_stats(stats)
+
+        if options['fix']:
+            removed = self.fix(db_path)
+            self.stdout.write(
+                f'  removed {removed["duplicate_documents"]} duplicate documents, '
+                f'{removed["orphaned_embeddings"]} orphaned and {removed["duplicate_embeddings"]} '
+                f'duplicate embeddings'
+            )
+
+        if options['analyze']:
+            conn = sqlite3.connect(db_path)
+            try:
+                start = time.perf_counter()
+                conn.execute("ANALYZE")
+                conn.commit()
+            finally:
+                conn.close()
+            self.stdout.write(f'  ANALYZE took {time.perf_counter() - start:.2f}s')
+
+        if options['vacuum']:
+            page_size = options['page_size'] or tuned_page_size(stats['bytes_per_embedding'])
+            before = self.scan_speed(db_path)
+            new_path = self.vacuum_into(source_type, shard, db_path, page_size, options)
+            if new_path is None:
+                return
+            after = self.scan_speed(new_path)
+            new_stats = self.collect_stats(new_path)
+            self.stdout.write(
+                f'  page size {stats["page_size"]} -> {page_size}, '
+                f'file {stats["file_mb"]:.1f}MB -> {new_stats["file_mb"]:.1f}MB, '
+                f'overflow pages {stats["overflow_pages"] or 0} -> {new_stats["overflow_pages"] or 0}'
+            )
+            self.stdout.write(
+                f'  full scan {before["ms"]:.1f}ms ({before["rows_per_s"]:.0f} rows/s) -> '
+                f'{after["ms"]:.1f}ms ({after["rows_per_s"]:.0f} rows/s)'
+            )
+
+    def collect_stats(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            stats = {
+                'file_mb': os.path.getsize(db_path) / (1024 * 1024),
+                'page_size': conn.execute("PRAGMA page_size").fetchone()[0],
+                'page_count': conn.execute("PRAGMA page_count").fetchone()[0],
+                'freelist_pages': conn.execute("PRAGMA freelist_count").fetchone()[0],
+                'source_rows': conn.execute("SELECT COUNT(*) FROM source_tbl").fetchone()[0],
+                'embedding_rows': conn.execute("SELECT COUNT(*) FROM embedding_tbl").fetchone()[0],
+                'bytes_per_embedding': conn.execute(
+                    "SELECT COALESCE(AVG(LENGTH(embedding_vect)), 0) FROM embedding_tbl"
+                ).fetchone()[0],
+                'orphaned_embeddings': conn.execute('''
+                    SELECT COUNT(*) FROM embedding_tbl e
+                    WHERE NOT EXISTS (SELECT 1 FROM source_tbl s WHERE s.id = e.source_id)
+                ''').fetchone()[0],
+                'missing_embeddings': conn.execute('''
+                    SELECT COUNT(*) FROM source_tbl s
+                    WHERE NOT EXISTS (SELECT 1 FROM embedding_tbl e WHERE e.source_id = s.id)
+                ''').fetchone()[0],
+                'duplicate_embeddings': conn.execute(
+                    "SELECT COUNT(*) - COUNT(DISTINCT source_id) FROM embedding_tbl"
+                ).fetchone()[0],
+                'duplicate_documents': conn.execute(f'''
+                    SELECT COALESCE(SUM(copies - 1), 0) FROM (
+                        SELECT COUNT(*) AS copies FROM source_tbl GROUP BY {DUPLICATE_KEY} HAVING copies > 1
+                    )
+                ''').fetchone()[0],
+                'tombstones': conn.execute("SELECT COUNT(*) FROM embedding_tombstone_tbl").fetchone()[0]
+                if table_exists(conn, 'embedding_tombstone_tbl') else 0,
+                'tables': None,
+                'overflow_pages': None,
+            }
+
+            # dbstat is an optional SQLite build feature
+            try:
+                stats['tables'] = {
+                    name: size for name, size in conn.execute(
+                        "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY SUM(pgsize) DESC"
+                    )
+                }
+                stats['overflow_pages'] = conn.execute(
+                    "SELECT COUNT(*) FROM dbstat WHERE pagetype = 'overflow'"
+                ).fetchone()[0]
+            except sqlite3.OperationalError:
+                pass
+        finally:
+            conn.close()
+        return stats
+
+    def print_stats(self, stats):
+        self.stdout.write(
+            f'  {stats["source_rows"]} documents, {stats["embedding_rows"]} embeddings, '
+            f'{stats["bytes_per_embedding"]:.0f} bytes per embedding'
+        )
+        self.stdout.write(
+            f'  {stats["file_mb"]:.1f}MB: {stats["page_count"]} pages of {stats["page_size"]} bytes, '
+            f'{stats["freelist_pages"]} free'
+            + (f', {stats["overflow_pages"]} overflow' if stats['overflow_pages'] is not None else '')
+        )
+        self.stdout.write(
+            f'  orphaned embeddings {stats["orphaned_embeddings"]}, '
+            f'documents without embedding {stats["missing_embeddings"]}, '
+            f'duplicate embeddings {stats["duplicate_embeddings"]}, '
+            f'duplicate documents {stats["duplicate_documents"]}, tombstones {stats["tombstones"]}'
+        )
+        if stats['tables']:
+            for name, size in stats['tables'].items():
+                self.stdout.write(f'    {name:<40}{size / 1024:>12.0f} KiB')
+
+    def fix(self, db_path):
+        """Delete duplicates and orphans in one transaction, leaving tombstones for memory indexes"""
+        conn = sqlite3.connect(db_path, timeout=30)
+        corpus.create_schema(conn)
+        removed = {}
+        try:
+            cursor = conn.cursor()
+            # Keep the oldest copy of each document
+            cursor.execute("DROP TABLE IF EXISTS temp.duplicate_source")
+            cursor.execute(f'''
+                CREATE TEMP TABLE duplicate_source AS
+                SELECT id FROM source_tbl WHERE id NOT IN (SELECT MIN(id) FROM source_tbl GROUP BY {DUPLICATE_KEY})
+            ''')
+            corpus.delete_embeddings(cursor, "source_id IN (SELECT id FROM temp.duplicate_source)")
+            if table_exists(conn, 'reduced_embedding_tbl'):
+                cursor.execute("DELETE FROM reduced_embedding_tbl WHERE source_id IN (SELECT id FROM temp.duplicate_source)")
+            cursor.execute("DELETE FROM source_tbl WHERE id IN (SELECT id FROM temp.duplicate_source)")
+            removed['duplicate_documents'] = cursor.rowcount
+
+            removed['orphaned_embeddings'] = corpus.delete_embeddings(
+                cursor, "NOT EXISTS (SELECT 1 FROM source_tbl s WHERE s.id = embedding_tbl.source_id)"
+            )
+            # Keep the newest embedding of each document
+            removed['duplicate_embeddings'] = corpus.delete_embeddings(
+                cursor, "id NOT IN (SELECT MAX(id) FROM embedding_tbl GROUP BY source_id)"
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return removed
+
+    def vacuum_into(self, source_type, shard, db_path, page_size, options):
+        """Compact db_path into a new generation with page_size; returns its path, or None if abandoned"""
+        new_path = generations.new_generation_path(source_type, shard)
+        token = generations.data_token(source_type)
+
+        conn = sqlite3.connect(db_path)
+        try:
+            # VACUUM INTO takes the page size of the source connection
+            conn.execute(f"PRAGMA page_size = {int(page_size)}")
+            start = time.perf_counter()
+            conn.execute("VACUUM INTO ?", (new_path,))
+        finally:
+            conn.close()
+        self.stdout.write(f'  VACUUM INTO {os.path.basename(new_path)} took {time.perf_counter() - start:.2f}s')
+
+        new_conn = sqlite3.connect(new_path)
+        try:
+            # A fresh file is loaded whole by memory indexes, so its tombstones are dead weight
+            if table_exists(new_conn, 'embedding_tombstone_tbl'):
+                new_conn.execute("DELETE FROM embedding_tombstone_tbl")
+                new_conn.commit()
+        finally:
+            new_conn.close()
+
+        try:
+            generations.validate_generation(new_path)
+        except generations.GenerationError as e:
+            self.stdout.write(self.style.ERROR(f'  compacted copy failed validation: {e}'))
+            os.remove(new_path)
+            return None
+
+        # Writes that landed during the copy would be lost by the swap
+        if generations.data_token(source_type) != token:
+            self.stdout.write(self.style.WARNING('  database changed during VACUUM INTO, not activating the copy'))
+            os.remove(new_path)
+            return None
+
+        generations.activate_generation(source_type, new_path, shard=shard)
+        generations.prune_generations(source_type, keep=options['keep_generations'], shard=shard)
+        return new_path
+
+    def scan_speed(self, db_path):
+        """Warm full scan of embedding_tbl as the fallback search reads it"""
+        conn = sqlite3.connect(db_path)
+        try:
+            # First pass warms the page cache so both files are compared fairly
+            conn.execute("SELECT source_id, embedding_vect FROM embedding_tbl").fetchall()
+            start = time.perf_counter()
+            rows = len(conn.execute("SELECT source_id, embedding_vect FROM embedding_tbl").fetchall())
+            elapsed = time.perf_counter() - start
+        finally:
+            conn.close()
+        return {'ms': elapsed * 1000, 'rows_per_s': rows / elapsed if elapsed > 0 else 0.0}
@@ -1,20 +1,41 @@
 import os
 import sqlite3
 import json
-from django.core.management.base import BaseCommand
+import zlib
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from sentence_transformers import SentenceTransformer
+from similarity_search_app import corpus, generations, neighbors, reduction, sharding
+from similarity_search_app.vector_utils import VectorSearchManager
 
 
 class Command(BaseCommand):
     help = 'Setup vector databases and populate with sample data'
 
-    def __init__(self):
-        super().__init__()
-        self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoder = None
         self.sqlite_vec_available = False
 
+    def add_arguments(self, parser):
+        parser.add_argument('--in-place', action='store_true',
+                            help='Append to the live database files instead of building a new generation')
+        parser.add_argument('--keep-generations', type=int, default=2,
+                            help='Old generations kept on disk after a swap')
+        parser.add_argument('--synthetic', type=int, metavar='ROWS',
+                            help='Generate ROWS clustered synthetic documents per source instead of '
+                                 'encoding the sample data (no model inference)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for --synthetic')
+        parser.add_argument('--clusters', type=int, default=256, help='Embedding clusters for --synthetic')
+        parser.add_argument('--real-fraction', type=float, default=0.0,
+                            help='Share of --synthetic cluster centres taken from the live database\'s embeddings')
+
     def handle(self, *args, **options):
+        if options['synthetic'] and options['in_place']:
+            raise CommandError('--synthetic writes a new generation and cannot be combined with --in-place')
+
+        # Encodes through the shared embedding service when one is running
+        self.encoder = VectorSearchManager()
+
         # Check sqlite-vec availability
         self.sqlite_vec_available = self._check_sqlite_vec_availability()
 
@@ -34,10 +55,67 @@ class Command(BaseCommand):
         source_types = ['ADMIN', 'IT', 'FINANCE', 'HR']
 
         for source_type in source_types:
-            self.stdout.write(f'Setting up {source_type} database...')
-            self.setup_database(source_type)
-            self.stdout.write(f'Populating {source_type} database with sample data...')
-            self.populate_sample_data(source_type)
+            # Sharded sources are always built whole and then split, since
+            # shard membership decides each row's id
+            sharded = sharding.is_sharded(source_type)
+            in_place = options['in_place'] and not sharded
+            if in_place:
+                db_path = generations.current_path(source_type)
+            else:
+                # Build off to the side; readers keep using the live generation
+                db_path = generations.new_generation_path(source_type)
+
+            if options['synthetic']:
+                # The generator creates its own schema in a fresh file
+                self.stdout.write(f'Generating {source_type} database with synthetic data...')
+                self.populate_synthetic_data(source_type, db_path, options['synthetic'], options)
+            else:
+                self.stdout.write(f'Setting up {source_type} database...')
+                self.setup_database(source_type, db_path)
+                self.stdout.write(f'Populating {source_type} database with sample data...')
+                self.populate_sample_data(source_type, db_path)
+
+            if not in_place:
+                try:
+                    rows = generations.validate_generation(db_path, expected_dim=384)
+                except generations.GenerationError as e:
+                    self.stdout.write(self.style.ERROR(f'{source_type} generation failed validation: {e}'))
+                    continue
+
+                if sharded:
+                    # A shard's neighbor lists would be incomplete, so only projections carry over
+                    def prepare(shard, conn, source_type=source_type):
+                        self.carry_over_indexes(f'{source_type}[{shard}]', conn,
+                                                generations.current_path(source_type, shard), with_neighbors=False)
+
+                    try:
+                        written = sharding.split_into_shards(source_type, db_path, options['keep_generations'],
+                                                             prepare=prepare)
+                    except generations.GenerationError as e:
+                        self.stdout.write(self.style.ERROR(f'{source_type} shards failed validation: {e}'))
+                        continue
+                    finally:
+                        generations.remove_generation(db_path)
+                    self.stdout.write(f'Split {rows} rows into {len(written)} shards: {written}')
+                else:
+                    conn = sqlite3.connect(db_path)
+                    try:
+                        self.carry_over_indexes(source_type, conn, generations.current_path(source_type))
+                        failure = None
+                    except sqlite3.Error as e:
+                        failure = e
+                    finally:
+                        conn.close()
+                    if failure is not None:
+                        self.stdout.write(self.style.ERROR(f'{source_type} indexes could not be rebuilt: {failure}'))
+                        generations.remove_generation(db_path)
+                        continue
+                    generations.activate_generation(source_type, db_path)
+                    removed = generations.prune_generations(source_type, keep=options['keep_generations'])
+                    self.stdout.write(
+                        f'Activated {os.path.basename(db_path)} ({rows} rows), pruned {len(removed)} old generations'
+                    )
+
             self.stdout.write(self.style.SUCCESS(f'{source_type} database setup complete!'))
 
     def _check_sqlite_vec_availability(self):
@@ -61,36 +139,13 @@ class Command(BaseCommand):
         except:
             return False
 
-    def setup_database(self, source_type):
+    def setup_database(self, source_type, db_path):
         """Create database tables for a source type"""
-        db_path = settings.VECTOR_DATABASES[source_type]
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
-        # Create source table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS source_tbl (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                source_text TEXT NOT NULL,
-                category TEXT,
-                created_date TEXT,
-                author TEXT,
-                department TEXT,
-                priority TEXT,
-                status TEXT
-            )
-        ''')
-
-        # Create embedding table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS embedding_tbl (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                source_id INTEGER,
-                embedding_vect TEXT,
-                metadata TEXT,
-                FOREIGN KEY (source_id) REFERENCES source_tbl (id)
-            )
-        ''')
+        # Same tables, tombstones included, as every other writer creates
+        corpus.create_schema(conn)
 
         # Only try to create vector index if sqlite-vec is available
         if self.sqlite_vec_available:
@@ -111,9 +166,8 @@ class Command(BaseCommand):
         conn.commit()
         conn.close()
 
-    def populate_sample_data(self, source_type):
+    def populate_sample_data(self, source_type, db_path):
         """Populate database with sample data"""
-        db_path = settings.VECTOR_DATABASES[source_type]
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
@@ -126,6 +180,14 @@ class Command(BaseCommand):
         for i in range(0, len(sample_data), batch_size):
             batch = sample_data[i:i + batch_size]
 
+            # Encode the whole batch in one call before writing anything, so a
+            # failed batch leaves no source rows without embeddings behind
+            try:
+                embeddings = self.encoder.encode_texts([item['source_text'] for item in batch])
+            except Exception as e:
+                self.stdout.write(f'Error generating embeddings for batch {i // batch_size + 1}, skipping it: {str(e)}')
+                continue
+
             # Insert source records one by one to track IDs reliably
             source_ids = []
             for item in batch:
@@ -143,111 +205,90 @@ class Command(BaseCommand):
                 ))
                 source_ids.append(cursor.lastrowid)
 
-            # Generate embeddings and insert
             embedding_records = []
-            for idx, item in enumerate(batch):
-                source_id = source_ids[idx]
-                try:
-                    embedding = self.model.encode(item['source_text'])
-                    metadata = {
-                        'category': item['category'],
-                        'department': item['department'],
-                        'priority': item['priority']
-                    }
-
-                    embedding_records.append((
-                        source_id,
-                        json.dumps(embedding.tolist()),
-                        json.dumps(metadata)
-                    ))
-                except Exception as e:
-                    self.stdout.write(f'Error generating embedding for record {source_id}: {str(e)}')
-                    continue
+            for source_id, item, embedding in zip(source_ids, batch, embeddings):
+                metadata = {
+                    'category': item['category'],
+                    'department': item['department'],
+                    'priority': item['priority']
+                }
+
+                embedding_records.append((
+                    source_id,
+                    json.dumps(embedding),
+                    json.dumps(metadata)
+                ))
 
-            if embedding_records:
-                cursor.executemany('''
-                    INSERT INTO embedding_tbl (source_id, embedding_vect, metadata)
-                    VALUES (?, ?, ?)
-                ''', embedding_records)
+            cursor.executemany('''
+                INSERT INTO embedding_tbl (source_id, embedding_vect, metadata)
+                VALUES (?, ?, ?)
+            ''', embedding_records)
 
             conn.commit()
             self.stdout.write(f'Inserted batch {i // batch_size + 1} for {source_type}')
 
+        self.update_reduced_index(source_type, conn)
         conn.close()
 
+    def populate_synthetic_data(self, source_type, db_path, rows, options):
+        """Write `rows` generated documents without running the model"""
+        corpus.build_synthetic_corpus(
+            db_path, rows, source_type,
+            seed=options['seed'] + zlib.crc32(source_type.encode('utf-8')),
+            clusters=options['clusters'],
+            real_source_path=sharding.shard_paths(source_type)[0],
+            real_fraction=options['real_fraction'],
+        )
+        self.stdout.write(f'Generated {rows} synthetic rows for {source_type}')
+
+        conn = sqlite3.connect(db_path)
+        try:
+            self.update_reduced_index(source_type, conn)
+        finally:
+            conn.close()
+
+    def update_reduced_index(self, source_type, conn):
+        """Keep reduced vectors for two-stage search in step with new rows"""
+        projection = reduction.Projection.load(conn)
+        if projection is not None:
+            indexed = reduction.index_reduced_vectors(conn, projection, only_missing=True)
+            self.stdout.write(f'Indexed {indexed} reduced vectors for {source_type}')
+        elif generations.source_config(source_type)['backend'] == 'two_stage':
+            projection, indexed = reduction.build_reduced_index(conn, settings.VECTOR_SEARCH_PCA_DIM)
+            self.stdout.write(f'Trained PCA projection and indexed {indexed} reduced vectors for {source_type}')
+
+    def live_indexes(self, live_path):
+        """(projection dim, neighbors per document) of the live generation, None for each it lacks"""
+        if not os.path.exists(live_path):
+            return None, None
+        conn = generations.connect_readonly(live_path)
+        try:
+            projection = reduction.Projection.load(conn)
+            try:
+                depth = conn.execute("SELECT MAX(rank) + 1 FROM neighbor_tbl").fetchone()[0]
+            except sqlite3.OperationalError:
+                depth = None
+        finally:
+            conn.close()
+        return (projection.dim if projection is not None else None), depth
+
+    def carry_over_indexes(self, label, conn, live_path, with_neighbors=True):
+        """Build the PCA projection and neighbor table the live generation has into a new one before the swap"""
+        dim, depth = self.live_indexes(live_path)
+        if dim and reduction.Projection.load(conn) is None:
+            _, indexed = reduction.build_reduced_index(conn, dim)
+            self.stdout.write(f'Trained {dim}-d PCA projection and indexed {indexed} reduced vectors for {label}')
+        if depth and with_neighbors:
+            count = neighbors.build_neighbor_table(conn, neighbors=depth)
+            self.stdout.write(f'Stored {depth} neighbors for {count} documents in {label}')
+
     def generate_sample_data(self, source_type):
         """Generate sample data for each source type"""
         import random
         from datetime import datetime, timedelta
 
-        base_data = {
-            'ADMIN': [
-                "Company policy update regarding remote work procedures",
-                "New employee onboarding checklist and requirements",
-                "Office security protocols and access card management",
-                "Meeting room booking system guidelines",
-                "Corporate communication standards and email etiquette",
-                "Expense reporting procedures and approval workflow",
-                "Document management system usage instructions",
-                "Visitor management and registration process",
-                "Emergency evacuation procedures and safety protocols",
-                "Equipment procurement and asset management guidelines"
-            ],
-            'IT': [
-                "Network security best practices and password policies",
-                "Software installation and license management procedures",
-                "Database backup and recovery protocols",
-                "System monitoring and performance optimization",
-                "Cybersecurity incident response procedures",
-                "Cloud infrastructure management guidelines",
-                "API documentation and integration standards",
-                "Code review and deployment procedures",
-                "Server maintenance and update schedules",
-                "Help desk ticketing system workflow"
-            ],
-            'FINANCE': [
-                "Budget planning and allocation procedures",
-                "Invoice processing and payment authorization",
-                "Financial reporting and compliance requirements",
-                "Audit preparation and documentation standards",
-                "Cost center management and tracking",
-                "Revenue recognition and accounting principles",
-                "Tax filing and regulatory compliance procedures",
-                "Cash flow management and forecasting",
-                "Vendor payment terms and contract management",
-                "Financial risk assessment and mitigation strategies"
-            ],
-            'HR': [
-                "Employee performance review and evaluation process",
-                "Recruitment and hiring procedures",
-                "Benefits enrollment and administration",
-                "Training and development program guidelines",
-                "Disciplinary action and grievance procedures",
-                "Leave management and time-off policies",
-                "Compensation and salary review process",
-                "Employee engagement and satisfaction surveys",
-                "Workplace diversity and inclusion initiatives",
-                "Exit interview and offboarding procedures"
-            ]
-        }
-
-        categories = {
-            'ADMIN': ['Policy', 'Procedure', 'Guidelines', 'Standards'],
-            'IT': ['Security', 'Development', 'Infrastructure', 'Support'],
-            'FINANCE': ['Accounting', 'Compliance', 'Planning', 'Reporting'],
-            'HR': ['Recruitment', 'Performance', 'Benefits', 'Training']
-        }
-
-        authors = [
-            'John Smith', 'Sarah Johnson', 'Michael Brown', 'Emily Davis',
-            'David Wilson', 'Lisa Anderson', 'Robert Taylor', 'Jennifer Martinez'
-        ]
-
-        priorities = ['High', 'Medium', 'Low']
-        statuses = ['Active', 'Draft', 'Under Review', 'Archived']
-
         sample_data = []
-        base_texts = base_data[source_type]
+        base_texts = corpus.SAMPLE_TEXTS[source_type]
 
         # Generate 1000+ records by expanding base data
         for i in range(1000):
@@ -275,12 +316,12 @@ class Command(BaseCommand):
 
             sample_data.append({
                 'source_text': source_text,
-                'category': random.choice(categories[source_type]),
+                'category': random.choice(corpus.CATEGORIES[source_type]),
                 'created_date': random_date.strftime('%Y-%m-%d'),
-                'author': random.choice(authors),
+                'author': random.choice(corpus.AUTHORS),
                 'department': source_type,
-                'priority': random.choice(priorities),
-                'status': random.choice(statuses)
+                'priority': random.choice(corpus.PRIORITIES),
+                'status': random.choice(corpus.STATUSES)
             })
 
         return sample_data
\ No newline at end of file
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from similarity_search_app.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = ('Read the vector databases into the OS page cache and pre-run the most frequent logged queries. '
+            'Embedding caches live in each worker, so set SEARCH_WARMUP_ON_START to warm those at startup.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-type', action='append', dest='source_types',
+                            help='Source type to warm (repeatable, defaults to all)')
+        parser.add_argument('--top', type=int, default=getattr(settings, 'SEARCH_WARMUP_QUERIES', 50),
+                            help='Most frequent logged queries run per source type (0 only touches pages)')
+
+    def handle(self, *args, **options):
+        unknown = [st for st in options['source_types'] or [] if st not in settings.VECTOR_DATABASES]
+        if unknown:
+            raise CommandError(f'Unknown source types: {", ".join(unknown)}')
+
+        report = warm_up(per_source=options['top'], source_types=options['source_types'])
+        for source_type, stats in report.items():
+            self.stdout.write(self.style.SUCCESS(
+                f'{source_type}: read {stats["bytes"] / (1024 * 1024):.1f}MB, encoded {stats["encoded"]} and '
+                f'ran {stats["searched"]} logged queries in {stats["seconds"]:.2f}s'
+            ))
@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from . import reduction
+
+logger = logging.getLogger(__name__)
+
+# Files of a saved index, as suffixes of the database path (the same naming
+# as generations.sidecar_path, so they are pruned with their generation)
+SNAPSHOT_SUFFIXES = {
+    'manifest': 'snapshot.json',
+    'ids': 'snapshot-ids.npy',
+    'embedding_ids': 'snapshot-embedding_ids.npy',
+    'matrix': 'snapshot-matrix.npy',
+}
+SNAPSHOT_VERSION = 1
+
+
+# Immutable view of an index; refreshes build a new one and swap it in, so a
+# query keeps a consistent snapshot without taking any lock
+Snapshot = namedtuple('Snapshot', 'ids embedding_ids matrix')
+
+EMPTY_SNAPSHOT = Snapshot(
+    np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+)
+
+
+def file_state(db_path):
+    """Size and mtime of a database and its WAL; changes on every commit"""
+    state = []
+    for candidate in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(candidate)
+        except FileNotFoundError:
+            state.append(None)
+            continue
+        state.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    return tuple(state)
+
+
+def snapshot_files(db_path):
+    """Paths of the saved-index files that belong to db_path"""
+    return {name: f'{db_path}.{suffix}' for name, suffix in SNAPSHOT_SUFFIXES.items()}
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+class MemoryIndex:
+    """Row-normalised embedding matrix of one database file, refreshed incrementally
+
+    The index remembers the highest embedding_tbl.id it has loaded and the
+    last embedding_tombstone_tbl.seq it has applied. A refresh appends rows
+    above the watermark and drops tombstoned ones; it only reloads everything
+    when the file was rebuilt underneath it (ids went backwards).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.snapshot = EMPTY_SNAPSHOT
+        self.watermark = 0
+        self.tombstone_seq = 0
+        # Names the data the snapshot holds; set after the snapshot is swapped in
+        self.version = None
+        self.last_used = time.monotonic()
+        self._file_state = None
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Bring the index up to date; returns (rows added, rows removed)"""
+        with self._refresh_lock:
+            state = file_state(self.db_path)
+            if state == self._file_state and not force:
+                return 0, 0
+
+            conn = sqlite3.connect(self.db_path)
+            try:
+                # One read transaction, so tombstones and new rows come from the same state
+                conn.execute("BEGIN")
+                max_id = conn.execute("SELECT MAX(id) FROM embedding_tbl").fetchone()[0] or 0
+                snapshot = self.snapshot
+                watermark = self.watermark
+                tombstone_seq = self.tombstone_seq
+                if max_id < watermark:
+                    logger.info("%s was rebuilt, reloading its memory index", self.db_path)
+                    snapshot, watermark, tombstone_seq = EMPTY_SNAPSHOT, 0, 0
+
+                removed = np.empty(0, dtype=np.int64)
+                has_tombstones = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embedding_tombstone_tbl'"
+                ).fetchone()
+                if has_tombstones:
+                    if watermark == 0:
+                        # A full load never contains deleted rows; start after the log's end
+                        tombstone_seq = conn.execute(
+                            "SELECT COALESCE(MAX(seq), 0) FROM embedding_tombstone_tbl"
+                        ).fetchone()[0]
+                    else:
+                        rows = conn.execute(
+                            "SELECT seq, embedding_id FROM embedding_tombstone_tbl WHERE seq > ? ORDER BY seq",
+                            (tombstone_seq,)
+                        ).fetchall()
+                        if rows:
+                            tombstone_seq = rows[-1][0]
+                            removed = np.asarray([embedding_id for _, embedding_id in rows], dtype=np.int64)
+
+                ids = []
+                embedding_ids = []
+                vectors = []
+                for embedding_id, source_id, embedding_vect in conn.execute(
+                    "SELECT id, source_id, embedding_vect FROM embedding_tbl WHERE id > ? ORDER BY id",
+                    (watermark,)
+                ):
+                    try:
+                        vectors.append(reduction.decode_vector(embedding_vect))
+                    except (ValueError, TypeError):
+                        continue
+                    ids.append(source_id)
+                    embedding_ids.append(embedding_id)
+            finally:
+                conn.close()
+
+            keep = ~np.isin(snapshot.embedding_ids, removed) if len(removed) else None
+            if keep is not None and not keep.all():
+                snapshot = Snapshot(snapshot.ids[keep], snapshot.embedding_ids[keep], snapshot.matrix[keep])
+            removed_count = 0 if keep is None else int((~keep).sum())
+
+            if vectors:
+                added = _normalise(np.vstack(vectors))
+                snapshot = Snapshot(
+                    np.concatenate([snapshot.ids, np.asarray(ids, dtype=np.int64)]),
+                    np.concatenate([snapshot.embedding_ids, np.asarray(embedding_ids, dtype=np.int64)]),
+                    np.vstack([snapshot.matrix, added]) if len(snapshot.matrix) else added,
+                )
+
+            self.snapshot = snapshot
+            self.watermark = max(watermark, max_id)
+            self.tombstone_seq = tombstone_seq
+            self._file_state = state
+            self.version = self._version()
+            return len(vectors), removed_count
+
+    def _version(self):
+        return f'{self.watermark}:{self.tombstone_seq}:{len(self.snapshot.ids)}'
+
+    def save(self, files=None):
+        """Write the current snapshot as .npy arrays plus a JSON manifest; returns the manifest
+
+        `files` maps the names in SNAPSHOT_SUFFIXES to paths and defaults to
+        the files next to the database. The manifest is written last, so a
+        reader never sees it with arrays from an earlier save.
+        """
+        files = files or snapshot_files(self.db_path)
+        with self._refresh_lock:
+            snapshot, watermark, tombstone_seq = self.snapshot, self.watermark, self.tombstone_seq
+
+        for name in ('ids', 'embedding_ids', 'matrix'):
+            temp = f'{files[name]}.tmp-{os.getpid()}.npy'
+            np.save(temp, np.ascontiguousarray(getattr(snapshot, name)))
+            os.replace(temp, files[name])
+
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'rows': len(snapshot.ids),
+            'dim': snapshot.matrix.shape[1] if len(snapshot.ids) else 0,
+            'watermark': watermark,
+            'tombstone_seq': tombstone_seq,
+        }
+        temp = f'{files["manifest"]}.tmp-{os.getpid()}'
+        with open(temp, 'w') as handle:
+            json.dump(manifest, handle)
+        os.replace(temp, files['manifest'])
+        return manifest
+
+    def load_saved(self):
+        """Start from the index saved next to the database; returns whether one was used
+
+        The arrays are memory-mapped, so this costs little more than reading
+        the manifest; the next refresh only has to apply what changed since
+        the save. A saved index whose row count up to its watermark does not
+        match the database is ignored.
+        """
+        files = snapshot_files(self.db_path)
+        try:
+            with open(files['manifest']) as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            return False
+        if manifest.get('version') != SNAPSHOT_VERSION:
+            logger.warning("Ignoring saved index for %s: unsupported version %s", self.db_path, manifest.get('version'))
+            return False
+
+        try:
+            arrays = {name: np.load(files[name], mmap_mode='r') for name in ('ids', 'embedding_ids', 'matrix')}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring saved index for %s: %s", self.db_path, e)
+            return False
+        if any(len(array) != manifest['rows'] for array in arrays.values()):
+            logger.warning("Ignoring saved index for %s: arrays do not match its manifest", self.db_path)
+            return False
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("BEGIN")
+            live = conn.execute(
+                "SELECT COUNT(*) FROM embedding_tbl WHERE id <= ?", (manifest['watermark'],)
+            ).fetchone()[0]
+            deleted = 0
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embedding_tombstone_tbl'"
+            ).fetchone():
+                deleted = conn.execute(
+                    "SELECT COUNT(*) FROM embedding_tombstone_tbl WHERE seq > ? AND embedding_id <= ?",
+                    (manifest['tombstone_seq'], manifest['watermark'])
+                ).fetchone()[0]
+        finally:
+            conn.close()
+        if live != manifest['rows'] - deleted:
+            logger.warning("Ignoring saved index for %s: it does not match the database", self.db_path)
+            return False
+
+        with self._refresh_lock:
+            self.snapshot = Snapshot(arrays['ids'], arrays['embedding_ids'], arrays['matrix'])
+            self.watermark = manifest['watermark']
+            self.tombstone_seq = manifest['tombstone_seq']
+            self._file_state = None
+            self.version = self._version()
+        return True
+
+    def search(self, query_embedding, limit):
+        """Top (source_id, distance) pairs by cosine distance over the current snapshot"""
+        self.last_used = time.monotonic()
+        snapshot = self.snapshot
+        if len(snapshot.ids) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        similarities = snapshot.matrix @ (query / norm)
+        return [(int(snapshot.ids[i]), 1 - float(similarities[i])) for i in reduction.top_k(similarities, limit)]
+
+
+class ReducedMatrixCache:
+    """Projection and reduced vectors per database file, reloaded only when the file changes
+
+    Saves two_stage searches from reading all of reduced_embedding_tbl on
+    every query. Entries are immutable tuples swapped in whole, like
+    MemoryIndex snapshots.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, db_path, conn):
+        """(projection, (ids, matrix)) for db_path, read through conn when stale; projection may be None"""
+        # Taken before reading, so a commit landing meanwhile triggers a reload next time
+        state = file_state(db_path)
+        cached = self._entries.get(db_path)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
+        projection = reduction.Projection.load(conn)
+        reduced = reduction.load_reduced_matrix(conn) if projection is not None else None
+        with self._lock:
+            # Forget generations that have been pruned since
+            for path in [path for path in self._entries if path != db_path and not os.path.exists(path)]:
+                del self._entries[path]
+            self._entries[db_path] = (state, (projection, reduced))
+        return projection, reduced
+
+
+class MemoryIndexRegistry:
+    """Memory indexes by database path, kept fresh by one background thread"""
+
+    def __init__(self, refresh_seconds=5.0, idle_seconds=600.0):
+        self.refresh_seconds = refresh_seconds
+        self.idle_seconds = idle_seconds
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self, db_path):
+        """Index for db_path; the first call per path loads it synchronously"""
+        index = self._indexes.get(db_path)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(db_path)
+                if index is None:
+                    index = MemoryIndex(db_path)
+                    index.load_saved()
+                    index.refresh()
+                    self._indexes[db_path] = index
+                    self._start()
+        index.last_used = time.monotonic()
+        return index
+
+    def peek(self, db_path):
+        """Index for db_path if it is already loaded, else None"""
+        return self._indexes.get(db_path)
+
+    def version(self, db_path):
+        """MemoryIndex.version of db_path's index, or None if it is not loaded"""
+        index = self._indexes.get(db_path)
+        return index.version if index is not None else None
+
+    def total_bytes(self, exclude=None):
+        """Memory held by loaded matrices, optionally leaving one path out"""
+        return sum(index.snapshot.matrix.nbytes for path, index in list(self._indexes.items()) if path != exclude)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='memory-index-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            self.refresh_all()
+
+    def refresh_all(self):
+        """Refresh every index, dropping those whose file is gone or that sit unused"""
+        now = time.monotonic()
+        for db_path, index in list(self._indexes.items()):
+            if not os.path.exists(db_path) or now - index.last_used > self.idle_seconds:
+                with self._lock:
+                    self._indexes.pop(db_path, None)
+                continue
+            try:
+                added, removed = index.refresh()
+            except Exception as e:
+                logger.warning("Refreshing memory index for %s failed: %s", db_path, e)
+                continue
+            if added or removed:
+                logger.info("Memory index %s: +%d -%d rows", db_path, added, removed)
@@ -0,0 +1,140 @@
+import threading
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """Process-local counters, gauges and histograms rendered in Prometheus text format
+
+    Each worker process keeps its own registry, so a scrape reflects the
+    worker that served it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name, metric_type, help_text):
+        self._types[name] = metric_type
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': buckets,
+                    'counts': [0] * len(buckets),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def get(self, name, **labels):
+        """Current value of a counter or gauge (0 if never set)"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            series = {}
+            for (name, labels), value in self._counters.items():
+                series.setdefault(name, []).append((name, labels, value))
+            for (name, labels), value in self._gauges.items():
+                series.setdefault(name, []).append((name, labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                samples = series.setdefault(name, [])
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    samples.append((f'{name}_bucket', labels + (('le', _format_value(bound)),), count))
+                samples.append((f'{name}_bucket', labels + (('le', '+Inf'),), histogram['count']))
+                samples.append((f'{name}_sum', labels, histogram['sum']))
+                samples.append((f'{name}_count', labels, histogram['count']))
+
+        lines = []
+        for name in sorted(series):
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            if name in self._types:
+                lines.append(f'# TYPE {name} {self._types[name]}')
+            for sample_name, labels, value in series[name]:
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+registry.describe('search_requests_total', 'counter', 'Search requests served, by endpoint and status')
+registry.describe('search_stage_seconds', 'histogram', 'Time spent per search stage')
+registry.describe('search_request_seconds', 'histogram', 'End-to-end view latency')
+registry.describe('search_backend_total', 'counter', 'Searches served, by backend')
+registry.describe('search_fallback_total', 'counter', 'Fallbacks from a preferred backend, by reason')
+registry.describe('embedding_cache_hits_total', 'counter', 'Query embeddings served from the in-process cache')
+registry.describe('embedding_cache_misses_total', 'counter', 'Query embeddings computed by the model')
+registry.describe('ingest_jobs_enqueued_total', 'counter', 'Documents queued through /ingest/')
+registry.describe('search_node_requests_total', 'counter', 'Requests to remote search nodes, by node and outcome')
+registry.describe('search_node_retries_total', 'counter', 'Extra replica requests, by reason (hedge or error)')
+registry.describe('search_partial_total', 'counter', 'Scatter-gather searches missing at least one node group')
+registry.describe('search_degraded_total', 'counter', 'Searches degraded to meet a deadline, by reason')
+registry.describe('admission_active', 'gauge', 'Requests holding an admission slot, by gate')
+registry.describe('admission_queued', 'gauge', 'Requests waiting for an admission slot, by gate')
+registry.describe('admission_rejected_total', 'counter', 'Requests shed by admission control, by gate and reason')
+registry.describe('admission_wait_seconds', 'histogram', 'Time spent waiting for an admission slot, by gate')
+registry.describe('ingest_queue_jobs', 'gauge', 'Ingestion jobs by status at the last status query')
+
+
+def record_stages(timer, endpoint):
+    """Feed a StageTimer's per-stage durations into the stage histogram"""
+    for stage, seconds in timer.stages.items():
+        registry.observe('search_stage_seconds', seconds, endpoint=endpoint, stage=stage)
+
+
+def server_timing_header(timer, total=None):
+    """Build a Server-Timing header value (durations in milliseconds)"""
+    entries = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timer.stages.items()]
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
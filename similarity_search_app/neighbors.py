@@ -0,0 +1,117 @@
+import numpy as np
+from . import reduction
+
+
+def ensure_neighbor_table(conn, table='neighbor_tbl'):
+    """Create neighbor_tbl holding each document's precomputed nearest neighbors"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            source_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            PRIMARY KEY (source_id, rank)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def build_neighbor_table(conn, neighbors=25, block_size=1024):
+    """Compute top-N cosine neighbors for every row with blocked matrix products
+
+    Only a (block_size x rows) similarity block is held in memory at a time.
+    Lists are written to neighbor_tbl_new and renamed over neighbor_tbl in one
+    transaction, so readers see either the old table or the complete new one.
+    Returns the number of documents processed.
+    """
+    ids, matrix = reduction.load_full_matrix(conn)
+    if len(ids) == 0:
+        return 0
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    normalized = matrix / norms
+    neighbors = min(neighbors, len(ids) - 1)
+
+    conn.execute("DROP TABLE IF EXISTS neighbor_tbl_new")
+    ensure_neighbor_table(conn, 'neighbor_tbl_new')
+
+    for start in range(0, len(ids), block_size):
+        block = normalized[start:start + block_size]
+        similarities = block @ normalized.T
+
+        # A document is not its own neighbor
+        rows = np.arange(len(block))
+        similarities[rows, start + rows] = -np.inf
+
+        records = []
+        for row_index, row in enumerate(similarities):
+            source_id = int(ids[start + row_index])
+            for rank, column in enumerate(reduction.top_k(row, neighbors)):
+                records.append((source_id, rank, int(ids[column]), float(row[column])))
+
+        conn.executemany(
+            "INSERT INTO neighbor_tbl_new (source_id, rank, neighbor_id, similarity) VALUES (?, ?, ?, ?)",
+            records
+        )
+        conn.commit()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS neighbor_tbl")
+        conn.execute("ALTER TABLE neighbor_tbl_new RENAME TO neighbor_tbl")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(ids)
+
+
+def invalidate(conn, source_ids):
+    """Drop the neighbor lists of source_ids and every entry pointing at them
+
+    Called before those documents are rewritten; more_like_this searches live
+    for any list left missing or short until the table is rebuilt.
+    """
+    source_ids = list(source_ids)
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'neighbor_tbl'"
+    ).fetchone()
+    if not exists or not source_ids:
+        return 0
+    placeholders = ','.join('?' * len(source_ids))
+    cursor = conn.execute(
+        f"DELETE FROM neighbor_tbl WHERE source_id IN ({placeholders}) OR neighbor_id IN ({placeholders})",
+        source_ids + source_ids
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+def load_neighbors(conn, source_id, limit):
+    """Precomputed (neighbor_id, similarity) pairs for source_id, or None if not built
+
+    Also None when fewer than limit pairs are stored, either because the table
+    was built shallower or because invalidate() removed entries from the list.
+    """
+    try:
+        rows = conn.execute('''
+            SELECT neighbor_id, similarity FROM neighbor_tbl
+            WHERE source_id = ? AND rank < ?
+            ORDER BY rank
+        ''', (source_id, limit)).fetchall()
+    except Exception:
+        return None
+    if len(rows) < limit:
+        return None
+    return rows
+
+
+def load_embedding(conn, source_id):
+    """Stored embedding for source_id as a list, or None"""
+    row = conn.execute(
+        "SELECT embedding_vect FROM embedding_tbl WHERE source_id = ?", (source_id,)
+    ).fetchone()
+    if row is None or row[0] is None:
+        return None
+    return reduction.decode_vector(row[0]).tolist()
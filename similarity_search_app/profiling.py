@@ -0,0 +1,108 @@
+import cProfile
+import io
+import itertools
+import pstats
+import threading
+import time
+from collections import deque
+from functools import wraps
+from django.conf import settings
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+
+_profiles = deque(maxlen=getattr(settings, 'PROFILE_RING_SIZE', 50))
+_profiles_lock = threading.Lock()
+_ids = itertools.count(1)
+
+# cProfile cannot run two profilers at once, so only one request is profiled at a time
+_profiler_lock = threading.Lock()
+
+
+def _profiling_requested(request):
+    """Staff users opt in per request via X-Profile header or ?profile=1"""
+    flag = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)
+    if not flag or flag in ('0', 'false'):
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def _top_functions(profiler, limit):
+    """Top functions by cumulative time as a list of dicts"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats('cumulative')
+    functions = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, total_calls, total_time, cumulative_time, _ = stats.stats[func]
+        filename, line, name = func
+        functions.append({
+            'function': f'{filename}:{line}({name})',
+            'calls': total_calls,
+            'primitive_calls': primitive_calls,
+            'tottime': round(total_time, 6),
+            'cumtime': round(cumulative_time, 6),
+        })
+    return functions
+
+
+def profile_on_demand(endpoint):
+    """Wrap a view in cProfile when a staff user asks for it
+
+    The profile summary is kept in a bounded ring buffer and its id is
+    returned in the X-Profile-Id response header. Requests that do not ask
+    for profiling only pay for one header lookup.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _profiling_requested(request):
+                return view(request, *args, **kwargs)
+
+            if not _profiler_lock.acquire(blocking=False):
+                response = view(request, *args, **kwargs)
+                response['X-Profile'] = 'busy'
+                return response
+
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                response = profiler.runcall(view, request, *args, **kwargs)
+            finally:
+                _profiler_lock.release()
+            elapsed = time.perf_counter() - started
+
+            profile_id = next(_ids)
+            record = {
+                'id': profile_id,
+                'endpoint': endpoint,
+                'path': request.path,
+                'user': str(request.user),
+                'timestamp': time.time(),
+                'duration_ms': round(elapsed * 1000, 3),
+                'status': response.status_code,
+                'body': request.body[:500].decode('utf-8', 'replace'),
+                'top_functions': _top_functions(profiler, getattr(settings, 'PROFILE_TOP_N', 30)),
+            }
+            with _profiles_lock:
+                _profiles.append(record)
+
+            response['X-Profile-Id'] = str(profile_id)
+            return response
+        return wrapper
+    return decorator
+
+
+def recent_profiles():
+    """Snapshot of the ring buffer, newest first"""
+    with _profiles_lock:
+        return list(reversed(_profiles))
+
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        for record in _profiles:
+            if record['id'] == profile_id:
+                return record
+    return None
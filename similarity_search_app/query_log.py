@@ -0,0 +1,116 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+_shared_log = None
+_shared_log_lock = threading.Lock()
+
+
+def normalise(text):
+    """Query text as it is logged and searched: trimmed, single-spaced and lower-cased
+
+    The embedding model is uncased, so this changes no results; it only lets
+    variants of one query share cache entries.
+    """
+    return _WHITESPACE.sub(' ', text).strip().lower()
+
+
+class QueryLog:
+    """Per-process query counts, appended to a shared JSONL file every few seconds
+
+    Each flush appends one {"source_type", "keyword", "count", "ts"} line per
+    distinct query in a single write, so worker processes can share the file
+    (the same shape load_test replays). Once the file reaches max_bytes it is
+    rotated to <path>.1, which keeps the log a rolling window.
+    """
+
+    def __init__(self, path, flush_seconds=10.0, max_bytes=16 * 1024 * 1024):
+        self.path = str(path)
+        self.flush_seconds = flush_seconds
+        self.max_bytes = max_bytes
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, source_type, keyword):
+        with self._lock:
+            self._counts[(source_type, keyword)] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+
+        stamp = round(time.time(), 3)
+        lines = ''.join(
+            json.dumps({'source_type': source_type, 'keyword': keyword, 'count': count, 'ts': stamp}) + '\n'
+            for (source_type, keyword), count in counts.items()
+        )
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, lines.encode('utf-8'))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.warning("Could not write query log %s: %s", self.path, e)
+
+
+def get_query_log():
+    """Process-wide QueryLog, or None when QUERY_LOG_PATH is unset"""
+    global _shared_log
+    path = getattr(settings, 'QUERY_LOG_PATH', None)
+    if not path:
+        return None
+    if _shared_log is None:
+        with _shared_log_lock:
+            if _shared_log is None:
+                _shared_log = QueryLog(
+                    path,
+                    flush_seconds=getattr(settings, 'QUERY_LOG_FLUSH_SECONDS', 10.0),
+                    max_bytes=getattr(settings, 'QUERY_LOG_MAX_BYTES', 16 * 1024 * 1024),
+                )
+                atexit.register(_shared_log.flush)
+    return _shared_log
+
+
+def top_queries(path, limit):
+    """Most frequent logged keywords per source type, most frequent first, over the log and its rotation"""
+    path = str(path)
+    counts = Counter()
+    for candidate in (path + '.1', path):
+        try:
+            with open(candidate) as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                        counts[(record['source_type'], record['keyword'])] += int(record.get('count', 1))
+                    except (ValueError, KeyError, TypeError):
+                        # A line cut short by a crash mid-write
+                        continue
+        except FileNotFoundError:
+            continue
+
+    per_source = {}
+    for (source_type, keyword), _ in counts.most_common():
+        keywords = per_source.setdefault(source_type, [])
+        if len(keywords) < limit:
+            keywords.append(keyword)
+    return per_source
@@ -0,0 +1,282 @@
+import json
+import numpy as np
+from .timing import NULL_TIMER
+
+
+def decode_vector(value):
+    """Decode a stored embedding (JSON text or float32 blob) into a numpy array"""
+    if isinstance(value, (bytes, memoryview)):
+        return np.frombuffer(value, dtype='<f4')
+    return np.asarray(json.loads(value), dtype=np.float32)
+
+
+def encode_vector(vector):
+    """Encode a numpy vector as a little-endian float32 blob"""
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def ensure_reduced_tables(conn):
+    """Create the tables holding the PCA projection and reduced vectors"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pca_tbl (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            dim INTEGER NOT NULL,
+            full_dim INTEGER NOT NULL,
+            mean BLOB NOT NULL,
+            components BLOB NOT NULL,
+            explained_variance REAL,
+            trained_rows INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reduced_embedding_tbl (
+            source_id INTEGER PRIMARY KEY,
+            reduced_vect BLOB NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def train_projection(matrix, dim):
+    """Fit a PCA projection on the rows of matrix, returning (mean, components, explained)"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    dim = min(dim, matrix.shape[1])
+    mean = matrix.mean(axis=0)
+    centered = matrix - mean
+
+    # Eigen-decompose the (full_dim x full_dim) covariance rather than the
+    # (rows x full_dim) matrix so training stays cheap for large corpora
+    covariance = centered.T @ centered / max(len(matrix) - 1, 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:dim]
+    components = eigenvectors[:, order].T
+
+    total = eigenvalues.sum()
+    explained = float(eigenvalues[order].sum() / total) if total > 0 else 0.0
+    return mean.astype(np.float32), components.astype(np.float32), explained
+
+
+class Projection:
+    """PCA projection stored alongside a vector database"""
+
+    def __init__(self, mean, components, explained_variance=None):
+        self.mean = mean
+        self.components = components
+        self.explained_variance = explained_variance
+
+    @property
+    def dim(self):
+        return self.components.shape[0]
+
+    def transform(self, vectors):
+        """Project stored vectors (1-D or 2-D) into the reduced space"""
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+    def transform_query(self, query_vector):
+        """Project a query vector for coarse scoring
+
+        The query is not centred: the mean term adds the same constant to
+        every candidate's score, so dropping it preserves the ranking.
+        """
+        return self.components @ np.asarray(query_vector, dtype=np.float32)
+
+    def save(self, conn, trained_rows):
+        ensure_reduced_tables(conn)
+        conn.execute('''
+            INSERT OR REPLACE INTO pca_tbl
+                (id, dim, full_dim, mean, components, explained_variance, trained_rows)
+            VALUES (1, ?, ?, ?, ?, ?, ?)
+        ''', (
+            self.dim,
+            self.components.shape[1],
+            encode_vector(self.mean),
+            encode_vector(self.components.ravel()),
+            self.explained_variance,
+            trained_rows
+        ))
+        conn.commit()
+
+    @classmethod
+    def load(cls, conn):
+        """Load the stored projection, or None if the database has none"""
+        try:
+            row = conn.execute(
+                "SELECT dim, full_dim, mean, components, explained_variance FROM pca_tbl WHERE id = 1"
+            ).fetchone()
+        except Exception:
+            return None
+
+        if row is None:
+            return None
+
+        dim, full_dim, mean, components, explained = row
+        return cls(
+            np.frombuffer(mean, dtype='<f4'),
+            np.frombuffer(components, dtype='<f4').reshape(dim, full_dim),
+            explained
+        )
+
+
+def load_full_matrix(conn, source_ids=None):
+    """Load (ids, matrix) of full embeddings, optionally restricted to source_ids"""
+    cursor = conn.cursor()
+    if source_ids is None:
+        cursor.execute("SELECT source_id, embedding_vect FROM embedding_tbl")
+    else:
+        placeholders = ','.join('?' * len(source_ids))
+        cursor.execute(
+            f"SELECT source_id, embedding_vect FROM embedding_tbl WHERE source_id IN ({placeholders})",
+            list(source_ids)
+        )
+
+    ids = []
+    vectors = []
+    for source_id, embedding_vect in cursor:
+        try:
+            vectors.append(decode_vector(embedding_vect))
+            ids.append(source_id)
+        except (json.JSONDecodeError, TypeError, ValueError):
+            continue
+
+    if not vectors:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return np.asarray(ids, dtype=np.int64), np.vstack(vectors)
+
+
+def load_reduced_matrix(conn):
+    """Load (ids, matrix) of reduced vectors"""
+    rows = conn.execute("SELECT source_id, reduced_vect FROM reduced_embedding_tbl").fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    matrix = np.vstack([np.frombuffer(row[1], dtype='<f4') for row in rows])
+    return ids, matrix
+
+
+def index_reduced_vectors(conn, projection, only_missing=False, batch_size=5000):
+    """Write reduced vectors for stored embeddings; returns number of rows indexed"""
+    ensure_reduced_tables(conn)
+    if not only_missing:
+        conn.execute("DELETE FROM reduced_embedding_tbl")
+
+    query = "SELECT e.source_id, e.embedding_vect FROM embedding_tbl e"
+    if only_missing:
+        query += " WHERE e.source_id NOT IN (SELECT source_id FROM reduced_embedding_tbl)"
+
+    read_cursor = conn.cursor()
+    read_cursor.execute(query)
+
+    indexed = 0
+    while True:
+        rows = read_cursor.fetchmany(batch_size)
+        if not rows:
+            break
+
+        ids = []
+        vectors = []
+        for source_id, embedding_vect in rows:
+            try:
+                vectors.append(decode_vector(embedding_vect))
+                ids.append(source_id)
+            except (json.JSONDecodeError, TypeError, ValueError):
+                continue
+
+        if not vectors:
+            continue
+
+        reduced = projection.transform(np.vstack(vectors))
+        conn.executemany(
+            "INSERT OR REPLACE INTO reduced_embedding_tbl (source_id, reduced_vect) VALUES (?, ?)",
+            [(source_id, encode_vector(vec)) for source_id, vec in zip(ids, reduced)]
+        )
+        indexed += len(ids)
+
+    conn.commit()
+    return indexed
+
+
+def build_reduced_index(conn, dim, sample_size=None):
+    """Train a projection on stored embeddings, save it and index every row"""
+    ids, matrix = load_full_matrix(conn)
+    if len(ids) == 0:
+        return None, 0
+
+    training = matrix
+    if sample_size and len(matrix) > sample_size:
+        rng = np.random.default_rng(0)
+        training = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+
+    mean, components, explained = train_projection(training, dim)
+    projection = Projection(mean, components, explained)
+    projection.save(conn, trained_rows=len(training))
+    indexed = index_reduced_vectors(conn, projection)
+    return projection, indexed
+
+
+def top_k(scores, k):
+    """Return indices of the k largest scores in descending order"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def cosine_scores(matrix, query_vector):
+    """Cosine similarity of every row of matrix against query_vector"""
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+    norms[norms == 0] = np.inf
+    return (matrix @ query_vector) / norms
+
+
+def two_stage_rank(conn, projection, query_vector, limit, rerank_depth, timer=NULL_TIMER, reduced=None):
+    """Rank source ids by a reduced-space coarse pass reranked with full vectors
+
+    reduced is an already loaded (ids, matrix) of reduced vectors; without
+    it they are read from conn. Returns a list of (source_id, similarity),
+    or None if nothing is indexed.
+    """
+    if reduced is None:
+        with timer.stage('scan'):
+            reduced = load_reduced_matrix(conn)
+    ids, reduced_matrix = reduced
+    if len(ids) == 0:
+        return None
+
+    with timer.stage('rank'):
+        coarse_scores = reduced_matrix @ projection.transform_query(query_vector)
+        candidate_ids = ids[top_k(coarse_scores, max(rerank_depth, limit))]
+
+    with timer.stage('scan'):
+        full_ids, full_matrix = load_full_matrix(conn, candidate_ids.tolist())
+    if len(full_ids) == 0:
+        return []
+
+    with timer.stage('rank'):
+        similarities = cosine_scores(full_matrix, query_vector)
+        return [(int(full_ids[i]), float(similarities[i])) for i in top_k(similarities, limit)]
+
+
+def exact_rank(ids, matrix, query_vector, limit):
+    """Rank source ids by exact cosine similarity over the full matrix"""
+    similarities = cosine_scores(matrix, query_vector)
+    return [(int(ids[i]), float(similarities[i])) for i in top_k(similarities, limit)]
+
+
+def cosine_scores_many(matrix, query_matrix):
+    """Cosine similarity of every query (rows of query_matrix) against every row of matrix"""
+    query_matrix = np.asarray(query_matrix, dtype=np.float32)
+    row_norms = np.linalg.norm(matrix, axis=1)
+    row_norms[row_norms == 0] = np.inf
+    query_norms = np.linalg.norm(query_matrix, axis=1)
+    query_norms[query_norms == 0] = np.inf
+    return (query_matrix @ matrix.T) / query_norms[:, None] / row_norms[None, :]
+
+
+def recall_at_k(approximate_ids, exact_ids):
+    """Fraction of exact_ids present in approximate_ids"""
+    if len(exact_ids) == 0:
+        return 1.0
+    return len(set(approximate_ids) & set(exact_ids)) / len(exact_ids)
@@ -0,0 +1,15 @@
+class SearchResults(list):
+    """Search hits plus flags describing how they were produced
+
+    Behaves as a plain list; `backend` names the engine that ranked the hits,
+    `partial` is set when part of the data could not be searched and `failed`
+    names the parts that were skipped. `approximate` is set when a deadline
+    made the search fall back to a cheaper, inexact mode.
+    """
+
+    def __init__(self, results=(), backend=None, partial=False, failed=(), approximate=False):
+        super().__init__(results)
+        self.backend = backend
+        self.partial = partial
+        self.failed = list(failed)
+        self.approximate = approximate
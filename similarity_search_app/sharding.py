@@ -0,0 +1,192 @@
+import heapq
+import os
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from . import corpus, generations
+from .results import SearchResults
+from .timing import NO_DEADLINE
+
+
+# Shard files hold ids congruent to their index modulo the shard count, so
+# any source_id can be routed to its shard without a lookup table. New
+# documents are placed by the source's partition policy:
+#   'hash' - crc32 of the document text
+#   'date' - crc32 of the created_date month (YYYY-MM), keeping a month together
+
+_executor = None
+
+
+def shard_count(source_type):
+    return generations.source_config(source_type)['shards']
+
+
+def is_sharded(source_type):
+    return shard_count(source_type) > 1
+
+
+def shard_paths(source_type):
+    """Active database path of every shard (a single path for unsharded sources)"""
+    count = shard_count(source_type)
+    if count <= 1:
+        return [generations.current_path(source_type)]
+    return [generations.current_path(source_type, shard) for shard in range(count)]
+
+
+def shard_for_id(source_type, source_id):
+    count = shard_count(source_type)
+    return int(source_id) % count if count > 1 else None
+
+
+def path_for_id(source_type, source_id):
+    """Active database path holding source_id"""
+    return generations.current_path(source_type, shard_for_id(source_type, source_id))
+
+
+def shard_for_document(source_type, document):
+    """Shard a document belongs to: by its id when it has one, else by partition policy"""
+    config = generations.source_config(source_type)
+    count = config['shards']
+    if count <= 1:
+        return None
+    if document.get('id') is not None:
+        return int(document['id']) % count
+
+    if config['partition'] == 'date':
+        key = (document.get('created_date') or '')[:7]
+    else:
+        key = document.get('source_text') or ''
+    return zlib.crc32(key.encode('utf-8')) % count
+
+
+def id_allocator(shard, count):
+    """Callable returning the next free id congruent to shard (mod count) in a shard database"""
+    def allocate(cursor):
+        max_id = cursor.execute("SELECT MAX(id) FROM source_tbl").fetchone()[0] or 0
+        candidate = max_id - max_id % count + shard
+        return candidate if candidate > max_id else candidate + count
+    return allocate
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'VECTOR_SHARD_WORKERS', None) or os.cpu_count()
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard-scan')
+    return _executor
+
+
+def _search_shard(db_path, query_embedding, limit, backend=None, deadline=NO_DEADLINE):
+    """Search one shard file with the shared manager, so shards reuse its caches and admission gates"""
+    from .vector_utils import get_search_manager
+
+    if not os.path.exists(db_path):
+        return []
+    return get_search_manager().search_by_embedding(
+        db_path, query_embedding, limit, backend=backend, deadline=deadline
+    )
+
+
+def parallel_search(paths, query_embedding, limit, backend=None, deadline=NO_DEADLINE):
+    """Scan shard files concurrently and merge their top-k by distance
+
+    Shards still running at the deadline (but always given at least
+    SEARCH_DEADLINE_FLOOR_MS) are left out and the merged results are
+    flagged partial.
+    """
+    futures = {
+        _get_executor().submit(_search_shard, path, query_embedding, limit, backend, deadline): path
+        for path in paths
+    }
+    timeout = deadline.timeout(getattr(settings, 'SEARCH_DEADLINE_FLOOR_MS', 50) / 1000)
+    done, not_done = wait(futures, timeout=None if timeout == float('inf') else timeout)
+    for future in not_done:
+        future.cancel()
+
+    per_shard = [future.result() for future in futures if future in done]
+    failed = [os.path.basename(futures[future]) for future in futures if future in not_done]
+    failed.extend(name for results in per_shard for name in getattr(results, 'failed', ()))
+    merged = heapq.nsmallest(limit, (result for results in per_shard for result in results),
+                             key=lambda result: result['distance'])
+    served_by = sorted({results.backend for results in per_shard if getattr(results, 'backend', None)})
+    return SearchResults(
+        merged, backend='sharded:' + ','.join(served_by),
+        partial=bool(not_done) or any(getattr(results, 'partial', False) for results in per_shard),
+        failed=failed,
+        approximate=any(getattr(results, 'approximate', False) for results in per_shard),
+    )
+
+
+def split_into_shards(source_type, db_path, keep_generations=2, prepare=None):
+    """Route every row of a freshly built database into new shard generations and activate them
+
+    Rows keep their documents but get ids congruent to their shard.
+    prepare(shard, conn), if given, runs on each filled shard. Every shard
+    is prepared and validated before any is activated; if one fails, the new
+    files are removed, the live generations stay as they were and
+    generations.GenerationError is raised. Returns rows written per shard.
+    """
+    count = shard_count(source_type)
+    targets = []
+    for shard in range(count):
+        path = generations.new_generation_path(source_type, shard)
+        conn = sqlite3.connect(path)
+        corpus.bulk_load_pragmas(conn)
+        corpus.create_schema(conn)
+        targets.append((path, conn, id_allocator(shard, count)))
+
+    written = [0] * count
+    source = sqlite3.connect(db_path)
+    try:
+        cursor = source.execute("""
+            SELECT s.source_text, s.category, s.created_date, s.author, s.department,
+                   s.priority, s.status, e.embedding_vect, e.metadata
+            FROM source_tbl s
+            JOIN embedding_tbl e ON s.id = e.source_id
+        """)
+        for row in cursor:
+            document = dict(zip(corpus.DOCUMENT_COLUMNS, row[:7]))
+            shard = shard_for_document(source_type, document)
+            _, conn, allocate = targets[shard]
+            source_id = allocate(conn.cursor())
+            conn.execute(
+                "INSERT INTO source_tbl (id, source_text, category, created_date, author, department, priority, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_id,) + tuple(row[:7])
+            )
+            conn.execute(
+                "INSERT INTO embedding_tbl (source_id, embedding_vect, metadata) VALUES (?, ?, ?)",
+                (source_id, row[7], row[8])
+            )
+            written[shard] += 1
+    finally:
+        source.close()
+        for _, conn, _ in targets:
+            conn.commit()
+            conn.close()
+
+    try:
+        for shard, (path, _, _) in enumerate(targets):
+            if prepare is not None:
+                conn = sqlite3.connect(path)
+                try:
+                    prepare(shard, conn)
+                    conn.commit()
+                finally:
+                    conn.close()
+            if written[shard]:
+                generations.validate_generation(path)
+    except Exception as e:
+        for path, _, _ in targets:
+            generations.remove_generation(path)
+        if isinstance(e, generations.GenerationError):
+            raise
+        raise generations.GenerationError(f'preparing shards failed: {e}') from e
+
+    # Only switch pointers once the whole set is known good
+    for shard, (path, _, _) in enumerate(targets):
+        generations.activate_generation(source_type, path, shard=shard)
+    for shard in range(count):
+        generations.prune_generations(source_type, keep=keep_generations, shard=shard)
+    return written
@@ -1,3 +1,1034 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from . import (admission, backends, caching, coordinator, corpus, generations, ingest_queue, neighbors, query_log,
+               reduction, sharding)
+from .management.commands.setup_vector_dbs import Command as SetupVectorDbs
+from .memory_index import MemoryIndex, ReducedMatrixCache
+from .models import CustomUser
+from .timing import Deadline, NO_DEADLINE
+from .vector_utils import VectorSearchManager, get_search_manager
 
-# Create your tests here.
+
+def build_database(path, rows=200, seed=0):
+    """Small synthetic corpus, built without the embedding model"""
+    corpus.build_synthetic_corpus(path, rows, seed=seed, clusters=8)
+    return path
+
+
+def stored_embedding(db_path, source_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT embedding_vect FROM embedding_tbl WHERE source_id = ?", (source_id,)).fetchone()
+    finally:
+        conn.close()
+    return reduction.decode_vector(row[0])
+
+
+def upsert(db_path, embedding, **document):
+    """Write one document through corpus.upsert_documents; returns its id"""
+    conn = sqlite3.connect(db_path)
+    try:
+        document = dict({field: 'x' for field in corpus.DOCUMENT_COLUMNS}, **document)
+        return corpus.upsert_documents(conn, [document], [list(map(float, embedding))])[0]
+    finally:
+        conn.close()
+
+
+def train_projection(db_path, dim=16):
+    conn = sqlite3.connect(db_path)
+    try:
+        reduction.build_reduced_index(conn, dim)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fake_encode(texts, deadline=NO_DEADLINE):
+    """Deterministic stand-in for the model: a vector seeded by each text"""
+    return [np.random.default_rng(sum(map(ord, text))).normal(size=corpus.EMBEDDING_DIM).tolist() for text in texts]
+
+
+class TempDirMixin:
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp(prefix='similarity_search_test_')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+
+class MemoryIndexTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'))
+        self.index = MemoryIndex(self.db_path)
+        self.index.refresh()
+
+    def test_initial_load(self):
+        self.assertEqual(len(self.index.snapshot.ids), 200)
+        self.assertEqual(self.index.refresh(), (0, 0))
+
+    def test_refresh_appends_new_rows(self):
+        embedding = np.random.default_rng(1).normal(size=corpus.EMBEDDING_DIM)
+        new_id = upsert(self.db_path, embedding)
+
+        self.assertEqual(self.index.refresh(), (1, 0))
+        source_id, distance = self.index.search(embedding, 1)[0]
+        self.assertEqual(source_id, new_id)
+        self.assertAlmostEqual(distance, 0.0, places=5)
+
+    def test_tombstones_drop_deleted_rows(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            deleted = corpus.delete_embeddings(conn.cursor(), "source_id = ?", (7,))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.assertEqual(deleted, 1)
+        self.assertEqual(self.index.refresh(), (0, 1))
+        self.assertNotIn(7, self.index.snapshot.ids.tolist())
+        self.assertEqual(len(self.index.snapshot.ids), 199)
+
+    def test_upsert_replaces_vector(self):
+        embedding = np.random.default_rng(2).normal(size=corpus.EMBEDDING_DIM)
+        upsert(self.db_path, embedding, id=3)
+
+        self.assertEqual(self.index.refresh(), (1, 1))
+        self.assertEqual(self.index.snapshot.ids.tolist().count(3), 1)
+        self.assertEqual(self.index.search(embedding, 1)[0][0], 3)
+
+    def test_version_follows_snapshot(self):
+        version = self.index.version
+        upsert(self.db_path, np.random.default_rng(5).normal(size=corpus.EMBEDDING_DIM))
+        self.assertEqual(self.index.version, version)
+        self.index.refresh()
+        self.assertNotEqual(self.index.version, version)
+
+    def test_rebuilt_file_reloads(self):
+        os.remove(self.db_path)
+        build_database(self.db_path, rows=50, seed=3)
+
+        self.index.refresh()
+        self.assertEqual(len(self.index.snapshot.ids), 50)
+
+    def test_saved_index_loads_without_a_scan(self):
+        self.index.save()
+        loaded = MemoryIndex(self.db_path)
+        self.assertTrue(loaded.load_saved())
+        self.assertEqual(loaded.version, self.index.version)
+        np.testing.assert_array_equal(loaded.snapshot.ids, self.index.snapshot.ids)
+        self.assertEqual(loaded.refresh(), (0, 0))
+
+    def test_saved_index_rejected_when_database_differs(self):
+        self.index.save()
+        # Rows removed behind the index's back, with no tombstones to account for them
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("DELETE FROM embedding_tbl WHERE source_id <= 10")
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self.assertLogs('similarity_search_app.memory_index', 'WARNING'):
+            self.assertFalse(MemoryIndex(self.db_path).load_saved())
+
+
+class IndexSnapshotTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source_path = build_database(self.path('it.db'))
+        self.bundle = self.path('bundle')
+        with override_settings(VECTOR_DATABASES={'IT': self.source_path}):
+            call_command('index_snapshot', 'export', self.bundle, stdout=io.StringIO())
+
+    def import_bundle(self):
+        node_path = self.path('node.db')
+        with override_settings(VECTOR_DATABASES={'IT': node_path}):
+            call_command('index_snapshot', 'import', self.bundle, stdout=io.StringIO())
+            return generations.current_path('IT')
+
+    def test_export_import_round_trip(self):
+        db_path = self.import_bundle()
+        index = MemoryIndex(db_path)
+        self.assertTrue(index.load_saved())
+
+        original = MemoryIndex(self.source_path)
+        original.refresh()
+        np.testing.assert_array_equal(index.snapshot.ids, original.snapshot.ids)
+        query = stored_embedding(self.source_path, 5)
+        self.assertEqual(index.search(query, 5), original.search(query, 5))
+
+    def test_corrupt_bundle_installs_nothing(self):
+        with open(os.path.join(self.bundle, 'IT.db.snapshot-ids.npy'), 'ab') as handle:
+            handle.write(b'garbage')
+        with self.assertRaisesMessage(CommandError, 'does not match its checksum'):
+            self.import_bundle()
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['bundle', 'it.db'])
+
+
+class ReducedMatrixCacheTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'))
+        train_projection(self.db_path)
+        self.cache = ReducedMatrixCache()
+
+    def get(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return self.cache.get(self.db_path, conn)
+        finally:
+            conn.close()
+
+    def test_reused_until_file_changes(self):
+        projection, reduced = self.get()
+        self.assertIsNotNone(projection)
+        self.assertEqual(len(reduced[0]), 200)
+        self.assertIs(self.get()[1], reduced)
+
+        upsert(self.db_path, np.random.default_rng(4).normal(size=corpus.EMBEDDING_DIM))
+        self.assertIsNot(self.get()[1], reduced)
+
+    def test_two_stage_search_uses_cache(self):
+        query = stored_embedding(self.db_path, 9)
+        results = get_search_manager().two_stage_search(self.db_path, query, 3)
+        self.assertEqual(results[0]['id'], 9)
+        self.assertIn(self.db_path, get_search_manager().reduced_matrices._entries)
+
+
+class SearchViewTestCase(TempDirMixin, TestCase):
+    """Signed-in client against temporary vector databases"""
+
+    def setUp(self):
+        super().setUp()
+        user = CustomUser.objects.create_user(email='tester@example.com', password='secret')
+        self.client.force_login(user)
+
+    def post(self, name, payload, **headers):
+        return self.client.post(reverse(f'similarity_search_app:{name}'), json.dumps(payload),
+                                content_type='application/json', **headers)
+
+
+class ETagTests(SearchViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'))
+        overrides = override_settings(VECTOR_DATABASES={'IT': self.db_path}, VECTOR_SEARCH_BACKEND='memory',
+                                      SEARCH_NODES=[])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def similar(self, **headers):
+        return self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5}, **headers)
+
+    def test_first_load_has_no_validator(self):
+        # The index loads during this request, so the ETag taken before it no longer holds
+        self.assertFalse(self.similar().has_header('ETag'))
+        self.assertTrue(self.similar().has_header('ETag'))
+
+    def test_revalidation_returns_304(self):
+        self.similar()
+        first = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5})
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'])
+
+        second = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_upsert_changes_etag_and_results(self):
+        self.similar()
+        first = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5})
+        self.assertEqual(first.status_code, 200)
+
+        # A copy of document 5 is its nearest possible neighbor
+        new_id = upsert(self.db_path, stored_embedding(self.db_path, 5))
+
+        # Until the index catches up it still serves, and validates, the first body
+        unchanged = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5},
+                              HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+        get_search_manager().memory_indexes.refresh_all()
+        second = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        top = second.json()['results'][0]
+        self.assertEqual(top['id'], new_id)
+        self.assertAlmostEqual(top['distance'], 0.0, places=3)
+
+
+class BatchSearchTests(SearchViewTestCase):
+    queries = ['vpn access', 'printer jam', 'password reset']
+
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'))
+        overrides = override_settings(VECTOR_DATABASES={'IT': self.db_path}, VECTOR_SEARCH_BACKEND='fallback',
+                                      SEARCH_NODES=[], BATCH_SEARCH_MAX_QUERIES=3)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch('similarity_search_app.vector_utils.VectorSearchManager.encode_texts',
+                             side_effect=fake_encode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertSameHits(self, batch, single):
+        self.assertEqual([hit['id'] for hit in batch], [hit['id'] for hit in single])
+        for left, right in zip(batch, single):
+            self.assertAlmostEqual(left['distance'], right['distance'], places=4)
+
+    def test_matches_per_query_search(self):
+        manager = get_search_manager()
+        batched = manager.batch_similarity_search('IT', self.queries, limit=10)
+        self.assertEqual(len(batched), len(self.queries))
+        for query, hits in zip(self.queries, batched):
+            self.assertSameHits(hits, manager.similarity_search('IT', query, limit=10))
+
+    def test_view_returns_one_block_per_query(self):
+        response = self.post('batch_search', {'source_type': 'IT', 'queries': self.queries, 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        blocks = response.json()['results']
+        self.assertEqual([block['query'] for block in blocks], self.queries)
+        manager = get_search_manager()
+        for block in blocks:
+            self.assertSameHits(block['results'], manager.similarity_search('IT', block['query'], limit=5))
+
+    def test_rejects_empty_and_oversized_batches(self):
+        for queries in ([], self.queries + ['one too many'], ['vpn access', '']):
+            response = self.post('batch_search', {'source_type': 'IT', 'queries': queries})
+            self.assertEqual(response.status_code, 400, queries)
+
+
+class StreamSearchTests(SearchViewTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(
+            VECTOR_DATABASES={'IT': build_database(self.path('it.db')), 'HR': build_database(self.path('hr.db'), seed=1)},
+            VECTOR_SEARCH_BACKEND='fallback', SEARCH_NODES=[],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch('similarity_search_app.vector_utils.VectorSearchManager.encode_texts',
+                             side_effect=fake_encode)
+        self.encode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self, keyword='stream query', **payload):
+        response = self.post('search_stream', dict({'source_types': ['IT', 'HR'], 'keyword': keyword, 'limit': 3},
+                                                   **payload))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_header_then_one_block_per_source(self):
+        lines = self.stream()
+        self.assertEqual(lines[0]['type'], 'header')
+        self.assertEqual(lines[0]['source_types'], ['IT', 'HR'])
+        self.assertEqual([line['type'] for line in lines[1:]], (['source'] + ['result'] * 3) * 2 + ['end'])
+        self.assertEqual([line['source_type'] for line in lines if line['type'] == 'source'], ['IT', 'HR'])
+        self.assertEqual([line['rank'] for line in lines if line['type'] == 'result'], [0, 1, 2] * 2)
+        self.assertEqual(lines[-1]['status'], 'ok')
+
+    def test_failed_or_overloaded_source_gets_an_error_line(self):
+        manager = get_search_manager()
+        search_source = manager.search_source
+        failures = {'IT': RuntimeError('disk I/O error'), 'HR': admission.Overloaded('scan', 'queue_full', 7)}
+
+        for failing, error in failures.items():
+            def search_or_fail(source_type, *args, **kwargs):
+                if source_type == failing:
+                    raise error
+                return search_source(source_type, *args, **kwargs)
+
+            with self.subTest(source_type=failing), \
+                    mock.patch.object(manager, 'search_source', side_effect=search_or_fail):
+                lines = self.stream()
+            errors = [line for line in lines if line['type'] == 'error']
+            self.assertEqual(errors, [{'type': 'error', 'source_type': failing, 'error': str(error)}])
+            self.assertEqual([line['source_type'] for line in lines if line['type'] == 'source'],
+                             [source_type for source_type in failures if source_type != failing])
+            self.assertEqual((lines[-1]['type'], lines[-1]['status']), ('end', 'partial'))
+
+    def test_overloaded_encoder_ends_the_stream(self):
+        self.encode.side_effect = admission.Overloaded('encode', 'queue_full', 7)
+        lines = self.stream(keyword='never encoded before')
+        self.assertEqual(lines, [{'type': 'error', 'error': 'Server busy (encode: queue_full)', 'retry_after': 7}])
+
+
+class MetricsViewTests(SearchViewTestCase):
+    sample = re.compile(r'^([a-z_]+)(\{[a-z_]+="[^"]*"(?:,[a-z_]+="[^"]*")*\})? (-?[0-9.e+-]+|\+Inf)$')
+
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(VECTOR_DATABASES={'IT': build_database(self.path('it.db'))},
+                                      VECTOR_SEARCH_BACKEND='fallback', SEARCH_NODES=[], SEARCH_NODE_TOKEN='secret')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def scrape(self, client=None, **headers):
+        return (client or Client()).get(reverse('similarity_search_app:metrics'), **headers)
+
+    def test_requires_token_or_staff(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.scrape(self.client).status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+        staff = CustomUser.objects.create_user(email='ops@example.com', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.scrape(self.client).status_code, 200)
+
+    def test_exposition_format(self):
+        self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5})
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+        body = response.content.decode()
+        self.assertTrue(body.endswith('\n'))
+        samples = {}
+        for line in body.splitlines():
+            if line.startswith('# '):
+                self.assertRegex(line, r'^# (HELP [a-z_]+ .+|TYPE [a-z_]+ (counter|gauge|histogram))$')
+                continue
+            match = self.sample.match(line)
+            self.assertIsNotNone(match, line)
+            samples[match.group(1) + (match.group(2) or '')] = float(match.group(3))
+
+        self.assertIn('# TYPE search_requests_total counter', body)
+        self.assertGreaterEqual(samples['search_requests_total{endpoint="similar",status="200"}'], 1)
+        self.assertIn('# TYPE search_request_seconds histogram', body)
+        self.assertEqual(samples['search_request_seconds_bucket{endpoint="similar",le="+Inf"}'],
+                         samples['search_request_seconds_count{endpoint="similar"}'])
+
+    def test_server_timing_header(self):
+        response = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5})
+        entries = dict(entry.split(';dur=') for entry in response['Server-Timing'].split(', '))
+        self.assertIn('total', entries)
+        self.assertIn('scan', entries)
+        for stage, duration in entries.items():
+            self.assertRegex(duration, r'^\d+\.\d{2}$', stage)
+        self.assertGreaterEqual(float(entries['total']), max(float(duration) for duration in entries.values()))
+
+
+class DeadlineTests(TempDirMixin, SimpleTestCase):
+    def test_expired_after_encode_returns_partial(self):
+        db_path = build_database(self.path('it.db'))
+        manager = get_search_manager()
+
+        def slow_encode(texts, deadline=NO_DEADLINE):
+            time.sleep(0.06)
+            return [[0.1] * corpus.EMBEDDING_DIM for _ in texts]
+
+        with override_settings(VECTOR_DATABASES={'IT': db_path}, SEARCH_NODES=[]), \
+                mock.patch.object(manager, 'encode_texts', slow_encode), \
+                mock.patch.object(manager, 'search_source') as search_source:
+            results = manager.similarity_search('IT', 'an uncached query', deadline=Deadline(0.05))
+
+        search_source.assert_not_called()
+        self.assertEqual(list(results), [])
+        self.assertTrue(results.partial)
+        self.assertEqual(results.failed, ['IT'])
+
+    def test_timeout_never_below_floor(self):
+        self.assertEqual(Deadline(0).timeout(0.05), 0.05)
+        self.assertEqual(NO_DEADLINE.timeout(0.05), float('inf'))
+
+    @override_settings(SEARCH_DEADLINE_FLOOR_MS=5000)
+    def test_expired_sharded_search_still_answers(self):
+        paths = [build_database(self.path(f'it-{shard}.db'), rows=50, seed=shard) for shard in range(2)]
+        query = stored_embedding(paths[0], 5)
+
+        results = sharding.parallel_search(paths, query, 3, backend='memory', deadline=Deadline(0))
+        self.assertFalse(results.partial)
+        self.assertEqual(results[0]['id'], 5)
+
+    @override_settings(SEARCH_NODES=[{'sources': ['IT'], 'urls': ['http://127.0.0.1:9']}])
+    def test_unreachable_nodes_give_partial_results(self):
+        results = coordinator.scatter_search('IT', [0.0] * corpus.EMBEDDING_DIM, 5, deadline=Deadline(0))
+        self.assertEqual(list(results), [])
+        self.assertTrue(results.partial)
+        self.assertEqual(results.failed, ['http://127.0.0.1:9'])
+
+    @override_settings(SEARCH_DEADLINE_FLOOR_MS=100)
+    def test_expired_deadline_still_queues_for_floor(self):
+        gate = admission.AdmissionGate('test', 1, queue_size=1, max_wait=5.0, retry_after=1)
+        release = threading.Event()
+        holder_entered = threading.Event()
+
+        def hold():
+            with gate.slot():
+                holder_entered.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        self.addCleanup(holder.join)
+        self.addCleanup(release.set)
+        holder_entered.wait(5)
+
+        started = time.monotonic()
+        with self.assertRaises(admission.Overloaded) as raised:
+            with gate.slot(deadline=Deadline(0)):
+                pass
+        self.assertEqual(raised.exception.reason, 'timeout')
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+@override_settings(VECTOR_SEARCH_AUTO_TWO_STAGE_ROWS=100)
+class ChooseBackendTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'))
+        train_projection(self.db_path)
+
+    def test_memory_preferred_while_it_fits(self):
+        self.assertEqual(backends.choose_backend(get_search_manager(), self.db_path), 'memory')
+
+    @override_settings(VECTOR_SEARCH_MEMORY_BUDGET_MB=0)
+    def test_two_stage_beyond_memory_budget(self):
+        self.assertEqual(backends.choose_backend(get_search_manager(), self.db_path), 'two_stage')
+
+
+class GenerationTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(VECTOR_DATABASES={'IT': self.path('it.db')})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def build_generation(self, rows=20):
+        path = generations.new_generation_path('IT')
+        build_database(path, rows=rows)
+        return path
+
+    def test_current_path_follows_activation(self):
+        self.assertEqual(generations.current_path('IT'), self.path('it.db'))
+        first = self.build_generation()
+        generations.activate_generation('IT', first)
+        self.assertEqual(generations.current_path('IT'), first)
+
+        second = self.build_generation()
+        self.assertNotEqual(second, first)
+        generations.activate_generation('IT', second)
+        self.assertEqual(generations.current_path('IT'), second)
+
+    def test_prune_keeps_active_and_newest(self):
+        built = [self.build_generation() for _ in range(4)]
+        self.assertEqual(generations.list_generations('IT'), built)
+        generations.activate_generation('IT', built[0])
+        open(built[1] + '.snapshot.json', 'w').close()
+
+        removed = generations.prune_generations('IT', keep=2)
+        self.assertEqual(removed, [built[1]])
+        self.assertFalse(os.path.exists(built[1] + '.snapshot.json'))
+        self.assertEqual(generations.list_generations('IT'), [built[0]] + built[2:])
+
+
+class SetupVectorDbsTests(TempDirMixin, SimpleTestCase):
+    SOURCES = ('ADMIN', 'IT', 'FINANCE', 'HR')
+
+    def setUp(self):
+        super().setUp()
+        databases = {source_type: self.path(f'{source_type.lower()}.db') for source_type in self.SOURCES}
+        databases['HR'] = {'path': databases['HR'], 'shards': 2}
+        overrides = override_settings(VECTOR_DATABASES=databases, VECTOR_SEARCH_BACKEND='auto')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def setup(self, rows=60):
+        call_command('setup_vector_dbs', synthetic=rows, clusters=4, keep_generations=1, stdout=io.StringIO())
+
+    def test_rebuild_swaps_and_prunes(self):
+        self.setup()
+        first = generations.current_path('IT')
+        self.setup()
+
+        self.assertNotEqual(generations.current_path('IT'), first)
+        self.assertEqual(generations.list_generations('IT'), [generations.current_path('IT')])
+        self.assertEqual(len(generations.list_generations('HR', shard=0)), 1)
+
+    def test_rebuild_keeps_projection_and_neighbors(self):
+        self.setup()
+        conn = sqlite3.connect(generations.current_path('IT'))
+        try:
+            reduction.build_reduced_index(conn, 8)
+            neighbors.build_neighbor_table(conn, neighbors=5)
+        finally:
+            conn.close()
+        train_projection(generations.current_path('HR', 0), dim=8)
+
+        self.setup()
+        conn = sqlite3.connect(generations.current_path('IT'))
+        try:
+            self.assertEqual(reduction.Projection.load(conn).dim, 8)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM reduced_embedding_tbl").fetchone()[0], 60)
+            self.assertEqual(conn.execute("SELECT MAX(rank) + 1 FROM neighbor_tbl").fetchone()[0], 5)
+        finally:
+            conn.close()
+        conn = sqlite3.connect(generations.current_path('HR', 0))
+        try:
+            self.assertEqual(reduction.Projection.load(conn).dim, 8)
+        finally:
+            conn.close()
+
+
+    def test_sample_database_has_the_shared_schema(self):
+        db_path = self.path('sample.db')
+        SetupVectorDbs(stdout=io.StringIO()).setup_database('IT', db_path)
+        conn = sqlite3.connect(db_path)
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+        self.assertTrue({'source_tbl', 'embedding_tbl', 'embedding_tombstone_tbl'} <= tables)
+
+    def test_failed_encode_batch_writes_no_rows(self):
+        calls = []
+
+        def encode_texts(texts, deadline=NO_DEADLINE):
+            calls.append(len(texts))
+            if len(calls) == 2:
+                raise RuntimeError('model unavailable')
+            return fake_encode(texts)
+
+        command = SetupVectorDbs(stdout=io.StringIO())
+        command.encoder = mock.Mock(encode_texts=mock.Mock(side_effect=encode_texts))
+        db_path = self.path('sample.db')
+        command.setup_database('IT', db_path)
+        command.populate_sample_data('IT', db_path)
+
+        conn = sqlite3.connect(db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM source_tbl").fetchone()[0], sum(calls) - calls[1])
+            self.assertEqual(conn.execute(
+                "SELECT COUNT(*) FROM source_tbl WHERE id NOT IN (SELECT source_id FROM embedding_tbl)"
+            ).fetchone()[0], 0)
+        finally:
+            conn.close()
+
+
+class EmbeddingServiceFallbackTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(EMBEDDING_SERVICE_SOCKET=self.path('missing.sock'),
+                                      EMBEDDING_SERVICE_RETRY_SECONDS=30)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.manager = VectorSearchManager()
+        self.manager._model = mock.Mock()
+        self.manager._model.encode.side_effect = lambda texts: np.array(fake_encode(texts))
+        client = self.manager._service_client
+        self.service = mock.patch.object(client, 'encode', wraps=client.encode).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_service_answers_when_up(self):
+        self.service.side_effect = lambda texts: np.array(fake_encode(texts), dtype=np.float32)
+        self.assertEqual(len(self.manager.encode_texts(['vpn access'])[0]), corpus.EMBEDDING_DIM)
+        self.manager._model.encode.assert_not_called()
+
+    def test_falls_back_and_skips_service_until_retry(self):
+        self.assertEqual(self.manager.encode_texts(['vpn access']), fake_encode(['vpn access']))
+        self.assertEqual(self.service.call_count, 1)
+
+        # Within the retry window the absent service costs nothing
+        self.manager.encode_texts(['printer jam'])
+        self.assertEqual(self.service.call_count, 1)
+        self.assertEqual(self.manager._model.encode.call_count, 2)
+
+        self.assertGreater(self.manager._service_retry_at, time.monotonic() + 25)
+        # Once the window has passed the service is tried again, and backed off again
+        self.manager._service_retry_at = time.monotonic() - 1
+        self.manager.encode_texts(['password reset'])
+        self.assertEqual(self.service.call_count, 2)
+        self.assertEqual(self.manager._model.encode.call_count, 3)
+        self.assertGreater(self.manager._service_retry_at, time.monotonic() + 25)
+
+
+class RemoteSourceTests(SearchViewTestCase):
+    """A coordinator whose IT source lives on a node, with node requests routed to this app"""
+
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'))
+        overrides = override_settings(
+            VECTOR_DATABASES={'IT': self.db_path}, VECTOR_SEARCH_BACKEND='memory', SEARCH_NODE_TOKEN='secret',
+            SEARCH_NODES=[{'sources': ['IT'], 'urls': ['http://node-a']}],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.node_up = True
+        patcher = mock.patch.object(coordinator, '_post', self.node_post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def node_post(self, url, payload, timeout, path=coordinator.NODE_SEARCH_PATH):
+        if not self.node_up:
+            raise OSError('connection refused')
+        response = Client().post(path, json.dumps(payload), content_type='application/json',
+                                 HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_source_detail_comes_from_node(self):
+        response = self.post('source_detail', {'source_type': 'IT', 'source_id': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['source_detail']['id'], 5)
+
+        missing = self.post('source_detail', {'source_type': 'IT', 'source_id': 100000})
+        self.assertEqual(missing.status_code, 404)
+
+    def test_similar_uses_node_embedding(self):
+        response = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5})
+        self.assertEqual(response.status_code, 200)
+        ids = [result['id'] for result in response.json()['results']]
+        self.assertTrue(ids)
+        self.assertNotIn(5, ids)
+
+    def test_unreachable_node_is_bad_gateway(self):
+        self.node_up = False
+        self.assertEqual(self.post('source_detail', {'source_type': 'IT', 'source_id': 5}).status_code, 502)
+        self.assertEqual(self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5}).status_code, 502)
+
+    def test_node_source_requires_token(self):
+        response = self.client.post(reverse('similarity_search_app:node_source'),
+                                    json.dumps({'source_type': 'IT', 'source_id': 5}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class MissingSourceFileTests(SearchViewTestCase):
+    def test_lookups_do_not_create_database(self):
+        db_path = self.path('absent.db')
+        with override_settings(VECTOR_DATABASES={'IT': db_path}, SEARCH_NODES=[]):
+            self.assertEqual(self.post('source_detail', {'source_type': 'IT', 'source_id': 5}).status_code, 404)
+            self.assertEqual(self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5}).status_code, 404)
+        self.assertFalse(os.path.exists(db_path))
+
+    def test_non_integer_id_is_bad_request(self):
+        with override_settings(VECTOR_DATABASES={'IT': self.path('absent.db')}, SEARCH_NODES=[]):
+            for name in ('similar_ajax', 'source_detail'):
+                response = self.post(name, {'source_type': 'IT', 'source_id': 'abc'})
+                self.assertEqual(response.status_code, 400, name)
+                self.assertEqual(response.json()['error'], 'source_id must be an integer')
+
+
+class ShardingTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(VECTOR_DATABASES={'IT': {'path': self.path('it.db'), 'shards': 3}},
+                                      VECTOR_SEARCH_BACKEND='memory', SEARCH_NODES=[])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.built = build_database(self.path('built.db'), rows=100)
+        self.written = sharding.split_into_shards('IT', self.built)
+
+    def shard_ids(self, shard):
+        conn = sqlite3.connect(generations.current_path('IT', shard))
+        try:
+            return [row[0] for row in conn.execute("SELECT id FROM source_tbl")]
+        finally:
+            conn.close()
+
+    def test_split_routes_ids_by_shard(self):
+        self.assertEqual(sum(self.written), 100)
+        for shard in range(3):
+            ids = self.shard_ids(shard)
+            self.assertEqual(len(ids), self.written[shard])
+            self.assertTrue(all(source_id % 3 == shard for source_id in ids))
+            for source_id in ids[:5]:
+                self.assertEqual(sharding.path_for_id('IT', source_id), generations.current_path('IT', shard))
+
+    def test_failed_shard_activates_nothing(self):
+        live = [generations.current_path('IT', shard) for shard in range(3)]
+        rebuilt = build_database(self.path('rebuilt.db'), rows=60, seed=1)
+
+        def prepare(shard, conn):
+            if shard == 2:
+                raise sqlite3.OperationalError('disk full')
+
+        with self.assertRaises(generations.GenerationError):
+            sharding.split_into_shards('IT', rebuilt, prepare=prepare)
+        self.assertEqual([generations.current_path('IT', shard) for shard in range(3)], live)
+        for shard in range(3):
+            self.assertEqual(generations.list_generations('IT', shard), [live[shard]])
+
+    def test_parallel_search_merges_shards(self):
+        source_id = self.shard_ids(2)[0]
+        query = stored_embedding(generations.current_path('IT', 2), source_id)
+
+        results = get_search_manager().search_local('IT', query, 5)
+        self.assertFalse(results.partial)
+        self.assertEqual(results[0]['id'], source_id)
+        self.assertEqual(len(results), 5)
+
+
+class QueryLogTests(SearchViewTestCase):
+    def test_revalidated_searches_are_logged(self):
+        db_path = build_database(self.path('it.db'))
+        log_path = self.path('query_log.jsonl')
+        with override_settings(VECTOR_DATABASES={'IT': db_path}, SEARCH_NODES=[], QUERY_LOG_PATH=log_path), \
+                mock.patch.object(query_log, '_shared_log', None):
+            etag = caching.search_etag('search', 'IT', {'keyword': 'vpn access', 'page': 1})
+            response = self.post('search_ajax', {'source_type': 'IT', 'keyword': '  VPN   access '},
+                                 HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            query_log.get_query_log().flush()
+
+        self.assertEqual(query_log.top_queries(log_path, 5), {'IT': ['vpn access']})
+
+    def test_unknown_source_is_rejected_unlogged(self):
+        log_path = self.path('query_log.jsonl')
+        with override_settings(VECTOR_DATABASES={}, SEARCH_NODES=[], QUERY_LOG_PATH=log_path), \
+                mock.patch.object(query_log, '_shared_log', None), \
+                mock.patch.object(caching, 'search_etag') as search_etag:
+            response = self.post('search_ajax', {'source_type': 'NOPE', 'keyword': 'vpn access'})
+            self.assertEqual(response.status_code, 400)
+            query_log.get_query_log().flush()
+
+        search_etag.assert_not_called()
+        self.assertEqual(query_log.top_queries(log_path, 5), {})
+
+
+class AdmissionTests(SearchViewTestCase):
+    def full_gate(self, name='scan'):
+        """Gate whose single slot is taken and whose queue has no room"""
+        gate = admission.AdmissionGate(name, 1, queue_size=0, max_wait=1.0, retry_after=7)
+        gate.active = 1
+        return gate
+
+    def test_queue_full_rejects_at_once(self):
+        gate = self.full_gate()
+        started = time.monotonic()
+        with self.assertRaises(admission.Overloaded) as raised:
+            with gate.slot():
+                pass
+        self.assertEqual(raised.exception.reason, 'queue_full')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_queued_caller_gets_freed_slot(self):
+        gate = admission.AdmissionGate('test', 1, queue_size=1, max_wait=5.0, retry_after=1)
+        gate.active = 1
+        threading.Timer(0.05, gate._release).start()
+        with gate.slot():
+            self.assertEqual(gate.active, 1)
+        self.assertEqual(gate.active, 0)
+
+    def test_overloaded_search_is_503_with_retry_after(self):
+        db_path = build_database(self.path('it.db'))
+        with override_settings(VECTOR_DATABASES={'IT': db_path}, VECTOR_SEARCH_BACKEND='memory', SEARCH_NODES=[]), \
+                mock.patch.dict(admission._gates, {'scan': self.full_gate()}):
+            response = self.post('similar_ajax', {'source_type': 'IT', 'source_id': 5})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+
+class IngestQueueTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(INGEST_QUEUE_DB=self.path('queue.db'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.conn = ingest_queue.connect()
+        self.addCleanup(self.conn.close)
+
+    def status(self, job_ids):
+        return [(job['status'], job['attempts']) for job in ingest_queue.job_status(job_ids)]
+
+    def test_claim_takes_each_job_once(self):
+        job_ids = ingest_queue.enqueue('IT', [{'source_text': f'document {i}'} for i in range(3)])
+        claimed = ingest_queue.claim_batch(self.conn, 2, 'worker-a')
+        self.assertEqual([job[0] for job in claimed], job_ids[:2])
+        self.assertEqual(claimed[0][2]['source_text'], 'document 0')
+        self.assertEqual([job[0] for job in ingest_queue.claim_batch(self.conn, 2, 'worker-b')], job_ids[2:])
+        self.assertEqual(ingest_queue.claim_batch(self.conn, 2, 'worker-c'), [])
+        self.assertEqual(self.status(job_ids), [('running', 1)] * 3)
+
+    def test_failed_jobs_retry_until_max_attempts(self):
+        job_ids = ingest_queue.enqueue('IT', [{'source_text': 'document'}])
+        for attempt, expected in ((1, 'pending'), (2, 'failed')):
+            ingest_queue.claim_batch(self.conn, 1, 'worker')
+            ingest_queue.mark_failed(self.conn, job_ids, RuntimeError('model unavailable'), max_attempts=2)
+            self.assertEqual(self.status(job_ids), [(expected, attempt)])
+        self.assertEqual(ingest_queue.claim_batch(self.conn, 1, 'worker'), [])
+        self.assertEqual(ingest_queue.job_status(job_ids)[0]['error'], 'model unavailable')
+
+    def test_stale_running_jobs_are_requeued(self):
+        job_ids = ingest_queue.enqueue('IT', [{'source_text': 'document'}])
+        ingest_queue.claim_batch(self.conn, 1, 'worker')
+        self.assertEqual(ingest_queue.requeue_stale(self.conn, 60), 0)
+        self.assertEqual(ingest_queue.requeue_stale(self.conn, -1), 1)
+        self.assertEqual(self.status(job_ids), [('pending', 1)])
+
+
+class IngestEndpointTests(SearchViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'), rows=20)
+        overrides = override_settings(VECTOR_DATABASES={'IT': self.db_path}, INGEST_QUEUE_DB=self.path('queue.db'),
+                                      INGEST_MAX_DOCUMENTS=2, SEARCH_NODES=[])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_requires_login(self):
+        response = Client().post(reverse('similarity_search_app:ingest'),
+                                 json.dumps({'source_type': 'IT', 'documents': [{'source_text': 'x'}]}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ingest_queue.queue_depth()['pending'], 0)
+
+    def test_invalid_requests_queue_nothing(self):
+        for payload in (
+            {'source_type': 'NOPE', 'documents': [{'source_text': 'x'}]},
+            {'source_type': 'IT', 'documents': []},
+            {'source_type': 'IT', 'documents': [{'source_text': f'document {i}'} for i in range(3)]},
+            {'source_type': 'IT', 'documents': [{'source_text': 'fine'}, {'source_text': '  '}]},
+            {'source_type': 'IT', 'documents': [{'source_text': 'x', 'id': '5'}]},
+        ):
+            self.assertEqual(self.post('ingest', payload).status_code, 400, payload)
+        self.assertEqual(ingest_queue.queue_depth()['pending'], 0)
+
+    def test_queued_documents_are_indexed_by_the_worker(self):
+        response = self.post('ingest', {'source_type': 'IT', 'documents': [
+            {'source_text': 'new laptop request'}, {'source_text': 'rewritten document', 'id': 3}
+        ]})
+        self.assertEqual(response.status_code, 202)
+        job_ids = response.json()['job_ids']
+
+        status = self.client.get(reverse('similarity_search_app:ingest_status'),
+                                 {'ids': ','.join(map(str, job_ids))}).json()
+        self.assertEqual([job['status'] for job in status['jobs']], ['pending', 'pending'])
+
+        with mock.patch('similarity_search_app.vector_utils.VectorSearchManager.encode_texts',
+                        side_effect=fake_encode):
+            call_command('ingest_worker', once=True, stdout=io.StringIO())
+
+        jobs = ingest_queue.job_status(job_ids)
+        self.assertEqual([job['status'] for job in jobs], ['done', 'done'])
+        self.assertEqual(jobs[1]['source_id'], 3)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM source_tbl").fetchone()[0], 21)
+            self.assertEqual(conn.execute("SELECT source_text FROM source_tbl WHERE id = 3").fetchone()[0],
+                             'rewritten document')
+        finally:
+            conn.close()
+        np.testing.assert_allclose(stored_embedding(self.db_path, 3), fake_encode(['rewritten document'])[0],
+                                   rtol=1e-5)
+
+
+class IngestWorkerTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(
+            VECTOR_DATABASES={'IT': {'path': self.path('it.db'), 'shards': 2}},
+            INGEST_QUEUE_DB=self.path('queue.db'), SEARCH_NODES=[],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        sharding.split_into_shards('IT', build_database(self.path('built.db'), rows=40))
+        patcher = mock.patch('similarity_search_app.vector_utils.VectorSearchManager.encode_texts',
+                             side_effect=fake_encode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_worker(self, **options):
+        call_command('ingest_worker', once=True, stdout=io.StringIO(), **options)
+
+    def rows(self):
+        total = 0
+        for shard in range(2):
+            conn = sqlite3.connect(generations.current_path('IT', shard))
+            try:
+                total += conn.execute("SELECT COUNT(*) FROM source_tbl").fetchone()[0]
+            finally:
+                conn.close()
+        return total
+
+    def test_failed_shard_retries_without_duplicates(self):
+        documents = [{'source_text': f'document number {i}'} for i in range(12)]
+        job_ids = ingest_queue.enqueue('IT', documents)
+        upsert_documents = corpus.upsert_documents
+        calls = []
+
+        def fail_second_shard(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise sqlite3.OperationalError('database is locked')
+            return upsert_documents(*args, **kwargs)
+
+        # The worker retries the failed shard's jobs on its next claim
+        with mock.patch.object(corpus, 'upsert_documents', side_effect=fail_second_shard):
+            self.run_worker()
+
+        self.assertEqual(len(calls), 3)
+        jobs = ingest_queue.job_status(job_ids)
+        self.assertTrue(all(job['status'] == 'done' for job in jobs))
+        self.assertEqual(len({job['source_id'] for job in jobs}), 12)
+        self.assertEqual(self.rows(), 52)
+
+
+class NeighborTableTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = build_database(self.path('it.db'), rows=60)
+        overrides = override_settings(VECTOR_DATABASES={'IT': self.db_path}, VECTOR_SEARCH_BACKEND='fallback',
+                                      INGEST_QUEUE_DB=self.path('queue.db'), SEARCH_NODES=[])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.build(depth=10)
+
+    def build(self, depth):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return neighbors.build_neighbor_table(conn, neighbors=depth)
+        finally:
+            conn.close()
+
+    def query(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def test_rebuild_replaces_table_whole(self):
+        self.build(depth=3)
+        self.assertEqual(self.query("SELECT MIN(n), MAX(n) FROM (SELECT COUNT(*) AS n FROM neighbor_tbl GROUP BY source_id)"),
+                         [(3, 3)])
+        self.assertEqual(self.query("SELECT name FROM sqlite_master WHERE name = 'neighbor_tbl_new'"), [])
+
+    def test_short_list_searches_live(self):
+        manager = get_search_manager()
+        self.assertEqual(manager.more_like_this('IT', 5, limit=10).backend, 'neighbor_table')
+        self.assertEqual(manager.more_like_this('IT', 5, limit=20).backend, 'fallback')
+
+    def test_ingest_invalidates_rewritten_documents(self):
+        pointing_at_5 = self.query("SELECT source_id FROM neighbor_tbl WHERE neighbor_id = 5")[0][0]
+        ingest_queue.enqueue('IT', [dict({field: 'x' for field in corpus.DOCUMENT_COLUMNS},
+                                         id=5, source_text='rewritten document')])
+        with mock.patch('similarity_search_app.vector_utils.VectorSearchManager.encode_texts',
+                        side_effect=fake_encode):
+            call_command('ingest_worker', once=True, stdout=io.StringIO())
+
+        self.assertEqual(self.query("SELECT COUNT(*) FROM neighbor_tbl WHERE source_id = 5 OR neighbor_id = 5"),
+                         [(0,)])
+        manager = get_search_manager()
+        for source_id in (5, pointing_at_5):
+            results = manager.more_like_this('IT', source_id, limit=10)
+            self.assertEqual(results.backend, 'fallback')
+            self.assertEqual(len(results), 10)
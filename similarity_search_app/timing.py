@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class StageTimer:
+    """Accumulates wall-clock seconds per named search stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        return sum(self.stages.values())
+
+
+class NullTimer:
+    """Timer used when no caller is interested in stage timings"""
+
+    stages = {}
+
+    def stage(self, name):
+        return nullcontext()
+
+    def total(self):
+        return 0.0
+
+
+NULL_TIMER = NullTimer()
+
+
+class Deadline:
+    """Point in time by which a request should have its answer"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, floor=0.0):
+        """Seconds a step may still wait, never less than floor (a grace period once expired)"""
+        return max(self.remaining(), floor)
+
+
+class NoDeadline:
+    """Deadline used when the caller set no time budget"""
+
+    expires_at = float('inf')
+
+    def remaining(self):
+        return float('inf')
+
+    def expired(self):
+        return False
+
+    def timeout(self, floor=0.0):
+        return float('inf')
+
+
+NO_DEADLINE = NoDeadline()
@@ -10,4 +10,13 @@ urlpatterns = [
     path('signout/', views.signout, name='signout'),
     path('search/', views.search_ajax, name='search_ajax'),
     path('source-detail/', views.source_detail, name='source_detail'),
+    path('search/stream/', views.search_stream, name='search_stream'),
+    path('search/batch/', views.batch_search, name='batch_search'),
+    path('node/search/', views.node_search, name='node_search'),
+    path('node/source/', views.node_source, name='node_source'),
+    path('similar/', views.similar_ajax, name='similar_ajax'),
+    path('ingest/', views.ingest, name='ingest'),
+    path('ingest/status/', views.ingest_status, name='ingest_status'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('profiles/', views.profiles, name='profiles'),
 ]
\ No newline at end of file
@@ -1,14 +1,95 @@
 import sqlite3
+import heapq
 import json
+import logging
 import os
-from sentence_transformers import SentenceTransformer
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 from django.conf import settings
+from . import admission, backends, coordinator, generations, neighbors, reduction, sharding
+from .memory_index import MemoryIndexRegistry, ReducedMatrixCache
+from .embedding_service import EmbeddingClient, EmbeddingServiceError
+from .metrics import registry as metrics
+from .results import SearchResults
+from .timing import NO_DEADLINE, NULL_TIMER
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on query x row similarity scores held at once by batch search
+BATCH_SCORE_ELEMENTS = 32 * 1024 * 1024
+
+# Rows the fallback scan reads between deadline checks
+DEADLINE_CHECK_ROWS = 1024
+
+# Weight of the newest sample in the per-file latency estimates
+LATENCY_SMOOTHING = 0.2
+
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+def get_search_manager():
+    """Return the process-wide VectorSearchManager, creating it on first use"""
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_manager_lock:
+            if _shared_manager is None:
+                _shared_manager = VectorSearchManager()
+    return _shared_manager
+
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def load_embedding_model():
+    """Import sentence-transformers (and with it torch) and load the model
+
+    Kept out of module scope so that importing this module, and therefore
+    views.py, does not pull in torch for migrate, check or auth-only pages.
+    """
+    from sentence_transformers import SentenceTransformer
+    threads = getattr(settings, 'EMBEDDING_TORCH_THREADS', None)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(MODEL_NAME)
 
 
 class VectorSearchManager:
     def __init__(self):
-        self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self._model = None
+        self._model_lock = threading.Lock()
         self.sqlite_vec_available = self._check_sqlite_vec_availability()
+        self._embedding_cache = OrderedDict()
+        self._embedding_cache_size = getattr(settings, 'VECTOR_SEARCH_EMBEDDING_CACHE_SIZE', 1024)
+        self._embedding_cache_lock = threading.Lock()
+        self._service_client = None
+        self._service_retry_at = 0.0
+        self._backends = {}
+        # (db_path, backend) -> smoothed seconds per search, used to plan around deadlines
+        self._latency = {}
+        # Indexes load on first use by the memory backend
+        self.memory_indexes = MemoryIndexRegistry(
+            refresh_seconds=getattr(settings, 'VECTOR_SEARCH_MEMORY_REFRESH_SECONDS', 5.0)
+        )
+        # two_stage keeps reduced vectors between queries
+        self.reduced_matrices = ReducedMatrixCache()
+        socket_path = getattr(settings, 'EMBEDDING_SERVICE_SOCKET', None)
+        if socket_path:
+            self._service_client = EmbeddingClient(
+                socket_path, timeout=getattr(settings, 'EMBEDDING_SERVICE_TIMEOUT', 2.0)
+            )
+
+    @property
+    def model(self):
+        """SentenceTransformer model, loaded on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = load_embedding_model()
+        return self._model
 
     def _check_sqlite_vec_availability(self):
         """Check if sqlite-vec extension is available"""
@@ -24,134 +105,473 @@ class VectorSearchManager:
                     conn.close()
                     return True
                 except Exception as ex_in:
-                    print("Failed to load extension: ", ext_name)
-                    print(ex_in)
+                    logger.debug("Failed to load extension %s: %s", ext_name, ex_in)
                     continue
 
             conn.close()
             return False
         except Exception as ex_out:
-            print("Failed here with following error: ")
-            print(ex_out)
+            logger.warning("Could not probe for sqlite-vec: %s", ex_out)
             return False
 
-    def get_embedding(self, text):
+    def get_embedding(self, text, deadline=NO_DEADLINE):
         """Generate embedding for given text"""
-        embedding = self.model.encode(text)
-        return embedding.tolist()
+        return self.get_embeddings([text], deadline=deadline)[0]
+
+    def get_embeddings(self, texts, deadline=NO_DEADLINE):
+        """Embeddings for several texts, encoding all cache misses in one batch"""
+        embeddings = [None] * len(texts)
+        misses = {}
+        with self._embedding_cache_lock:
+            for index, text in enumerate(texts):
+                embedding = self._embedding_cache.get(text)
+                if embedding is not None:
+                    self._embedding_cache.move_to_end(text)
+                    embeddings[index] = embedding
+                else:
+                    misses.setdefault(text, []).append(index)
+
+        hits = len(texts) - sum(len(indexes) for indexes in misses.values())
+        if hits:
+            metrics.inc('embedding_cache_hits_total', hits)
+        if not misses:
+            return embeddings
 
-    def similarity_search(self, source_type, query_text, limit=25):
+        metrics.inc('embedding_cache_misses_total', len(misses))
+        encoded = self.encode_texts(list(misses), deadline=deadline)
+
+        with self._embedding_cache_lock:
+            for (text, indexes), embedding in zip(misses.items(), encoded):
+                for index in indexes:
+                    embeddings[index] = embedding
+                if self._embedding_cache_size > 0:
+                    self._embedding_cache[text] = embedding
+            while len(self._embedding_cache) > self._embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+        return embeddings
+
+    def encode_texts(self, texts, deadline=NO_DEADLINE):
+        """Encode a batch of texts, preferring the shared embedding service when configured
+
+        Runs under the 'encode' admission gate, queueing no longer than the
+        deadline allows, and raises admission.Overloaded when the gate turns
+        it away.
+        """
+        with admission.gate('encode').slot(deadline=deadline):
+            return self._encode_texts(list(texts))
+
+    def _encode_texts(self, texts):
+        if self._service_client is not None and time.monotonic() >= self._service_retry_at:
+            try:
+                return self._service_client.encode(texts).tolist()
+            except EmbeddingServiceError as ex:
+                # Back off so an absent service does not cost a timeout per request
+                self._service_retry_at = time.monotonic() + getattr(
+                    settings, 'EMBEDDING_SERVICE_RETRY_SECONDS', 30
+                )
+                logger.warning("Embedding service unavailable, encoding in-process: %s", ex)
+                metrics.inc('search_fallback_total', reason='embedding_service')
+
+        return self.model.encode(texts).tolist()
+
+    def similarity_search(self, source_type, query_text, limit=25, timer=NULL_TIMER, deadline=NO_DEADLINE):
         """Perform similarity search using sqlite-vec or fallback"""
-        db_path = settings.VECTOR_DATABASES[source_type]
+        remote = coordinator.is_remote(source_type)
 
-        if not os.path.exists(db_path):
+        if not remote and not any(os.path.exists(path) for path in sharding.shard_paths(source_type)):
             return []
 
         # Generate embedding for query text
-        query_embedding = self.get_embedding(query_text)
+        with timer.stage('encode'):
+            query_embedding = self.get_embedding(query_text, deadline=deadline)
+
+        # Encoding used up the budget: answer now rather than overrun it
+        if deadline.expired():
+            metrics.inc('search_degraded_total', reason='deadline_encode')
+            return SearchResults([], backend='none', partial=True, failed=[source_type])
+        return self.search_source(source_type, query_embedding, limit, timer=timer, deadline=deadline)
+
+    def search_source(self, source_type, query_embedding, limit=25, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        """Search a source with an embedding, on remote nodes when SEARCH_NODES lists it"""
+        if coordinator.is_remote(source_type):
+            with timer.stage('scan'):
+                results = coordinator.scatter_search(source_type, query_embedding, limit, deadline=deadline)
+            metrics.inc('search_backend_total', backend='remote')
+            return results
+        return self.search_local(source_type, query_embedding, limit, timer=timer, deadline=deadline)
+
+    def search_local(self, source_type, query_embedding, limit=25, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        """Search every local shard of a source with an embedding, merging the top-k"""
+        paths = sharding.shard_paths(source_type)
+        backend = generations.source_config(source_type)['backend']
+        if len(paths) == 1:
+            if not os.path.exists(paths[0]):
+                return SearchResults()
+            return self.search_by_embedding(
+                paths[0], query_embedding, limit, timer=timer, backend=backend, deadline=deadline
+            )
+
+        # Shards are scanned concurrently, so only the wall time is recorded
+        with timer.stage('scan'):
+            results = sharding.parallel_search(paths, query_embedding, limit, backend=backend, deadline=deadline)
+        metrics.inc('search_backend_total', backend='sharded')
+        return results
+
+    def backend(self, name):
+        """Backend instance by name (see backends.backend_classes)"""
+        instance = self._backends.get(name)
+        if instance is None:
+            classes = backends.backend_classes()
+            if name not in classes:
+                raise ValueError(f'Unknown search backend {name}')
+            instance = self._backends[name] = classes[name](self)
+        return instance
+
+    def search_by_embedding(self, db_path, query_embedding, limit=25, timer=NULL_TIMER, backend=None,
+                            deadline=NO_DEADLINE):
+        """Search a vector database with an already computed embedding
+
+        `backend` names the engine ('auto' or None for VECTOR_SEARCH_BACKEND);
+        the results record the one that actually served them. When the
+        engine is expected to overrun `deadline`, a cheaper one is used
+        instead (see _plan_for_deadline).
+        """
+        name = backend or getattr(settings, 'VECTOR_SEARCH_BACKEND', 'auto')
+        if name != 'auto' and not self.backend(name).available(db_path):
+            metrics.inc('search_fallback_total', reason=f'{name}_unavailable')
+            name = 'auto'
+        if name == 'auto':
+            name = backends.choose_backend(self, db_path)
 
-        if self.sqlite_vec_available:
-            return self._sqlite_vec_search(db_path, query_embedding, limit)
+        with admission.gate('scan').slot(timer, deadline):
+            name, rerank_depth, degraded = self._plan_for_deadline(db_path, name, limit, deadline)
+            started = time.perf_counter()
+            if rerank_depth is not None:
+                results = self.two_stage_search(db_path, query_embedding, limit, rerank_depth=rerank_depth, timer=timer)
+            else:
+                results = self.backend(name).search(db_path, query_embedding, limit, timer=timer, deadline=deadline)
+            if results is None:
+                # two_stage found no projection after all
+                metrics.inc('search_fallback_total', reason='no_projection')
+                name, rerank_depth, degraded = 'sqlite_vec' if self.sqlite_vec_available else 'fallback', None, None
+                started = time.perf_counter()
+                results = self.backend(name).search(db_path, query_embedding, limit, timer=timer, deadline=deadline)
+
+        if not isinstance(results, SearchResults):
+            results = SearchResults(results, backend=name)
+        if rerank_depth is None and not results.partial:
+            self._record_latency(db_path, name, time.perf_counter() - started)
+        if degraded:
+            metrics.inc('search_degraded_total', reason=degraded)
+            results.approximate = True
+        return results
+
+    def _plan_for_deadline(self, db_path, name, limit, deadline):
+        """Backend, rerank depth override and degradation reason for a search due by deadline
+
+        Cheaper modes are tried most accurate first: the in-memory index when
+        it is already loaded (still exact), two_stage, then two_stage reranking
+        only `limit` candidates. Without a projection the chosen backend runs
+        as is; the fallback scan then stops at the deadline with what it has.
+        """
+        remaining = deadline.remaining()
+        if self._fits(db_path, name, remaining):
+            return name, None, None
+
+        loaded = self.memory_indexes.peek(db_path) is not None
+        if name != 'memory' and loaded and self._fits(db_path, 'memory', remaining):
+            return 'memory', None, None
+        if backends.database_profile(db_path)['has_projection']:
+            if name != 'two_stage' and self._fits(db_path, 'two_stage', remaining):
+                return 'two_stage', None, 'two_stage'
+            return 'two_stage', limit, 'no_rerank'
+        return name, None, None
+
+    def _fits(self, db_path, name, remaining):
+        """Whether a backend's recent latency on db_path fits in remaining seconds (unknown counts as fitting)"""
+        estimate = self._latency.get((db_path, name))
+        return estimate is None or estimate <= remaining
+
+    def _record_latency(self, db_path, name, seconds):
+        previous = self._latency.get((db_path, name))
+        self._latency[(db_path, name)] = seconds if previous is None else (
+            previous + LATENCY_SMOOTHING * (seconds - previous)
+        )
+
+    def batch_similarity_search(self, source_type, queries, limit=25, timer=NULL_TIMER):
+        """Top-k results for many queries against one source
+
+        Queries are encoded in one batch and scored against the corpus with a
+        single matrix-matrix product; rows are then fetched in one lookup.
+        Returns one result list per query, in order.
+        """
+        if coordinator.is_remote(source_type):
+            with timer.stage('encode'):
+                embeddings = self.get_embeddings(list(queries))
+            return [self.search_source(source_type, embedding, limit, timer=timer) for embedding in embeddings]
+
+        paths = [path for path in sharding.shard_paths(source_type) if os.path.exists(path)]
+
+        if not paths or not queries:
+            return [[] for _ in queries]
+
+        with timer.stage('encode'):
+            query_matrix = np.asarray(self.get_embeddings(list(queries)), dtype=np.float32)
+
+        # One pass per shard, then merge each query's candidates
+        per_shard = [self._batch_search_file(path, query_matrix, limit, timer) for path in paths]
+        if len(per_shard) == 1:
+            results = per_shard[0]
+        else:
+            with timer.stage('rank'):
+                results = [
+                    heapq.nsmallest(limit, (hit for shard in shards for hit in shard),
+                                    key=lambda hit: hit['distance'])
+                    for shards in zip(*per_shard)
+                ]
+        metrics.inc('search_backend_total', len(queries), backend='batch_matrix')
+        return results
+
+    def _batch_search_file(self, db_path, query_matrix, limit, timer=NULL_TIMER):
+        """Top-k per query row of query_matrix within one database file"""
+        with admission.gate('scan').slot(timer):
+            return self._batch_search_file_locked(db_path, query_matrix, limit, timer)
+
+    def _batch_search_file_locked(self, db_path, query_matrix, limit, timer):
+        with timer.stage('connect'):
+            conn = sqlite3.connect(db_path)
+        try:
+            with timer.stage('scan'):
+                # Reuse the in-memory matrix when the file already has one
+                index = self.memory_indexes.peek(db_path)
+                if index is not None:
+                    ids, matrix = index.snapshot.ids, index.snapshot.matrix
+                else:
+                    ids, matrix = reduction.load_full_matrix(conn)
+            if len(ids) == 0:
+                return [[] for _ in query_matrix]
+
+            with timer.stage('rank'):
+                # Score in chunks of queries so the similarity block stays bounded
+                chunk = max(1, BATCH_SCORE_ELEMENTS // len(ids))
+                ranked = []
+                for start in range(0, len(query_matrix), chunk):
+                    similarities = reduction.cosine_scores_many(matrix, query_matrix[start:start + chunk])
+                    ranked.extend(
+                        [(int(ids[i]), 1 - float(row[i])) for i in reduction.top_k(row, limit)]
+                        for row in similarities
+                    )
+
+            all_ids = sorted({source_id for scored in ranked for source_id, _ in scored})
+            with timer.stage('scan'):
+                rows = self._fetch_source_rows(conn, all_ids)
+        finally:
+            conn.close()
+
+        with timer.stage('format'):
+            return [
+                [dict(rows[source_id], distance=distance) for source_id, distance in scored if source_id in rows]
+                for scored in ranked
+            ]
+
+    def load_source(self, source_type, source_id, with_embedding=False, timer=NULL_TIMER):
+        """{'source_detail', 'embedding'} of a stored document, or None if there is no such document
+
+        Sources served by remote nodes are fetched from the node holding the
+        document (raising coordinator.NodeError if that cannot be told);
+        'embedding' is None unless with_embedding is set.
+        """
+        if coordinator.is_remote(source_type):
+            with timer.stage('scan'):
+                return coordinator.fetch_source(source_type, source_id, with_embedding=with_embedding)
+        return self.load_local_source(source_type, source_id, with_embedding=with_embedding, timer=timer)
+
+    def load_local_source(self, source_type, source_id, with_embedding=False, timer=NULL_TIMER):
+        """load_source against this process's own database files"""
+        db_path = sharding.path_for_id(source_type, source_id)
+        if not os.path.exists(db_path):
+            return None
+
+        with timer.stage('connect'):
+            conn = generations.connect_readonly(db_path)
+        try:
+            with timer.stage('scan'):
+                cursor = conn.execute("SELECT * FROM source_tbl WHERE id = ?", (source_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                detail = dict(zip([column[0] for column in cursor.description], row))
+                embedding = neighbors.load_embedding(conn, source_id) if with_embedding else None
+        finally:
+            conn.close()
+        return {'source_detail': detail, 'embedding': embedding}
+
+    def more_like_this(self, source_type, source_id, limit=25, timer=NULL_TIMER):
+        """Documents similar to source_id, reusing its stored embedding (no model inference)
+
+        Served from neighbor_tbl when it holds a full list for the document,
+        otherwise by searching with the stored embedding. Returns None if the document has no embedding.
+        Sharded and remote sources always search, since a shard's neighbor_tbl
+        only covers that shard.
+        """
+        if coordinator.is_remote(source_type):
+            record = self.load_source(source_type, source_id, with_embedding=True, timer=timer)
+            query_embedding = record['embedding'] if record else None
         else:
-            return self._fallback_similarity_search(db_path, query_embedding, limit)
+            db_path = sharding.path_for_id(source_type, source_id)
+            if not os.path.exists(db_path):
+                return None
 
-    def _sqlite_vec_search(self, db_path, query_embedding, limit):
+            with timer.stage('connect'):
+                conn = generations.connect_readonly(db_path)
+            try:
+                precomputed = None
+                if not sharding.is_sharded(source_type):
+                    with timer.stage('scan'):
+                        precomputed = neighbors.load_neighbors(conn, source_id, limit)
+                if precomputed is not None:
+                    metrics.inc('search_backend_total', backend='neighbor_table')
+                    return SearchResults(self._materialize(
+                        conn, [(neighbor_id, 1 - similarity) for neighbor_id, similarity in precomputed], timer
+                    ), backend='neighbor_table')
+                with timer.stage('scan'):
+                    query_embedding = neighbors.load_embedding(conn, source_id)
+            finally:
+                conn.close()
+
+        if query_embedding is None:
+            return None
+
+        # Ask for one extra result since the document itself will match
+        results = self.search_source(source_type, query_embedding, limit + 1, timer=timer)
+        return SearchResults(
+            [result for result in results if result['id'] != source_id][:limit],
+            backend=results.backend, partial=results.partial, failed=results.failed
+        )
+
+    def _sqlite_vec_search(self, db_path, query_embedding, limit, timer=NULL_TIMER):
         """Perform search using sqlite-vec extension"""
-        conn = sqlite3.connect(db_path)
+        with timer.stage('connect'):
+            conn = sqlite3.connect(db_path)
 
         try:
-            print("\n Printing before loading sqlite-vec extension ===================== ")
-            conn.enable_load_extension(True)
-            conn.load_extension("vec0")
-            print("\n Printing after loading sqlite-vec extension ===================== \n ")
+            with timer.stage('connect'):
+                conn.enable_load_extension(True)
+                conn.load_extension("vec0")
             cursor = conn.cursor()
 
-            # Perform vector similarity search using sqlite-vec
+            # Score only (id, vector); display columns are fetched for the top-k afterwards
             query = """
-            SELECT 
-                s.id,
-                s.source_text,
-                s.category,
-                s.created_date,
-                s.author,
-                e.metadata,
-                vec_distance_cosine(e.embedding_vect, ?) as distance
-            FROM source_tbl s
-            JOIN embedding_tbl e ON s.id = e.source_id
+            SELECT
+                source_id,
+                vec_distance_cosine(embedding_vect, ?) as distance
+            FROM embedding_tbl
             ORDER BY distance ASC
             LIMIT ?
             """
 
-            cursor.execute(query, (json.dumps(query_embedding), limit))
-            results = cursor.fetchall()
-
-            formatted_results = []
-            for row in results:
-                formatted_results.append({
-                    'id': row[0],
-                    'source_text': row[1],
-                    'category': row[2],
-                    'created_date': row[3],
-                    'author': row[4],
-                    'metadata': json.loads(row[5]) if row[5] else {},
-                    'distance': row[6]
-                })
+            # Distances are computed and sorted inside SQLite, so the scan
+            # stage covers scoring as well
+            with timer.stage('scan'):
+                cursor.execute(query, (json.dumps(query_embedding), limit))
+                scored = cursor.fetchall()
 
+            formatted_results = self._materialize(conn, scored, timer)
             conn.close()
+            metrics.inc('search_backend_total', backend='sqlite_vec')
             return formatted_results
 
         except Exception as ex:
-            print("Printing value of ex: ")
-            print(ex)
-            print("\n Printing failed to load sqlite-vec extension ===================== \n ")
+            logger.warning("sqlite-vec search failed, falling back: %s", ex)
+            metrics.inc('search_fallback_total', reason='sqlite_vec_error')
             conn.close()
             # Fall back to manual calculation if sqlite-vec fails
-            return self._fallback_similarity_search(db_path, query_embedding, limit)
+            return SearchResults(
+                self._fallback_similarity_search(db_path, query_embedding, limit, timer=timer), backend='fallback'
+            )
 
-    def _fallback_similarity_search(self, db_path, query_embedding, limit):
-        """Fallback similarity search without sqlite-vec"""
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+    def _fallback_similarity_search(self, db_path, query_embedding, limit, timer=NULL_TIMER, deadline=NO_DEADLINE):
+        """Fallback similarity search without sqlite-vec
 
-        # Get all embeddings
-        cursor.execute("""
-            SELECT 
-                s.id,
-                s.source_text,
-                s.category,
-                s.created_date,
-                s.author,
-                e.embedding_vect,
-                e.metadata
-            FROM source_tbl s
-            JOIN embedding_tbl e ON s.id = e.source_id
-        """)
+        Rows are read in chunks; if the deadline passes mid-scan the best
+        matches among the rows read so far are returned, flagged partial.
+        """
+        with timer.stage('connect'):
+            conn = sqlite3.connect(db_path)
 
-        results = cursor.fetchall()
-        conn.close()
+        cut_short = False
+        try:
+            # Get embeddings (ids and vectors only) a chunk at a time
+            with timer.stage('scan'):
+                cursor = conn.cursor()
+                cursor.execute("SELECT source_id, embedding_vect FROM embedding_tbl")
 
-        # Calculate cosine similarity manually
-        similarities = []
-        for row in results:
-            try:
-                stored_embedding = json.loads(row[5])
-                similarity = self._cosine_similarity(query_embedding, stored_embedding)
-                similarities.append({
-                    'id': row[0],
-                    'source_text': row[1],
-                    'category': row[2],
-                    'created_date': row[3],
-                    'author': row[4],
-                    'metadata': json.loads(row[6]) if row[6] else {},
-                    'distance': 1 - similarity  # Convert similarity to distance
-                })
-            except (json.JSONDecodeError, TypeError) as e:
-                # Skip invalid embeddings
-                continue
-
-        # Sort by distance and return top results
-        similarities.sort(key=lambda x: x['distance'])
-        return similarities[:limit]
+            similarities = []
+            while True:
+                with timer.stage('scan'):
+                    results = cursor.fetchmany(DEADLINE_CHECK_ROWS)
+                if not results:
+                    break
+
+                # Calculate cosine similarity manually
+                with timer.stage('rank'):
+                    for source_id, embedding_vect in results:
+                        try:
+                            stored_embedding = json.loads(embedding_vect)
+                            similarity = self._cosine_similarity(query_embedding, stored_embedding)
+                            similarities.append((source_id, 1 - similarity))  # Convert similarity to distance
+                        except (json.JSONDecodeError, TypeError) as e:
+                            # Skip invalid embeddings
+                            continue
+                    # Keep only the top results rather than sorting every row
+                    similarities = heapq.nsmallest(limit, similarities, key=lambda x: x[1])
+
+                if deadline.expired():
+                    cut_short = True
+                    break
+
+            formatted_results = self._materialize(conn, similarities, timer)
+        finally:
+            conn.close()
+
+        metrics.inc('search_backend_total', backend='fallback')
+        if cut_short:
+            metrics.inc('search_degraded_total', reason='deadline_scan')
+            return SearchResults(formatted_results, backend='fallback', partial=True,
+                                 failed=[os.path.basename(db_path)])
+        return formatted_results
+
+    def _memory_search(self, db_path, query_embedding, limit, timer=NULL_TIMER):
+        """Exact search over the in-memory index of db_path (refreshed in the background)"""
+        with timer.stage('scan'):
+            index = self.memory_indexes.get(db_path)
+        with timer.stage('rank'):
+            scored = index.search(query_embedding, limit)
+
+        with timer.stage('connect'):
+            conn = sqlite3.connect(db_path)
+        try:
+            formatted_results = self._materialize(conn, scored, timer)
+        finally:
+            conn.close()
+
+        metrics.inc('search_backend_total', backend='memory')
+        return formatted_results
+
+    def _materialize(self, conn, scored, timer=NULL_TIMER):
+        """Turn ranked (source_id, distance) pairs into result dicts with one batched lookup"""
+        with timer.stage('scan'):
+            rows = self._fetch_source_rows(conn, [source_id for source_id, _ in scored])
+
+        with timer.stage('format'):
+            formatted_results = []
+            for source_id, distance in scored:
+                row = rows.get(source_id)
+                if row is None:
+                    # Orphaned embedding with no source row
+                    continue
+                formatted_results.append(dict(row, distance=distance))
+        return formatted_results
 
     def _cosine_similarity(self, vec1, vec2):
         """Calculate cosine similarity between two vectors"""
@@ -167,4 +587,74 @@ class VectorSearchManager:
         if magnitude1 == 0 or magnitude2 == 0:
             return 0
 
-        return dot_product / (magnitude1 * magnitude2)
\ No newline at end of file
+        return dot_product / (magnitude1 * magnitude2)
+
+    def two_stage_search(self, db_path, query_embedding, limit, rerank_depth=None, timer=NULL_TIMER):
+        """Coarse search over PCA-reduced vectors, reranked with full vectors
+
+        Returns None when the database has no trained projection so the
+        caller can fall back to an exact scan.
+        """
+        if rerank_depth is None:
+            rerank_depth = getattr(settings, 'VECTOR_SEARCH_RERANK_DEPTH', 200)
+
+        with timer.stage('connect'):
+            conn = sqlite3.connect(db_path)
+        try:
+            with timer.stage('scan'):
+                projection, reduced = self.reduced_matrices.get(db_path, conn)
+            if projection is None:
+                return None
+
+            ranked = reduction.two_stage_rank(
+                conn, projection, query_embedding, limit, rerank_depth, timer=timer, reduced=reduced
+            )
+            if ranked is None:
+                return None
+
+            results = self._materialize(
+                conn, [(source_id, 1 - similarity) for source_id, similarity in ranked], timer
+            )
+        finally:
+            conn.close()
+
+        metrics.inc('search_backend_total', backend='two_stage')
+        return results
+
+    def _fetch_source_rows(self, conn, source_ids):
+        """Fetch display columns for the given source ids, keyed by id
+
+        The 100-character snippet shown in result lists is computed here,
+        so it is only built for rows that survive ranking.
+        """
+        if not source_ids:
+            return {}
+
+        placeholders = ','.join('?' * len(source_ids))
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT
+                s.id,
+                s.source_text,
+                s.category,
+                s.created_date,
+                s.author,
+                e.metadata
+            FROM source_tbl s
+            JOIN embedding_tbl e ON s.id = e.source_id
+            WHERE s.id IN ({placeholders})
+        """, list(source_ids))
+
+        rows = {}
+        for row in cursor.fetchall():
+            source_text = row[1] or ''
+            rows[row[0]] = {
+                'id': row[0],
+                'source_text': source_text,
+                'snippet': source_text[:100] + '...' if len(source_text) > 100 else source_text,
+                'category': row[2],
+                'created_date': row[3],
+                'author': row[4],
+                'metadata': json.loads(row[5]) if row[5] else {}
+            }
+        return rows
@@ -1,16 +1,37 @@
+import hmac
 import json
-import sqlite3
-import os
+import time
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.core.paginator import Paginator
+from . import admission, caching, coordinator, ingest_queue, query_log
 from .models import CustomUser
-from .vector_utils import VectorSearchManager
+from .metrics import registry as metrics, record_stages, server_timing_header
+from .profiling import get_profile, profile_on_demand, recent_profiles
+from .timing import NO_DEADLINE, Deadline, StageTimer
+from .vector_utils import get_search_manager
+
+
+def _instrumented(response, endpoint, timer, started):
+    """Record request metrics and attach a Server-Timing header"""
+    elapsed = time.perf_counter() - started
+    metrics.inc('search_requests_total', endpoint=endpoint, status=response.status_code)
+    metrics.observe('search_request_seconds', elapsed, endpoint=endpoint)
+    record_stages(timer, endpoint)
+    response['Server-Timing'] = server_timing_header(timer, total=elapsed)
+    return response
+
+
+def _overloaded(error, endpoint, timer, started):
+    """503 with Retry-After for a request turned away by admission control"""
+    response = JsonResponse({'error': str(error)}, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return _instrumented(response, endpoint, timer, started)
 
 
 def signup(request):
@@ -69,91 +90,514 @@ def home(request):
     return render(request, 'home.html')
 
 
+def _format_result(result):
+    """JSON shape of one search hit"""
+    return {
+        'id': result['id'],
+        'source_text': result['snippet'],
+        'distance': round(result['distance'], 4),
+        'metadata': result['metadata']
+    }
+
+
+def _paginate_results(results, page):
+    """Build the paginated JSON payload shared by the search endpoints"""
+    # Paginate results
+    paginator = Paginator(results, 5)  # 5 results per page
+    page_obj = paginator.get_page(page)
+
+    return {
+        'results': [_format_result(result) for result in page_obj],
+        'has_next': page_obj.has_next(),
+        'has_previous': page_obj.has_previous(),
+        'current_page': page_obj.number,
+        'total_pages': paginator.num_pages,
+        'total_results': paginator.count
+    }
+
+
+def _result_flags(results):
+    """Which backend served a search and whether any part of it is missing"""
+    flags = {'backend': getattr(results, 'backend', None)}
+    if getattr(results, 'partial', False):
+        flags.update(partial=True, failed=results.failed)
+    if getattr(results, 'approximate', False):
+        flags['approximate'] = True
+    return flags
+
+
+def _request_deadline(data, default=None):
+    """Deadline from the request's deadline_ms, else default milliseconds (None means no deadline)"""
+    deadline_ms = data.get('deadline_ms', default)
+    if deadline_ms is None:
+        return NO_DEADLINE
+    return Deadline(float(deadline_ms) / 1000)
+
+
 @login_required
 @csrf_exempt
+@profile_on_demand('search')
 def search_ajax(request):
     if request.method == 'POST':
+        started = time.perf_counter()
+        timer = StageTimer()
         try:
             data = json.loads(request.body)
             source_type = data.get('source_type')
-            keyword = data.get('keyword')
+            keyword = query_log.normalise(data.get('keyword') or '')
             page = int(data.get('page', 1))
+            deadline = _request_deadline(data, getattr(settings, 'SEARCH_DEADLINE_MS', None))
 
             if not source_type or not keyword:
-                return JsonResponse({'error': 'Source type and keyword are required'}, status=400)
-
-            # Initialize vector search manager
-            search_manager = VectorSearchManager()
+                return _instrumented(
+                    JsonResponse({'error': 'Source type and keyword are required'}, status=400),
+                    'search', timer, started
+                )
+            # Checked before logging so unknown sources never reach the warm-up log
+            if source_type not in settings.VECTOR_DATABASES:
+                return _instrumented(
+                    JsonResponse({'error': 'Unknown source type'}, status=400), 'search', timer, started
+                )
+
+            # Later pages repeat the first page's query, so only that one is counted;
+            # revalidated queries count too, since their frequency is what warm-up wants
+            log = query_log.get_query_log()
+            if log is not None and page == 1:
+                log.record(source_type, keyword)
+
+            # Answer revalidations before touching the model or the scan
+            etag = caching.search_etag('search', source_type, {'keyword': keyword, 'page': page})
+            if caching.etag_matches(request, etag):
+                return _instrumented(caching.not_modified(etag), 'search', timer, started)
+
+            # Shared vector search manager (model is loaded once per process)
+            search_manager = get_search_manager()
 
             # Perform similarity search
-            results = search_manager.similarity_search(source_type, keyword, limit=25)
-
-            # Paginate results
-            paginator = Paginator(results, 5)  # 5 results per page
-            page_obj = paginator.get_page(page)
-
-            # Format results for JSON response
-            formatted_results = []
-            for result in page_obj:
-                formatted_results.append({
-                    'id': result['id'],
-                    'source_text': result['source_text'][:100] + '...' if len(result['source_text']) > 100 else result[
-                        'source_text'],
-                    'distance': round(result['distance'], 4),
-                    'metadata': result['metadata']
+            results = search_manager.similarity_search(source_type, keyword, limit=25, timer=timer, deadline=deadline)
+
+            with timer.stage('format'):
+                payload = _paginate_results(results, page)
+                payload.update(_result_flags(results))
+                response = JsonResponse(payload)
+            # Incomplete or degraded results must not be revalidated as if they were whole
+            if payload.get('partial') or payload.get('approximate'):
+                return _instrumented(response, 'search', timer, started)
+            etag = caching.still_current(etag, 'search', source_type, {'keyword': keyword, 'page': page})
+            return _instrumented(caching.set_validators(response, etag), 'search', timer, started)
+
+        except admission.Overloaded as e:
+            return _overloaded(e, 'search', timer, started)
+        except Exception as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=500), 'search', timer, started)
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@login_required
+@csrf_exempt
+@profile_on_demand('source_detail')
+def source_detail(request):
+    if request.method == 'POST':
+        started = time.perf_counter()
+        timer = StageTimer()
+        try:
+            data = json.loads(request.body)
+            source_type = data.get('source_type')
+            source_id = data.get('source_id')
+
+            if not source_type or not source_id:
+                return _instrumented(
+                    JsonResponse({'error': 'Source type and ID are required'}, status=400),
+                    'source_detail', timer, started
+                )
+            try:
+                source_id = int(source_id)
+            except (TypeError, ValueError):
+                return _instrumented(
+                    JsonResponse({'error': 'source_id must be an integer'}, status=400), 'source_detail', timer, started
+                )
+
+            etag = caching.search_etag('source_detail', source_type, {'source_id': source_id})
+            if caching.etag_matches(request, etag):
+                return _instrumented(caching.not_modified(etag), 'source_detail', timer, started)
+
+            record = get_search_manager().load_source(source_type, source_id, timer=timer)
+            if record is None:
+                return _instrumented(
+                    JsonResponse({'error': 'Source not found'}, status=404), 'source_detail', timer, started
+                )
+
+            with timer.stage('format'):
+                response = JsonResponse({'source_detail': record['source_detail']})
+            etag = caching.still_current(etag, 'source_detail', source_type, {'source_id': source_id})
+            return _instrumented(caching.set_validators(response, etag), 'source_detail', timer, started)
+
+        except coordinator.NodeError as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=502), 'source_detail', timer, started)
+        except Exception as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=500), 'source_detail', timer, started)
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@login_required
+@csrf_exempt
+def batch_search(request):
+    """Search many queries against one source in a single request"""
+    if request.method == 'POST':
+        started = time.perf_counter()
+        timer = StageTimer()
+        try:
+            data = json.loads(request.body)
+            source_type = data.get('source_type')
+            queries = data.get('queries')
+            limit = int(data.get('limit', 25))
+
+            if source_type not in settings.VECTOR_DATABASES:
+                return _instrumented(
+                    JsonResponse({'error': 'Unknown source type'}, status=400), 'batch_search', timer, started
+                )
+            if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q for q in queries):
+                return _instrumented(
+                    JsonResponse({'error': 'queries must be a non-empty list of strings'}, status=400),
+                    'batch_search', timer, started
+                )
+
+            max_queries = getattr(settings, 'BATCH_SEARCH_MAX_QUERIES', 1000)
+            if len(queries) > max_queries or not 0 < limit <= 100:
+                return _instrumented(
+                    JsonResponse({'error': f'At most {max_queries} queries and a limit of 1-100'}, status=400),
+                    'batch_search', timer, started
+                )
+
+            results = get_search_manager().batch_similarity_search(source_type, queries, limit=limit, timer=timer)
+
+            with timer.stage('format'):
+                response = JsonResponse({
+                    'results': [
+                        {'query': query, 'results': [_format_result(result) for result in hits]}
+                        for query, hits in zip(queries, results)
+                    ]
                 })
+            return _instrumented(response, 'batch_search', timer, started)
+
+        except admission.Overloaded as e:
+            return _overloaded(e, 'batch_search', timer, started)
+        except Exception as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=500), 'batch_search', timer, started)
 
-            return JsonResponse({
-                'results': formatted_results,
-                'has_next': page_obj.has_next(),
-                'has_previous': page_obj.has_previous(),
-                'current_page': page_obj.number,
-                'total_pages': paginator.num_pages,
-                'total_results': paginator.count
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+def _ndjson(record):
+    return json.dumps(record) + '\n'
+
+
+def _stream_search(source_types, keyword, limit, started):
+    """Yield NDJSON lines: a header, then each source's results as soon as they are ranked"""
+    timer = StageTimer()
+    manager = get_search_manager()
+    status = 'ok'
+
+    try:
+        try:
+            with timer.stage('encode'):
+                query_embedding = manager.get_embedding(keyword)
+        except admission.Overloaded as e:
+            status = 'overloaded'
+            yield _ndjson({'type': 'error', 'error': str(e), 'retry_after': e.retry_after})
+            return
+        yield _ndjson({
+            'type': 'header',
+            'keyword': keyword,
+            'source_types': source_types,
+            'limit': limit,
+            'encode_ms': round(timer.stages['encode'] * 1000, 3)
+        })
+
+        for source_type in source_types:
+            source_started = time.perf_counter()
+            try:
+                results = manager.search_source(source_type, query_embedding, limit, timer=timer)
+            except Exception as e:
+                status = 'partial'
+                yield _ndjson({'type': 'error', 'source_type': source_type, 'error': str(e)})
+                continue
+
+            if getattr(results, 'partial', False):
+                status = 'partial'
+            yield _ndjson({
+                'type': 'source',
+                'source_type': source_type,
+                'partial': getattr(results, 'partial', False),
+                'backend': getattr(results, 'backend', None),
+                'count': len(results),
+                'elapsed_ms': round((time.perf_counter() - source_started) * 1000, 3)
             })
+            # One line per hit so large k never builds a single huge payload
+            for rank, result in enumerate(results):
+                yield _ndjson(dict(_format_result(result), type='result', source_type=source_type, rank=rank))
+            del results
+
+        yield _ndjson({
+            'type': 'end',
+            'status': status,
+            'total_ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+    finally:
+        metrics.inc('search_requests_total', endpoint='search_stream', status=status)
+        metrics.observe('search_request_seconds', time.perf_counter() - started, endpoint='search_stream')
+        record_stages(timer, 'search_stream')
+
+
+@login_required
+@csrf_exempt
+def search_stream(request):
+    """Federated search streamed as newline-delimited JSON"""
+    if request.method == 'POST':
+        started = time.perf_counter()
+        try:
+            data = json.loads(request.body)
+            source_types = data.get('source_types') or ([data['source_type']] if data.get('source_type') else [])
+            keyword = data.get('keyword')
+            limit = int(data.get('limit', 25))
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if not source_types or not keyword:
+            return JsonResponse({'error': 'Source types and keyword are required'}, status=400)
+        unknown = [source_type for source_type in source_types if source_type not in settings.VECTOR_DATABASES]
+        if unknown:
+            return JsonResponse({'error': f'Unknown source types: {", ".join(unknown)}'}, status=400)
+        if not 0 < limit <= getattr(settings, 'SEARCH_STREAM_MAX_LIMIT', 10000):
+            return JsonResponse({'error': 'limit out of range'}, status=400)
+
+        response = StreamingHttpResponse(
+            _stream_search(source_types, keyword, limit, started), content_type='application/x-ndjson'
+        )
+        # Stop proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+def _node_authorized(request):
+    """Whether a request carries the SEARCH_NODE_TOKEN shared by coordinator and nodes"""
+    token = getattr(settings, 'SEARCH_NODE_TOKEN', '')
+    return bool(token) and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+@csrf_exempt
+def node_search(request):
+    """Local half of a scatter-gather search, called by a coordinator with a precomputed embedding"""
+    if not _node_authorized(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
 
+    if request.method == 'POST':
+        started = time.perf_counter()
+        timer = StageTimer()
+        try:
+            data = json.loads(request.body)
+            source_type = data.get('source_type')
+            embedding = data.get('embedding')
+            limit = int(data.get('limit', 25))
+            deadline = _request_deadline(data)
+
+            if source_type not in settings.VECTOR_DATABASES:
+                return _instrumented(
+                    JsonResponse({'error': 'Unknown source type'}, status=400), 'node_search', timer, started
+                )
+            if not isinstance(embedding, list) or not embedding:
+                return _instrumented(
+                    JsonResponse({'error': 'embedding must be a non-empty list'}, status=400),
+                    'node_search', timer, started
+                )
+
+            results = get_search_manager().search_local(source_type, embedding, limit, timer=timer, deadline=deadline)
+            with timer.stage('format'):
+                response = JsonResponse(dict({'results': results}, **_result_flags(results)))
+            return _instrumented(response, 'node_search', timer, started)
+
+        except admission.Overloaded as e:
+            return _overloaded(e, 'node_search', timer, started)
         except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
+            return _instrumented(JsonResponse({'error': str(e)}, status=500), 'node_search', timer, started)
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@csrf_exempt
+def node_source(request):
+    """A stored document (and its embedding when asked) from this node's databases, for a coordinator
+
+    Answers 200 with a null source_detail when the document is not here, so
+    the coordinator can tell "not on this node" from a failed node.
+    """
+    if not _node_authorized(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+
+    if request.method == 'POST':
+        started = time.perf_counter()
+        timer = StageTimer()
+        try:
+            data = json.loads(request.body)
+            source_type = data.get('source_type')
+            if source_type not in settings.VECTOR_DATABASES:
+                return _instrumented(
+                    JsonResponse({'error': 'Unknown source type'}, status=400), 'node_source', timer, started
+                )
+            source_id = int(data.get('source_id'))
+
+            record = get_search_manager().load_local_source(
+                source_type, source_id, with_embedding=bool(data.get('embedding')), timer=timer
+            )
+            with timer.stage('format'):
+                response = JsonResponse(record or {'source_detail': None, 'embedding': None})
+            return _instrumented(response, 'node_source', timer, started)
+
+        except (TypeError, ValueError):
+            return _instrumented(
+                JsonResponse({'error': 'source_id must be an integer'}, status=400), 'node_source', timer, started
+            )
+        except Exception as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=500), 'node_source', timer, started)
 
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
 @login_required
 @csrf_exempt
-def source_detail(request):
+def similar_ajax(request):
+    """More-like-this search from a stored document's embedding"""
     if request.method == 'POST':
+        started = time.perf_counter()
+        timer = StageTimer()
         try:
             data = json.loads(request.body)
             source_type = data.get('source_type')
             source_id = data.get('source_id')
+            page = int(data.get('page', 1))
 
             if not source_type or not source_id:
-                return JsonResponse({'error': 'Source type and ID are required'}, status=400)
-
-            # Get source detail from database
-            db_path = settings.VECTOR_DATABASES[source_type]
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("SELECT * FROM source_tbl WHERE id = ?", (source_id,))
-            result = cursor.fetchone()
-            conn.close()
-
-            if result:
-                # Get column names
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("PRAGMA table_info(source_tbl)")
-                columns = [column[1] for column in cursor.fetchall()]
-                conn.close()
-
-                # Create dictionary with column names and values
-                source_detail = dict(zip(columns, result))
-                return JsonResponse({'source_detail': source_detail})
-            else:
-                return JsonResponse({'error': 'Source not found'}, status=404)
+                return _instrumented(
+                    JsonResponse({'error': 'Source type and ID are required'}, status=400),
+                    'similar', timer, started
+                )
+            try:
+                source_id = int(source_id)
+            except (TypeError, ValueError):
+                return _instrumented(
+                    JsonResponse({'error': 'source_id must be an integer'}, status=400), 'similar', timer, started
+                )
+
+            etag = caching.search_etag('similar', source_type, {'source_id': source_id, 'page': page})
+            if caching.etag_matches(request, etag):
+                return _instrumented(caching.not_modified(etag), 'similar', timer, started)
+
+            results = get_search_manager().more_like_this(source_type, source_id, limit=25, timer=timer)
+            if results is None:
+                return _instrumented(
+                    JsonResponse({'error': 'Source not found'}, status=404), 'similar', timer, started
+                )
+
+            with timer.stage('format'):
+                payload = _paginate_results(results, page)
+                payload.update(_result_flags(results))
+                response = JsonResponse(payload)
+            etag = caching.still_current(etag, 'similar', source_type, {'source_id': source_id, 'page': page})
+            return _instrumented(caching.set_validators(response, etag), 'similar', timer, started)
+
+        except admission.Overloaded as e:
+            return _overloaded(e, 'similar', timer, started)
+        except coordinator.NodeError as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=502), 'similar', timer, started)
+        except Exception as e:
+            return _instrumented(JsonResponse({'error': str(e)}, status=500), 'similar', timer, started)
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@login_required
+@csrf_exempt
+def ingest(request):
+    """Queue documents for indexing; the ingest_worker command embeds and stores them"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            source_type = data.get('source_type')
+            documents = data.get('documents')
+
+            if source_type not in settings.VECTOR_DATABASES:
+                return JsonResponse({'error': 'Unknown source type'}, status=400)
+            if not isinstance(documents, list) or not documents:
+                return JsonResponse({'error': 'documents must be a non-empty list'}, status=400)
+
+            max_documents = getattr(settings, 'INGEST_MAX_DOCUMENTS', 1000)
+            if len(documents) > max_documents:
+                return JsonResponse({'error': f'At most {max_documents} documents per request'}, status=400)
+
+            for index, document in enumerate(documents):
+                error = ingest_queue.validate_document(document)
+                if error:
+                    return JsonResponse({'error': f'Document {index}: {error}'}, status=400)
+
+            job_ids = ingest_queue.enqueue(source_type, documents)
+            metrics.inc('ingest_jobs_enqueued_total', len(job_ids), source_type=source_type)
+            return JsonResponse({'job_ids': job_ids}, status=202)
 
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
-    return JsonResponse({'error': 'Invalid request method'}, status=405)
\ No newline at end of file
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@login_required
+def ingest_status(request):
+    """Status of the given jobs (?ids=1,2,3) and overall queue depth"""
+    try:
+        ids = [int(job_id) for job_id in request.GET.get('ids', '').split(',') if job_id.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'ids must be comma-separated integers'}, status=400)
+
+    depth = ingest_queue.queue_depth()
+    for status, count in depth.items():
+        metrics.set_gauge('ingest_queue_jobs', count, status=status)
+
+    return JsonResponse({
+        'jobs': ingest_queue.job_status(ids) if ids else [],
+        'queue_depth': depth
+    })
+
+
+def metrics_view(request):
+    """Expose process metrics in the Prometheus text format
+
+    Scrapers authenticate with the SEARCH_NODE_TOKEN bearer token; signed-in
+    staff may read it too.
+    """
+    if not (_node_authorized(request) or request.user.is_staff):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def profiles(request):
+    """List recent on-demand profiles, or one profile with ?id=<profile id>"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=403)
+
+    profile_id = request.GET.get('id')
+    if profile_id:
+        record = get_profile(int(profile_id)) if profile_id.isdigit() else None
+        if record is None:
+            return JsonResponse({'error': 'Profile not found'}, status=404)
+        return JsonResponse({'profile': record})
+
+    summaries = [
+        {key: value for key, value in record.items() if key != 'top_functions'}
+        for record in recent_profiles()
+    ]
+    return JsonResponse({'profiles': summaries})
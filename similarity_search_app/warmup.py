@@ -0,0 +1,76 @@
+import logging
+import time
+from django.conf import settings
+from . import coordinator, query_log, sharding
+from .vector_utils import get_search_manager
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+def touch_pages(db_path):
+    """Read a database file and its WAL once so their pages sit in the OS page cache; returns bytes read"""
+    total = 0
+    for candidate in (db_path, db_path + '-wal'):
+        try:
+            with open(candidate, 'rb', buffering=0) as handle:
+                while True:
+                    block = handle.read(READ_BLOCK_BYTES)
+                    if not block:
+                        break
+                    total += len(block)
+        except FileNotFoundError:
+            continue
+    return total
+
+
+def warm_up(manager=None, per_source=None, source_types=None):
+    """Get a worker ready for traffic
+
+    Loads the model, reads each local database file through the page cache,
+    then encodes and runs the most frequent logged queries per source, which
+    fills the embedding cache and loads whatever the search backends keep in
+    memory. Returns {source_type: {'encoded', 'searched', 'bytes', 'seconds'}}.
+    """
+    manager = manager or get_search_manager()
+    if per_source is None:
+        per_source = getattr(settings, 'SEARCH_WARMUP_QUERIES', 50)
+    source_types = source_types or list(settings.VECTOR_DATABASES.keys())
+    path = getattr(settings, 'QUERY_LOG_PATH', None)
+    logged = query_log.top_queries(path, per_source) if path and per_source else {}
+
+    started = time.perf_counter()
+    manager.encode_texts(['warm up'])
+    logger.info("Warm-up: model ready in %.2fs", time.perf_counter() - started)
+
+    report = {}
+    for source_type in source_types:
+        source_started = time.perf_counter()
+        remote = coordinator.is_remote(source_type)
+        touched = 0
+        if not remote:
+            touched = sum(touch_pages(db_path) for db_path in sharding.shard_paths(source_type))
+
+        keywords = logged.get(source_type, [])
+        ran = 0
+        if keywords:
+            embeddings = manager.get_embeddings(keywords)
+            # Remote results are not cached here, so encoding is all that helps
+            if not remote:
+                for keyword, embedding in zip(keywords, embeddings):
+                    try:
+                        manager.search_source(source_type, embedding, 25)
+                        ran += 1
+                    except Exception as e:
+                        logger.warning("Warm-up query %r on %s failed: %s", keyword, source_type, e)
+
+        report[source_type] = {
+            'encoded': len(keywords),
+            'searched': ran,
+            'bytes': touched,
+            'seconds': time.perf_counter() - source_started,
+        }
+        logger.info("Warm-up: %s touched %d bytes, ran %d queries in %.2fs",
+                    source_type, touched, ran, report[source_type]['seconds'])
+    return report